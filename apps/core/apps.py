@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class CoreConfig(AppConfig):
     name = "apps.core"
+
+    def ready(self):
+        from apps.core.timing import install_query_timer
+
+        connection_created.connect(install_query_timer, dispatch_uid="core.install_query_timer")
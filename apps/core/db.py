@@ -0,0 +1,47 @@
+import contextlib
+
+from django.db import DEFAULT_DB_ALIAS, connection as default_connection, connections
+from django.db.backends.postgresql.base import ServerBindingCursor
+
+
+def prepared_cursor(connection=None):
+    """
+    Курсор с серверной привязкой параметров для запросов горячего пути с неизменным текстом.
+    psycopg готовит такой запрос на сервере после prepare_threshold выполнений на соединении
+    и дальше передаёт только параметры; с постоянными соединениями или пулом подготовка переживает запрос.
+    Остальные запросы Django идут с привязкой параметров на клиенте.
+    """
+    connection = connection or default_connection
+    connection.close_if_health_check_failed()
+    connection.ensure_connection()
+    connection.validate_thread_sharing()
+    with connection.wrap_database_errors:
+        cursor = ServerBindingCursor(connection.connection)
+
+    return connection.make_debug_cursor(cursor) if connection.queries_logged else connection.make_cursor(cursor)
+
+
+@contextlib.contextmanager
+def advisory_lock(name: str):
+    """
+    Advisory-блокировка по имени на время блока; отдаёт False, если её держит другой процесс.
+    Берётся pg_try_advisory_xact_lock в транзакции отдельного соединения, открытой до конца блока: сессионная
+    pg_advisory_lock за PgBouncer (pool_mode=transaction) осталась бы на чужом серверном соединении.
+    Работа в блоке идёт своими транзакциями на основном соединении.
+    """
+    lock_connection = connections.create_connection(DEFAULT_DB_ALIAS)
+    try:
+        lock_connection.set_autocommit(False)
+        with lock_connection.cursor() as cursor:
+            # Транзакция с блокировкой простаивает всё время работы
+            cursor.execute("SET LOCAL idle_in_transaction_session_timeout = 0")
+            cursor.execute("SELECT pg_try_advisory_xact_lock(hashtextextended(%s, 0))", [name])
+            acquired = cursor.fetchone()[0]
+
+        yield acquired
+    finally:
+        # Откат снимает блокировку; соединение из пула psycopg возвращается в пул без открытой транзакции
+        try:
+            lock_connection.rollback()
+        finally:
+            lock_connection.close()
@@ -0,0 +1,69 @@
+import os
+import time
+from datetime import datetime
+
+from django.http import HttpResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Histogram, generate_latest
+from prometheus_client import multiprocess, start_http_server
+
+# Задано - метрики пишутся в файлы этого каталога (по файлу на процесс) и /metrics собирает их со всех процессов:
+# воркеров gunicorn и процессов prefork Celery. Переменная читается prometheus_client при импорте, каталог должен
+# существовать и быть пустым при старте (entrypoint.sh, gunicorn.conf.py)
+MULTIPROCESS_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+CELERY_QUEUE_LAG = Histogram(
+    "celery_task_queue_lag_seconds",
+    "Время от постановки задачи в очередь (или от её eta) до начала выполнения",
+    ["task"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+
+# Заголовок сообщения Celery со временем постановки в очередь
+ENQUEUED_AT_HEADER = "enqueued_at"
+
+
+def get_registry() -> CollectorRegistry:
+    if not MULTIPROCESS_DIR:
+        return REGISTRY
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_view(request):
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+def mark_process_dead(pid: int) -> None:
+    if MULTIPROCESS_DIR:
+        multiprocess.mark_process_dead(pid)
+
+
+def start_metrics_server(port: int) -> None:
+    """
+    /metrics процесса без Django-представления (главный процесс воркера Celery).
+    """
+    if port:
+        start_http_server(port, registry=get_registry())
+
+
+def stamp_enqueued_at(headers: dict) -> None:
+    # before_task_publish
+    headers.setdefault(ENQUEUED_AT_HEADER, time.time())
+
+
+def observe_queue_lag(task) -> None:
+    # task_prerun. Задача с countdown/eta ждёт в очереди намеренно, задержка считается от eta
+    enqueued_at = getattr(task.request, ENQUEUED_AT_HEADER, None)
+    if enqueued_at is None:
+        return
+
+    eta = task.request.eta
+    if eta:
+        enqueued_at = max(enqueued_at, _timestamp(eta))
+    CELERY_QUEUE_LAG.labels(task.name).observe(max(time.time() - enqueued_at, 0.0))
+
+
+def _timestamp(eta) -> float:
+    return (datetime.fromisoformat(eta) if isinstance(eta, str) else eta).timestamp()
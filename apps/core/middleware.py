@@ -0,0 +1,134 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from apps.core.timing import RequestTimings, finish_request, resume_request, start_request
+
+logger = logging.getLogger("timing")
+
+# Части запроса в заголовке Server-Timing и в полях лога
+SPANS = ("serializer", "service")
+
+
+class ServerTimingMiddleware:
+    """
+    Для каждого запроса: число SQL-запросов, время в БД, самый медленный запрос, время сериализатора и сервиса.
+    Отдаёт их в заголовке Server-Timing и в полях записи лога "timing"; запрос дольше SLOW_REQUEST_THRESHOLD
+    логируется с первыми SLOW_REQUEST_MAX_QUERIES SQL-запросами.
+    У потокового ответа заголовки уходят до тела, поэтому Server-Timing ему не ставится, а запрос логируется
+    при закрытии ответа вместе с запросами, выполненными во время стрима.
+    Должен стоять первым в MIDDLEWARE, чтобы total покрывал остальные middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        token = start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            timings = finish_request(token)
+
+        if response.streaming:
+            return self.stream_timings(request, response, timings)
+
+        self.process_timings(request, response, timings)
+        return response
+
+    async def __acall__(self, request):
+        token = start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timings = finish_request(token)
+
+        if response.streaming:
+            return self.stream_timings(request, response, timings)
+
+        self.process_timings(request, response, timings)
+        return response
+
+    def stream_timings(self, request, response, timings: RequestTimings):
+        # Обёртка закрывается вместе с ответом (response.close() или конец async-итерации)
+        content = response.streaming_content
+        if response.is_async:
+
+            async def timed_content():
+                iterator = aiter(content)
+                try:
+                    while True:
+                        with resume_request(timings):
+                            try:
+                                chunk = await anext(iterator)
+                            except StopAsyncIteration:
+                                return
+                        yield chunk
+                finally:
+                    self.process_timings(request, response, timings)
+
+        else:
+
+            def timed_content():
+                iterator = iter(content)
+                try:
+                    while True:
+                        with resume_request(timings):
+                            try:
+                                chunk = next(iterator)
+                            except StopIteration:
+                                return
+                        yield chunk
+                finally:
+                    self.process_timings(request, response, timings)
+
+        response.streaming_content = timed_content()
+        return response
+
+    def process_timings(self, request, response, timings: RequestTimings):
+        fields = self.timing_fields(timings)
+        if settings.SERVER_TIMING_HEADER and not response.streaming:
+            response["Server-Timing"] = self.server_timing(fields)
+
+        fields = {"method": request.method, "path": request.path, "status": response.status_code, **fields}
+        message = " ".join(f"{name}={value}" for name, value in fields.items())
+        logger.info(message, extra=fields)
+
+        if fields["total_ms"] >= settings.SLOW_REQUEST_THRESHOLD * 1000:
+            statements = "\n".join(f"  {duration * 1000:8.2f} ms  {sql}" for sql, duration in timings.statements)
+            omitted = timings.queries - len(timings.statements)
+            if omitted:
+                statements += f"\n  ... ещё {omitted} запросов"
+            logger.warning(
+                f"Медленный запрос {request.method} {request.path}: {message}\n{statements}",
+                extra={**fields, "slowest_sql": timings.slowest_sql},
+            )
+
+    @staticmethod
+    def timing_fields(timings: RequestTimings) -> dict:
+        return {
+            "total_ms": round(timings.total * 1000, 2),
+            "db_queries": timings.queries,
+            "db_ms": round(timings.db_time * 1000, 2),
+            "db_slowest_ms": round(timings.slowest_time * 1000, 2),
+            **{f"{span}_ms": round(timings.spans.get(span, 0.0) * 1000, 2) for span in SPANS},
+        }
+
+    @staticmethod
+    def server_timing(fields: dict) -> str:
+        metrics = [
+            f'db;dur={fields["db_ms"]};desc="{fields["db_queries"]} queries"',
+            f"db-slowest;dur={fields['db_slowest_ms']}",
+            *(f"{span};dur={fields[f'{span}_ms']}" for span in SPANS),
+            f"total;dur={fields['total_ms']}",
+        ]
+        return ", ".join(metrics)
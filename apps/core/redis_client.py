@@ -0,0 +1,33 @@
+import asyncio
+import functools
+import weakref
+
+import redis
+import redis.asyncio
+from django.conf import settings
+
+_async_clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, redis.asyncio.Redis] = weakref.WeakKeyDictionary()
+
+
+@functools.cache
+def get_redis() -> redis.Redis:
+    # Один пул соединений на процесс. Короткие таймауты: Redis здесь ускоритель, а не источник истины
+    return redis.Redis.from_url(
+        settings.REDIS_URL,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+    )
+
+
+def get_async_redis() -> redis.asyncio.Redis:
+    # Соединения redis.asyncio привязаны к event loop, поэтому пул - один на loop (в ASGI-воркере он один)
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = redis.asyncio.Redis.from_url(
+            settings.REDIS_URL,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        )
+
+    return client
@@ -0,0 +1,116 @@
+import contextlib
+import contextvars
+import dataclasses
+import time
+
+from django.conf import settings
+
+_current: contextvars.ContextVar["RequestTimings | None"] = contextvars.ContextVar("request_timings", default=None)
+
+
+@dataclasses.dataclass
+class RequestTimings:
+    """
+    Время запроса по частям. Живёт в contextvar, поэтому доступно и в потоке sync_to_async под ASGI.
+    """
+
+    started: float = dataclasses.field(default_factory=time.perf_counter)
+    total: float = 0.0
+    queries: int = 0
+    db_time: float = 0.0
+    slowest_sql: str = ""
+    slowest_time: float = 0.0
+    # (sql, длительность) первых SLOW_REQUEST_MAX_QUERIES запросов - для лога медленного запроса
+    statements: list[tuple[str, float]] = dataclasses.field(default_factory=list)
+    spans: dict[str, float] = dataclasses.field(default_factory=dict)
+    _active: set[str] = dataclasses.field(default_factory=set)
+
+    def record_query(self, sql: str, duration: float):
+        self.queries += 1
+        self.db_time += duration
+        if duration > self.slowest_time:
+            self.slowest_sql, self.slowest_time = sql, duration
+        if len(self.statements) < settings.SLOW_REQUEST_MAX_QUERIES:
+            self.statements.append((sql, duration))
+
+
+def start_request() -> contextvars.Token:
+    return _current.set(RequestTimings())
+
+
+def finish_request(token: contextvars.Token) -> RequestTimings:
+    timings = _current.get()
+    _current.reset(token)
+    timings.total = time.perf_counter() - timings.started
+    return timings
+
+
+@contextlib.contextmanager
+def resume_request(timings: RequestTimings):
+    """
+    Снова делает timings текущими на время блока: тело потокового ответа читается уже после выхода из middleware.
+    """
+    token = _current.set(timings)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+        timings.total = time.perf_counter() - timings.started
+
+
+def current_timings() -> RequestTimings | None:
+    return _current.get()
+
+
+@contextlib.contextmanager
+def timed(span: str):
+    """
+    Добавляет время блока к части span текущего запроса. Вложенные блоки той же части не считаются повторно.
+    """
+    timings = _current.get()
+    if timings is None or span in timings._active:
+        yield
+        return
+
+    timings._active.add(span)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.spans[span] = timings.spans.get(span, 0.0) + time.perf_counter() - started
+        timings._active.discard(span)
+
+
+def record_query(execute, sql, params, many, context):
+    # execute_wrapper каждого соединения: вне запроса (Celery, команды) только проверка contextvar
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.record_query(sql, time.perf_counter() - started)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """
+    Обработчик connection_created. Обёртка ставится первой: connection.execute_wrapper() снимает последнюю.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class TimedSerializerMixin:
+    """
+    Валидация и представление сериализатора входят в часть "serializer" запроса.
+    """
+
+    def is_valid(self, *, raise_exception=False):
+        with timed("serializer"):
+            return super().is_valid(raise_exception=raise_exception)
+
+    def to_representation(self, instance):
+        with timed("serializer"):
+            return super().to_representation(instance)
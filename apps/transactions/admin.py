@@ -1,12 +1,25 @@
 from django.contrib import admin
 from django.forms import BaseInlineFormSet
 
-from apps.transactions.models import Transaction, Transfer, WalletBalance, Wallet
+from apps.transactions.models import (
+    Transaction,
+    Transfer,
+    WalletBalance,
+    Wallet,
+    FeeShard,
+    LedgerTotal,
+    ReconciliationRun,
+    ReconciliationDiscrepancy,
+    WalletBalanceSnapshot,
+    ArchiveSegment,
+    NotificationDeadLetter,
+    OutboxEvent,
+)
 
 
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
-    list_display = ("id", "wallet", "transfer", "flow", "created_at")
+    list_display = ("id", "wallet", "transfer", "flow", "amount", "balance_after", "created_at")
     search_fields = ("id",)
     autocomplete_fields = ("wallet", "transfer")
     ordering = ("-created_at",)
@@ -83,3 +96,101 @@ class WalletAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         return super().get_queryset(request).select_related("walletbalance")
+
+
+@admin.register(FeeShard)
+class FeeShardAdmin(admin.ModelAdmin):
+    list_display = ("shard", "balance", "updated_at")
+    ordering = ("shard",)
+
+    def has_change_permission(self, request, obj=...):
+        return False
+
+
+@admin.register(LedgerTotal)
+class LedgerTotalAdmin(admin.ModelAdmin):
+    list_display = ("wallet", "total", "through")
+    search_fields = ("wallet__id",)
+    ordering = ("wallet",)
+
+    def has_change_permission(self, request, obj=...):
+        return False
+
+
+class ReconciliationDiscrepancyInline(admin.TabularInline):
+    model = ReconciliationDiscrepancy
+    can_delete = False
+    extra = 0
+    fields = ("wallet", "balance", "expected")
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=...):
+        return False
+
+
+@admin.register(ReconciliationRun)
+class ReconciliationRunAdmin(admin.ModelAdmin):
+    inlines = [ReconciliationDiscrepancyInline]
+    list_display = (
+        "created_at",
+        "status",
+        "cutoff",
+        "wallets_checked",
+        "transactions_processed",
+        "discrepancies_found",
+    )
+    list_filter = ("status",)
+    ordering = ("-created_at",)
+
+    def has_change_permission(self, request, obj=...):
+        return False
+
+
+@admin.register(WalletBalanceSnapshot)
+class WalletBalanceSnapshotAdmin(admin.ModelAdmin):
+    list_display = ("wallet", "day", "balance")
+    search_fields = ("wallet__id",)
+    list_filter = ("day",)
+    ordering = ("-day",)
+
+    def has_change_permission(self, request, obj=...):
+        return False
+
+
+@admin.register(ArchiveSegment)
+class ArchiveSegmentAdmin(admin.ModelAdmin):
+    list_display = ("name", "period_start", "period_end", "transactions", "transfers", "size")
+    ordering = ("-period_start",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=...):
+        return False
+
+    def has_delete_permission(self, request, obj=...):
+        # Запись без файлов сегмента - потерянные проводки
+        return False
+
+
+@admin.register(NotificationDeadLetter)
+class NotificationDeadLetterAdmin(admin.ModelAdmin):
+    list_display = ("key", "attempts", "error", "created_at")
+    search_fields = ("key",)
+    ordering = ("-created_at",)
+
+    def has_change_permission(self, request, obj=...):
+        return False
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ("kind", "transfer_id", "created_at")
+    list_filter = ("kind",)
+    ordering = ("created_at",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=...):
+        return False
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class TransactionsConfig(AppConfig):
     name = "apps.transactions"
+
+    def ready(self):
+        from apps.transactions import signals  # noqa: F401
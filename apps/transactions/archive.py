@@ -0,0 +1,370 @@
+import bisect
+import dataclasses
+import datetime
+import functools
+import itertools
+import json
+import logging
+import mmap
+import os
+import struct
+import uuid
+import zlib
+from collections.abc import Iterable, Iterator
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction as db_transaction
+from django.db.models import Case, F, Min, When
+from django.utils import timezone
+
+from apps.core.db import advisory_lock
+
+from .models import ArchiveSegment, Transaction
+from .partitions import add_months, month_bound
+
+logger = logging.getLogger("transactions")
+logger.setLevel(logging.DEBUG)
+
+# Одна архивация за раз
+ARCHIVE_LOCK = "transactions:archive"
+
+# Сегмент - два файла: <name>.seg с блоками zlib (в блоке - проводки одного кошелька по возрастанию времени,
+# по строке JSON на проводку) и <name>.idx с индексом блоков, отсортированным по (кошелёк, время)
+ARCHIVE_COLUMNS = (
+    "created_at",
+    "id",
+    "flow",
+    "amount",
+    "balance_after",
+    "transfer",
+    "counterparty",
+    "transfer_created_at",
+    "from_wallet",
+    "to_wallet",
+    "transfer_amount",
+    "fee",
+    "idempotency_key",
+)
+INDEX_MAGIC = b"FTARCIX1"
+# Заголовок индекса: сигнатура, количество блоков
+INDEX_HEADER = struct.Struct("<8sQ")
+# Блок: кошелёк, время первой и последней проводки (мкс от эпохи), смещение и длина в .seg,
+# количество проводок, их сумма со знаком (копейки) - итоги по кошельку считаются без распаковки
+INDEX_ENTRY = struct.Struct("<16sqqQIIq")
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.UTC)
+
+# Переводы остаются в БД: по ним unique_transfer распознаёт повтор Idempotency-Key и после архивации проводок
+ARCHIVED_TRANSFERS_SQL = """
+SELECT COUNT(DISTINCT transfer_id) FROM transactions_transaction
+WHERE created_at >= %(lower)s AND created_at < %(upper)s
+"""
+ARCHIVE_TRANSACTIONS_SQL = """
+DELETE FROM transactions_transaction WHERE created_at >= %(lower)s AND created_at < %(upper)s
+"""
+
+
+@dataclasses.dataclass(frozen=True)
+class IndexEntry:
+    wallet_id: uuid.UUID
+    first: datetime.datetime
+    last: datetime.datetime
+    offset: int
+    length: int
+    rows: int
+    total: Decimal
+
+
+def to_micros(value: datetime.datetime) -> int:
+    return (value - EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def from_micros(value: int) -> datetime.datetime:
+    return EPOCH + datetime.timedelta(microseconds=value)
+
+
+def signed_amount(flow: str, amount: Decimal) -> Decimal:
+    return -amount if flow == Transaction.Flow.credit else amount
+
+
+def segment_paths(name: str) -> tuple[Path, Path]:
+    root = Path(settings.ARCHIVE_ROOT)
+    return root / f"{name}.seg", root / f"{name}.idx"
+
+
+def write_segment(name: str, rows: Iterable[tuple], block_rows: int = None) -> tuple[int, int]:
+    """
+    Пишет сегмент из строк ARCHIVE_COLUMNS + wallet_id, отсортированных по (кошелёк, время, id).
+    Файлы появляются под итоговыми именами только целиком записанными. Возвращает (проводок, байт).
+    """
+    block_rows = block_rows or settings.ARCHIVE_BLOCK_ROWS
+    data_path, index_path = segment_paths(name)
+    data_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_data_path, temp_index_path = data_path.with_suffix(".seg.tmp"), index_path.with_suffix(".idx.tmp")
+
+    entries = []
+    count = 0
+    offset = 0
+    with open(temp_data_path, "wb") as data_file:
+        for wallet_id, wallet_rows in itertools.groupby(rows, key=lambda row: row[-1]):
+            for block in iter(lambda: list(itertools.islice(wallet_rows, block_rows)), []):
+                lines = "".join(json.dumps([_encode(value) for value in row[:-1]]) + "\n" for row in block)
+                compressed = zlib.compress(lines.encode(), level=6)
+                data_file.write(compressed)
+                total = sum(signed_amount(row[2], row[3]) for row in block)
+                entries.append(
+                    INDEX_ENTRY.pack(
+                        wallet_id.bytes,
+                        to_micros(block[0][0]),
+                        to_micros(block[-1][0]),
+                        offset,
+                        len(compressed),
+                        len(block),
+                        int(total * 100),
+                    )
+                )
+                offset += len(compressed)
+                count += len(block)
+
+        data_file.flush()
+        os.fsync(data_file.fileno())
+
+    with open(temp_index_path, "wb") as index_file:
+        index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, len(entries)))
+        index_file.write(b"".join(entries))
+        index_file.flush()
+        os.fsync(index_file.fileno())
+
+    os.replace(temp_data_path, data_path)
+    os.replace(temp_index_path, index_path)
+    return count, offset + index_path.stat().st_size
+
+
+def remove_segment(name: str) -> None:
+    for path in segment_paths(name):
+        for candidate in (path, path.with_suffix(path.suffix + ".tmp")):
+            candidate.unlink(missing_ok=True)
+
+
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if value is None:
+        return None
+    return str(value)
+
+
+class SegmentReader:
+    """
+    Индекс сегмента отображается в память (mmap) и ищется бинарным поиском по кошельку,
+    из .seg читаются и распаковываются только блоки нужного кошелька и периода.
+    """
+
+    def __init__(self, name: str):
+        data_path, index_path = segment_paths(name)
+        with open(index_path, "rb") as index_file:
+            self.index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.size = INDEX_HEADER.unpack_from(self.index)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"Повреждён индекс сегмента {name}")
+        self.data_fd = os.open(data_path, os.O_RDONLY)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, position: int) -> bytes:
+        # Только кошелёк блока: этого достаточно для bisect, остальная запись не распаковывается
+        start = INDEX_HEADER.size + position * INDEX_ENTRY.size
+        return self.index[start : start + 16]
+
+    def entry(self, position: int) -> IndexEntry:
+        wallet, first, last, offset, length, rows, total = INDEX_ENTRY.unpack_from(
+            self.index, INDEX_HEADER.size + position * INDEX_ENTRY.size
+        )
+        return IndexEntry(
+            wallet_id=uuid.UUID(bytes=wallet),
+            first=from_micros(first),
+            last=from_micros(last),
+            offset=offset,
+            length=length,
+            rows=rows,
+            total=Decimal(total) / 100,
+        )
+
+    def entries(self, wallet_id: uuid.UUID) -> list[IndexEntry]:
+        start = bisect.bisect_left(self, wallet_id.bytes)
+        end = bisect.bisect_right(self, wallet_id.bytes, lo=start)
+        return [self.entry(position) for position in range(start, end)]
+
+    def read_block(self, entry: IndexEntry, lower: datetime.datetime, upper: datetime.datetime) -> Iterator[dict]:
+        lines = zlib.decompress(os.pread(self.data_fd, entry.length, entry.offset)).decode().splitlines()
+        for line in lines:
+            row = dict(zip(ARCHIVE_COLUMNS, json.loads(line)))
+            row["created_at"] = datetime.datetime.fromisoformat(row["created_at"])
+            if lower <= row["created_at"] < upper:
+                yield row
+
+    def rows(self, wallet_id: uuid.UUID, lower: datetime.datetime, upper: datetime.datetime) -> Iterator[tuple]:
+        """
+        Проводки кошелька за [lower, upper) в формате statement_rows.
+        """
+        for entry in self.entries(wallet_id):
+            if entry.last < lower or entry.first >= upper:
+                continue
+
+            for row in self.read_block(entry, lower, upper):
+                yield (
+                    row["created_at"],
+                    uuid.UUID(row["id"]),
+                    row["flow"],
+                    Decimal(row["amount"]),
+                    None if row["balance_after"] is None else Decimal(row["balance_after"]),
+                    uuid.UUID(row["transfer"]),
+                    uuid.UUID(row["counterparty"]),
+                )
+
+    def delta(self, wallet_id: uuid.UUID, lower: datetime.datetime, upper: datetime.datetime) -> Decimal:
+        # Блоки целиком внутри периода берутся из индекса, распаковываются только граничные
+        total = Decimal("0.00")
+        for entry in self.entries(wallet_id):
+            if entry.last < lower or entry.first >= upper:
+                continue
+            if lower <= entry.first and entry.last < upper:
+                total += entry.total
+                continue
+
+            for row in self.read_block(entry, lower, upper):
+                total += signed_amount(row["flow"], Decimal(row["amount"]))
+
+        return total
+
+
+@functools.lru_cache(maxsize=128)
+def open_segment(name: str) -> SegmentReader:
+    # Сегменты неизменяемы, поэтому открытые индексы переиспользуются процессом
+    return SegmentReader(name)
+
+
+def segment_names(lower: datetime.datetime = None, upper: datetime.datetime = None) -> list[str]:
+    segments = ArchiveSegment.objects.all()
+    if lower is not None:
+        segments = segments.filter(period_end__gt=lower)
+    if upper is not None:
+        segments = segments.filter(period_start__lt=upper)
+    return list(segments.order_by("period_start").values_list("name", flat=True))
+
+
+def archived_rows(wallet_id: uuid.UUID, lower: datetime.datetime, upper: datetime.datetime) -> Iterator[tuple]:
+    for name in segment_names(lower, upper):
+        yield from open_segment(name).rows(wallet_id, lower, upper)
+
+
+def archived_delta(
+    wallet_id: uuid.UUID, lower: datetime.datetime = None, upper: datetime.datetime = None, names: list[str] = None
+) -> Decimal:
+    """
+    Сумма архивных проводок кошелька за [lower, upper) со знаком (debit +, credit -, fee +).
+    """
+    lower = lower or datetime.datetime.min.replace(tzinfo=datetime.UTC)
+    upper = upper or datetime.datetime.max.replace(tzinfo=datetime.UTC)
+    names = segment_names(lower, upper) if names is None else names
+    return sum((open_segment(name).delta(wallet_id, lower, upper) for name in names), Decimal("0.00"))
+
+
+def archive_rows(lower: datetime.datetime, upper: datetime.datetime) -> Iterator[tuple]:
+    return (
+        Transaction.objects.filter(created_at__gte=lower, created_at__lt=upper)
+        .annotate(
+            counterparty=Case(
+                When(flow=Transaction.Flow.credit, then=F("transfer__to_wallet_id")),
+                default=F("transfer__from_wallet_id"),
+            )
+        )
+        .order_by("wallet_id", "created_at", "id")
+        .values_list(
+            "created_at",
+            "id",
+            "flow",
+            "amount",
+            "balance_after",
+            "transfer_id",
+            "counterparty",
+            "transfer__created_at",
+            "transfer__from_wallet_id",
+            "transfer__to_wallet_id",
+            "transfer__amount",
+            "transfer__fee",
+            "transfer__idempotency_key",
+            "wallet_id",
+        )
+        .iterator(chunk_size=settings.STATEMENT_CHUNK_SIZE)
+    )
+
+
+def archive_period(lower: datetime.datetime, upper: datetime.datetime) -> ArchiveSegment | None:
+    """
+    Переносит проводки за [lower, upper) в сегмент и удаляет их из БД; переводы остаются.
+    Чтение, запись сегмента и удаление - в одном снимке REPEATABLE READ.
+    """
+    name = f"{lower:%Y%m%d}-{uuid.uuid4().hex[:12]}"
+    isolate = not connection.in_atomic_block
+    try:
+        with db_transaction.atomic():
+            if isolate:
+                with connection.cursor() as cursor:
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+
+            count, size = write_segment(name, archive_rows(lower, upper))
+            if not count:
+                remove_segment(name)
+                return None
+
+            with connection.cursor() as cursor:
+                cursor.execute(ARCHIVED_TRANSFERS_SQL, {"lower": lower, "upper": upper})
+                transfers = cursor.fetchone()[0]
+                cursor.execute(ARCHIVE_TRANSACTIONS_SQL, {"lower": lower, "upper": upper})
+                if cursor.rowcount != count:
+                    raise RuntimeError(f"Архив {name}: записано {count} проводок, удалялось бы {cursor.rowcount}")
+
+            segment = ArchiveSegment.objects.create(
+                period_start=lower,
+                period_end=upper,
+                name=name,
+                transactions=count,
+                transfers=transfers,
+                size=size,
+            )
+    except Exception:
+        remove_segment(name)
+        raise
+
+    logger.info(f"Архив {name}: {count} проводок, {transfers} переводов, {size} байт")
+    return segment
+
+
+def archive_ledger(after_days: int = None) -> list[ArchiveSegment] | None:
+    """
+    Архивирует по месяцам проводки старше after_days дней (месяц целиком). Возвращает None,
+    если уже идёт другая архивация.
+    """
+    after_days = settings.ARCHIVE_AFTER_DAYS if after_days is None else after_days
+    cutoff_month = (timezone.now() - datetime.timedelta(days=after_days)).astimezone(datetime.UTC).date().replace(day=1)
+    cutoff = month_bound(cutoff_month)
+
+    with advisory_lock(ARCHIVE_LOCK) as acquired:
+        if not acquired:
+            logger.warning("Архивация уже выполняется")
+            return None
+
+        oldest = Transaction.objects.filter(created_at__lt=cutoff).aggregate(oldest=Min("created_at"))["oldest"]
+        segments = []
+        month = oldest.astimezone(datetime.UTC).date().replace(day=1) if oldest else cutoff_month
+        while month < cutoff_month:
+            segment = archive_period(month_bound(month), month_bound(add_months(month, 1)))
+            if segment is not None:
+                segments.append(segment)
+            month = add_months(month, 1)
+
+    return segments
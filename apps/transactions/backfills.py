@@ -0,0 +1,86 @@
+import logging
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Q
+
+from .cache import get_admin_wallet
+from .models import Transaction, Wallet, WalletBalance
+
+logger = logging.getLogger("transactions")
+logger.setLevel(logging.DEBUG)
+
+
+def signed_amount(flow: str, amount: Decimal) -> Decimal:
+    return -amount if flow == Transaction.Flow.credit else amount
+
+
+def backfill_balance_after(wallet_ids: list[uuid.UUID] = None, chunk_size: int = None) -> int:
+    """
+    Заполняет balance_after у старых проводок: по каждому кошельку от новых проводок к старым,
+    порциями по chunk_size, каждая в своей транзакции. Возвращает количество заполненных проводок.
+
+    Админский кошелёк пропускается: перенос комиссий из шардов меняет его баланс мимо проводок.
+    """
+    chunk_size = chunk_size or settings.BALANCE_AFTER_BACKFILL_CHUNK_SIZE
+    try:
+        admin_wallet_id = get_admin_wallet().wallet_id
+    except Wallet.DoesNotExist:
+        admin_wallet_id = None
+
+    balances = WalletBalance.objects.exclude(wallet_id=admin_wallet_id).order_by("wallet_id")
+    if wallet_ids is not None:
+        balances = balances.filter(wallet_id__in=wallet_ids)
+
+    filled = 0
+    for wallet_id in balances.values_list("wallet_id", flat=True).iterator():
+        wallet_filled = backfill_wallet_balance_after(wallet_id, chunk_size)
+        if wallet_filled:
+            logger.info(f"balance_after кошелька {wallet_id}: {wallet_filled} проводок")
+        filled += wallet_filled
+
+    return filled
+
+
+def backfill_wallet_balance_after(wallet_id: uuid.UUID, chunk_size: int) -> int:
+    rows = Transaction.objects.filter(wallet_id=wallet_id, balance_after__isnull=True).order_by("-created_at", "-id")
+
+    with db_transaction.atomic():
+        # Самая старая проводка с balance_after (записана уже при переводе) - точка отсчёта для всех, что раньше неё
+        anchor = (
+            Transaction.objects.filter(wallet_id=wallet_id, balance_after__isnull=False)
+            .order_by("created_at", "id")
+            .only("created_at", "id", "flow", "amount", "balance_after")
+            .first()
+        )
+        if anchor is not None:
+            running = anchor.balance_after - signed_amount(anchor.flow, anchor.amount)
+            rows = rows.filter(Q(created_at__lt=anchor.created_at) | Q(created_at=anchor.created_at, id__lt=anchor.id))
+        else:
+            # Новых проводок ещё нет: отсчёт от текущего баланса, строка баланса заблокирована до конца первой порции,
+            # чтобы перевод не вклинился между чтением баланса и проводок
+            running = WalletBalance.objects.select_for_update().get(wallet_id=wallet_id).balance
+
+        filled, running, position = _backfill_chunk(rows, running, chunk_size)
+
+    while position is not None:
+        created_at, pk = position
+        with db_transaction.atomic():
+            chunk_rows = rows.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+            chunk_filled, running, position = _backfill_chunk(chunk_rows, running, chunk_size)
+        filled += chunk_filled
+
+    return filled
+
+
+def _backfill_chunk(rows, running: Decimal, chunk_size: int) -> tuple[int, Decimal, tuple | None]:
+    chunk = list(rows.only("created_at", "id", "flow", "amount")[:chunk_size])
+    for row in chunk:
+        row.balance_after = running
+        running -= signed_amount(row.flow, row.amount)
+
+    Transaction.objects.bulk_update(chunk, ["balance_after"])
+    position = (chunk[-1].created_at, chunk[-1].id) if len(chunk) == chunk_size else None
+    return len(chunk), running, position
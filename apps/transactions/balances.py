@@ -0,0 +1,88 @@
+import logging
+import uuid
+
+import redis
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction as db_transaction
+
+from .dto import WalletBalanceResponse
+from .models import WalletBalance
+
+logger = logging.getLogger("transactions")
+logger.setLevel(logging.DEBUG)
+
+# Поколение кошелька, для которого ещё не было ни одной инвалидации
+INITIAL_GENERATION = "0"
+
+
+def _entry_key(wallet_id: uuid.UUID) -> str:
+    return f"wallet-balance:{wallet_id}"
+
+
+def _generation_key(wallet_id: uuid.UUID) -> str:
+    return f"wallet-balance-generation:{wallet_id}"
+
+
+def get_wallet_balances(wallet_ids: list[uuid.UUID]) -> dict[uuid.UUID, WalletBalanceResponse]:
+    """
+    Балансы пользовательских кошельков из кэша BALANCE_CACHE_ALIAS, промахи - одним запросом к БД.
+
+    Запись в кэше хранит поколение кошелька на момент чтения из БД. Переводы после коммита
+    меняют поколение (invalidate_wallet_balances), поэтому запись, прочитанная до коммита
+    и сохранённая после инвалидации, уже не совпадёт с текущим поколением.
+    """
+    cache = caches[settings.BALANCE_CACHE_ALIAS]
+    keys = [key for wallet_id in wallet_ids for key in (_entry_key(wallet_id), _generation_key(wallet_id))]
+    try:
+        cached = cache.get_many(keys)
+    except redis.RedisError as exception:
+        logger.warning(f"Кэш балансов недоступен: {exception!r}")
+        cached = None
+
+    balances = {}
+    generations = {}
+    for wallet_id in wallet_ids:
+        generation = (cached or {}).get(_generation_key(wallet_id), INITIAL_GENERATION)
+        entry = (cached or {}).get(_entry_key(wallet_id))
+        if entry is not None and entry[2] == generation:
+            balances[wallet_id] = WalletBalanceResponse(wallet_id=wallet_id, balance=entry[0], version=entry[1])
+        else:
+            generations[wallet_id] = generation
+
+    if not generations:
+        return balances
+
+    entries = {}
+    # Баланс админского кошелька отдаёт только AdminBalanceView, поэтому он и не кэшируется
+    for wallet_id, balance, version in WalletBalance.objects.filter(
+        wallet_id__in=generations, wallet__is_admin_wallet=False
+    ).values_list("wallet_id", "balance", "version"):
+        balances[wallet_id] = WalletBalanceResponse(wallet_id=wallet_id, balance=balance, version=version)
+        entries[_entry_key(wallet_id)] = (balance, version, generations[wallet_id])
+
+    if entries and cached is not None:
+        try:
+            cache.set_many(entries, timeout=settings.BALANCE_CACHE_TTL)
+        except redis.RedisError as exception:
+            logger.warning(f"Не удалось сохранить балансы в кэш: {exception!r}")
+
+    return balances
+
+
+def invalidate_wallet_balances(wallet_ids) -> None:
+    # После коммита: до него другие запросы всё ещё читают старый баланс
+    wallet_ids = set(wallet_ids)
+    if wallet_ids:
+        db_transaction.on_commit(lambda: _bump_generations(wallet_ids))
+
+
+def _bump_generations(wallet_ids) -> None:
+    cache = caches[settings.BALANCE_CACHE_ALIAS]
+    # Поколения не истекают: иначе устаревшая запись снова совпала бы с INITIAL_GENERATION
+    generations = {_generation_key(wallet_id): uuid.uuid4().hex for wallet_id in wallet_ids}
+    try:
+        cache.set_many(generations, timeout=None)
+    except redis.RedisError as exception:
+        # Записи истекут сами через BALANCE_CACHE_TTL
+        logger.warning(f"Не удалось сбросить кэш балансов {sorted(map(str, wallet_ids))}: {exception!r}")
@@ -0,0 +1,65 @@
+import dataclasses
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from .models import Wallet
+
+logger = logging.getLogger("transactions")
+logger.setLevel(logging.DEBUG)
+
+
+@dataclasses.dataclass(frozen=True)
+class AdminWalletRef:
+    wallet_id: uuid.UUID
+    balance_id: uuid.UUID | None
+
+
+_admin_wallet_lock = threading.Lock()
+_admin_wallet: AdminWalletRef | None = None
+_admin_wallet_expires_at = 0.0
+
+
+def get_admin_wallet() -> AdminWalletRef:
+    # Админский кошелёк один (unique_admin_wallet) и почти не меняется, поэтому держим его в памяти процесса.
+    # Локально сбрасывается сигналами, в остальных воркерах - по ADMIN_WALLET_CACHE_TTL
+    global _admin_wallet, _admin_wallet_expires_at
+
+    admin_wallet = _admin_wallet
+    if admin_wallet is not None and time.monotonic() < _admin_wallet_expires_at:
+        return admin_wallet
+
+    with _admin_wallet_lock:
+        if _admin_wallet is None or time.monotonic() >= _admin_wallet_expires_at:
+            wallet_id, balance_id = (
+                Wallet.objects.filter(is_admin_wallet=True).values_list("id", "walletbalance__id").get()
+            )
+            _admin_wallet = AdminWalletRef(wallet_id=wallet_id, balance_id=balance_id)
+            _admin_wallet_expires_at = time.monotonic() + settings.ADMIN_WALLET_CACHE_TTL
+
+        return _admin_wallet
+
+
+def invalidate_admin_wallet() -> None:
+    global _admin_wallet, _admin_wallet_expires_at
+
+    with _admin_wallet_lock:
+        _admin_wallet = None
+        _admin_wallet_expires_at = 0.0
+
+
+def is_cached_admin_wallet(wallet_id: uuid.UUID) -> bool:
+    admin_wallet = _admin_wallet
+    return admin_wallet is not None and admin_wallet.wallet_id == wallet_id
+
+
+def warm_admin_wallet_cache() -> None:
+    try:
+        get_admin_wallet()
+    except (Wallet.DoesNotExist, DatabaseError) as exception:
+        # Например, до migrate или seed_wallets: кэш заполнится при первом переводе
+        logger.warning(f"Не удалось загрузить админский кошелёк: {exception!r}")
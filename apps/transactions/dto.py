@@ -1,18 +1,19 @@
 import dataclasses
+import uuid
 from decimal import Decimal
 
-from apps.transactions.models import Transfer, Wallet
+from apps.transactions.models import Transfer
 
 
 @dataclasses.dataclass
 class TransferCreateCommand:
-    from_wallet: Wallet
-    to_wallet: Wallet
+    from_wallet_id: uuid.UUID
+    to_wallet_id: uuid.UUID
     amount: Decimal
     idempotency_key: str = None
 
     def __post_init__(self):
-        if self.from_wallet.id == self.to_wallet.id:
+        if self.from_wallet_id == self.to_wallet_id:
             raise ValueError("Нельзя отправить на тот же самый кошелёк")
 
         if self.amount <= Decimal("0.00"):
@@ -22,3 +23,26 @@ class TransferCreateCommand:
 @dataclasses.dataclass
 class TransferResponse:
     transfer: Transfer
+    created: bool = True
+    attempts: int = 1
+
+
+@dataclasses.dataclass
+class BatchTransferResult:
+    transfer: Transfer = None
+    created: bool = False
+    error: Exception = None
+
+
+@dataclasses.dataclass
+class AdminBalanceResponse:
+    balance: Decimal
+    pending_fees: Decimal
+    total: Decimal
+
+
+@dataclasses.dataclass
+class WalletBalanceResponse:
+    wallet_id: uuid.UUID
+    balance: Decimal
+    version: int
@@ -7,6 +7,17 @@ class RaceConditionException(Exception):
     pass
 
 
+class VersionConflictException(RaceConditionException):
+    def __init__(self, message, wallet: str = None):
+        super().__init__(message)
+        # Чья версия изменилась: "from", "to" или "admin"
+        self.wallet = wallet
+
+
+class TransferInProgressException(RaceConditionException):
+    pass
+
+
 class NotEnoughMineralsException(Exception):
     pass
 
@@ -15,5 +26,15 @@ class AdminWalletException(Exception):
     pass
 
 
+class WalletNotFoundException(Exception):
+    def __init__(self, wallet_id):
+        super().__init__(f"Кошелёк {wallet_id} не найден")
+        self.wallet_id = wallet_id
+
+
+class IdempotencyConflictException(Exception):
+    pass
+
+
 class ConflictError(ValidationError):
     status_code = HTTPStatus.CONFLICT
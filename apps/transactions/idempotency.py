@@ -0,0 +1,207 @@
+import asyncio
+import dataclasses
+import hashlib
+import json
+import logging
+import time
+import uuid
+from http import HTTPStatus
+
+import redis
+from django.conf import settings
+
+from apps.core.redis_client import get_async_redis, get_redis
+from . import metrics
+from .exceptions import IdempotencyConflictException
+
+logger = logging.getLogger("transactions")
+logger.setLevel(logging.DEBUG)
+
+# Удаляем ключ, только если он всё ещё принадлежит нашему запросу
+RELEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+@dataclasses.dataclass(frozen=True)
+class StoredResponse:
+    status: int
+    body: dict
+
+
+# Ключ занят запросом, который ещё выполняется
+IN_PROGRESS = object()
+
+
+class IdempotencyRecord:
+    """
+    Ответ перевода в Redis по (from_wallet, Idempotency-Key).
+
+    Источник истины - констрейнт unique_transfer в Postgres: при недоступности Redis
+    запрос просто идёт в БД, как раньше.
+    """
+
+    def __init__(self, from_wallet_id: uuid.UUID, idempotency_key: str, fingerprint: str):
+        key_hash = hashlib.blake2b(idempotency_key.encode(), digest_size=16).hexdigest()
+        self.key = f"{settings.IDEMPOTENCY_CACHE_PREFIX}:{from_wallet_id}:{key_hash}"
+        self.fingerprint = fingerprint
+        self.enabled = settings.IDEMPOTENCY_CACHE_ENABLED
+        self._in_progress_value = None
+
+    @classmethod
+    def for_transfer(cls, validated_data: dict, idempotency_key: str) -> "IdempotencyRecord":
+        payload = f"{validated_data['to_wallet']}:{validated_data['amount']}"
+        fingerprint = hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+        return cls(validated_data["from_wallet"], idempotency_key, fingerprint)
+
+    def begin(self) -> StoredResponse | None:
+        """
+        Занимает ключ на время выполнения перевода.
+        Возвращает сохранённый ответ для повтора или None, если перевод нужно выполнить.
+        Если ключ занят выполняющимся запросом, ждёт его ответ до TRANSFER_COALESCE_WAIT секунд, затем отдаёт
+        перевод БД: там дубль дождётся первого запроса на advisory-блокировке или выполнит перевод за упавший.
+        """
+        if not self.enabled:
+            return None
+
+        value = self._in_progress()
+        deadline = time.monotonic() + settings.TRANSFER_COALESCE_WAIT
+        attempt = 1
+        try:
+            client = get_redis()
+            while True:
+                if client.set(self.key, value, nx=True, ex=settings.IDEMPOTENCY_IN_PROGRESS_TTL):
+                    self._in_progress_value = value
+                    return None
+
+                stored = self._stored_response(client.get(self.key))
+                if stored is not IN_PROGRESS:
+                    return stored
+
+                delay = self._wait_delay(deadline, attempt)
+                if delay is None:
+                    return None
+
+                time.sleep(delay)
+                attempt += 1
+        except redis.RedisError as exception:
+            logger.warning(f"Redis недоступен, идемпотентность проверит БД: {exception!r}")
+            return None
+
+    async def abegin(self) -> StoredResponse | None:
+        if not self.enabled:
+            return None
+
+        value = self._in_progress()
+        deadline = time.monotonic() + settings.TRANSFER_COALESCE_WAIT
+        attempt = 1
+        try:
+            client = get_async_redis()
+            while True:
+                if await client.set(self.key, value, nx=True, ex=settings.IDEMPOTENCY_IN_PROGRESS_TTL):
+                    self._in_progress_value = value
+                    return None
+
+                stored = self._stored_response(await client.get(self.key))
+                if stored is not IN_PROGRESS:
+                    return stored
+
+                delay = self._wait_delay(deadline, attempt)
+                if delay is None:
+                    return None
+
+                await asyncio.sleep(delay)
+                attempt += 1
+        except redis.RedisError as exception:
+            logger.warning(f"Redis недоступен, идемпотентность проверит БД: {exception!r}")
+            return None
+
+    def _in_progress(self) -> str:
+        return json.dumps({"f": self.fingerprint, "t": uuid.uuid4().hex}, separators=(",", ":"))
+
+    def _stored_response(self, stored: bytes | None) -> StoredResponse | object:
+        if stored is None:
+            # Ключ истёк или освобождён после ошибки между SET и GET - занимаем заново
+            return IN_PROGRESS
+
+        stored = json.loads(stored)
+        if stored["f"] != self.fingerprint:
+            raise IdempotencyConflictException("Idempotency-Key уже использован с другими параметрами перевода")
+
+        if "s" not in stored:
+            return IN_PROGRESS
+
+        metrics.IDEMPOTENCY_CACHE_REPLAYS.inc()
+        # Повтор отвечает как БД на существующий перевод - 200, даже если первый ответ был 201
+        return StoredResponse(status=HTTPStatus.OK, body=stored["b"])
+
+    def _wait_delay(self, deadline: float, attempt: int) -> float | None:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            logger.info(f"Ключ идемпотентности {self.key} всё ещё занят, перевод проверит БД")
+            return None
+
+        return min(remaining, settings.TRANSFER_COALESCE_POLL_INTERVAL * attempt)
+
+    def complete(self, status: int, body: dict) -> None:
+        if self._in_progress_value is None:
+            return
+
+        value = self._completed(status, body)
+        if value is None:
+            self.release()
+            return
+
+        try:
+            get_redis().set(self.key, value, ex=settings.IDEMPOTENCY_CACHE_TTL)
+        except redis.RedisError as exception:
+            logger.warning(f"Не удалось сохранить ответ перевода в Redis: {exception!r}")
+        finally:
+            self._in_progress_value = None
+
+    async def acomplete(self, status: int, body: dict) -> None:
+        if self._in_progress_value is None:
+            return
+
+        value = self._completed(status, body)
+        if value is None:
+            await self.arelease()
+            return
+
+        try:
+            await get_async_redis().set(self.key, value, ex=settings.IDEMPOTENCY_CACHE_TTL)
+        except redis.RedisError as exception:
+            logger.warning(f"Не удалось сохранить ответ перевода в Redis: {exception!r}")
+        finally:
+            self._in_progress_value = None
+
+    def _completed(self, status: int, body: dict) -> str | None:
+        value = json.dumps({"f": self.fingerprint, "s": status, "b": body}, separators=(",", ":"), default=str)
+        # Большие ответы не кэшируем: повтор обработает БД
+        return value if len(value) <= settings.IDEMPOTENCY_CACHE_MAX_SIZE else None
+
+    def release(self) -> None:
+        # Ошибки не кэшируются: после исправления (например, пополнения баланса) клиент может повторить запрос
+        if self._in_progress_value is None:
+            return
+
+        try:
+            get_redis().eval(RELEASE_SCRIPT, 1, self.key, self._in_progress_value)
+        except redis.RedisError as exception:
+            logger.warning(f"Не удалось освободить ключ идемпотентности в Redis: {exception!r}")
+        finally:
+            self._in_progress_value = None
+
+    async def arelease(self) -> None:
+        if self._in_progress_value is None:
+            return
+
+        try:
+            await get_async_redis().eval(RELEASE_SCRIPT, 1, self.key, self._in_progress_value)
+        except redis.RedisError as exception:
+            logger.warning(f"Не удалось освободить ключ идемпотентности в Redis: {exception!r}")
+        finally:
+            self._in_progress_value = None
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.transactions.archive import archive_ledger
+
+
+class Command(BaseCommand):
+    help = "Move transactions and transfers older than --after-days into compressed archive segments"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--after-days", type=int, default=None)
+
+    def handle(self, *args, **options):
+        segments = archive_ledger(after_days=options["after_days"])
+        if segments is None:
+            raise CommandError("Another archive run is in progress")
+
+        for segment in segments:
+            self.stdout.write(
+                f"{segment.name}: [{segment.period_start}, {segment.period_end}) "
+                f"transactions={segment.transactions} transfers={segment.transfers} size={segment.size}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Done. Segments={len(segments)}"))
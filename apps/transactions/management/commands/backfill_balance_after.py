@@ -0,0 +1,17 @@
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from apps.transactions.backfills import backfill_balance_after
+
+
+class Command(BaseCommand):
+    help = "Fill Transaction.balance_after for rows written before the column existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--wallet", type=uuid.UUID, action="append", dest="wallet_ids", default=None)
+        parser.add_argument("--chunk-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        filled = backfill_balance_after(wallet_ids=options["wallet_ids"], chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Done. Transactions={filled}"))
@@ -0,0 +1,46 @@
+import datetime
+import sys
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.transactions.cache import get_admin_wallet
+from apps.transactions.statements import RENDERERS, export_statement
+
+
+class Command(BaseCommand):
+    help = "Stream wallet statement for a date range as CSV or NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("wallet_id", type=uuid.UUID)
+        parser.add_argument("--date-from", type=datetime.date.fromisoformat, required=True)
+        parser.add_argument("--date-to", type=datetime.date.fromisoformat, required=True)
+        parser.add_argument("--output-format", choices=sorted(RENDERERS), default="csv")
+        parser.add_argument("--gzip", action="store_true")
+        parser.add_argument("--output", default="-", help="File path, '-' for stdout")
+
+    def handle(self, *args, **options):
+        # Как и в API: у комиссий в шардах нет balance_after, выписка админского кошелька была бы неполной
+        if options["wallet_id"] == get_admin_wallet().wallet_id:
+            raise CommandError("Statements are not available for the admin wallet, use the admin balance endpoint")
+
+        chunks = export_statement(
+            options["wallet_id"],
+            options["date_from"],
+            options["date_to"],
+            options["output_format"],
+            options["gzip"],
+        )
+
+        if options["output"] == "-":
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+
+        written = 0
+        with open(options["output"], "wb") as file:
+            for chunk in chunks:
+                written += file.write(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f"Done. Written bytes={written} to {options['output']}"))
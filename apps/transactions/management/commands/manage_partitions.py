@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from apps.transactions.partitions import list_partitions, manage_partitions
+
+
+class Command(BaseCommand):
+    help = "Pre-create monthly transaction partitions and detach the ones past retention"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months-ahead", type=int, default=None)
+        parser.add_argument("--retention-months", type=int, default=None)
+
+    def handle(self, *args, **options):
+        created, detached = manage_partitions(
+            months_ahead=options["months_ahead"], retention_months=options["retention_months"]
+        )
+        for partition in list_partitions():
+            bounds = "DEFAULT" if partition.is_default else f"[{partition.lower or 'MINVALUE'}, {partition.upper})"
+            self.stdout.write(f"{partition.name}: {bounds}")
+
+        self.stdout.write(self.style.SUCCESS(f"Done. Created={len(created)} detached={len(detached)}"))
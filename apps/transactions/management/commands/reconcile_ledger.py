@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.transactions.reconciliation import reconcile_ledger
+
+
+class Command(BaseCommand):
+    help = "Reconcile wallet balances with the sum of their ledger transactions"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None)
+        parser.add_argument("--chunks", type=int, default=None)
+
+    def handle(self, *args, **options):
+        run = reconcile_ledger(workers=options["workers"], chunks=options["chunks"])
+        if run is None:
+            raise CommandError("Another reconciliation is running")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done. Wallets={run.wallets_checked} transactions={run.transactions_processed} "
+                f"discrepancies={run.discrepancies_found}"
+            )
+        )
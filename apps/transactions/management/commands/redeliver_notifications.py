@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.transactions.notifications import redeliver_dead_letters
+
+
+class Command(BaseCommand):
+    help = "Retry notifications from the dead-letter table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=None)
+
+    def handle(self, *args, **options):
+        result = redeliver_dead_letters(limit=options["limit"])
+        self.stdout.write(self.style.SUCCESS(f"Done. Sent={result.sent} failed={len(result.dead)}"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from apps.transactions.outbox import relay_outbox, run_relay
+
+
+class Command(BaseCommand):
+    help = "Publish transfer events from the outbox table to the broker"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--poll-interval", type=float, default=None)
+        parser.add_argument("--once", action="store_true", help="Relay a single batch and exit")
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            published = relay_outbox(batch_size=options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(f"Done. Events={published}"))
+            return
+
+        self.stdout.write("Relaying outbox events")
+        run_relay(batch_size=options["batch_size"], poll_interval=options["poll_interval"])
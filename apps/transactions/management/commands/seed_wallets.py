@@ -6,6 +6,7 @@ from django.contrib.auth import get_user_model
 from django.core.management.base import BaseCommand
 from django.db.models import F
 
+from apps.transactions.cache import get_admin_wallet
 from apps.transactions.dto import TransferCreateCommand
 from apps.transactions.models import Wallet, WalletBalance
 from apps.transactions.services import transfer_funds  # <-- твоя функция transfer(cmd)
@@ -53,13 +54,14 @@ class Command(BaseCommand):
             defaults={"balance": Decimal("0.00"), "version": 0},
         )
 
-        WalletBalance.objects.filter(wallet=admin_wallet).update(
+        admin_wallet_ref = get_admin_wallet()
+        WalletBalance.objects.filter(pk=admin_wallet_ref.balance_id).update(
             balance=F("balance") + admin_topup,
             version=F("version") + 1,
         )
 
-        # 2) обычные кошельки + стартовые балансы
-        wallets = list(Wallet.objects.all())
+        # 2) обычные кошельки + стартовые балансы (админский кошелёк в переводах не участвует)
+        wallets = list(Wallet.objects.exclude(pk=admin_wallet_ref.wallet_id))
         for i in range(wallets_count):
             username = f"seed_user_{i:03d}"
             user, _ = User.objects.get_or_create(
@@ -85,8 +87,8 @@ class Command(BaseCommand):
 
             amount = q2(Decimal(str(random.uniform(1.0, 2500.0))))
             cmd = TransferCreateCommand(
-                from_wallet=from_w,
-                to_wallet=to_w,
+                from_wallet_id=from_w.pk,
+                to_wallet_id=to_w.pk,
                 amount=amount,
                 idempotency_key=str(uuid.uuid4()),
             )
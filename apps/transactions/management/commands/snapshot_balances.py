@@ -0,0 +1,19 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from apps.transactions.snapshots import snapshot_balances
+
+
+class Command(BaseCommand):
+    help = "Write closing wallet balances for the given day or for every closed day since the last snapshot"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--day", type=datetime.date.fromisoformat, default=None)
+
+    def handle(self, *args, **options):
+        written = snapshot_balances(day=options["day"])
+        for day, count in written.items():
+            self.stdout.write(f"{day}: {count}")
+
+        self.stdout.write(self.style.SUCCESS(f"Done. Days={len(written)} snapshots={sum(written.values())}"))
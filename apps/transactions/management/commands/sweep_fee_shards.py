@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.transactions.services import sweep_fee_shards
+
+
+class Command(BaseCommand):
+    help = "Move accumulated fees from fee shards to the admin wallet balance"
+
+    def handle(self, *args, **options):
+        total = sweep_fee_shards()
+        self.stdout.write(self.style.SUCCESS(f"Done. Swept fees={total}"))
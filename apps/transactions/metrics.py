@@ -0,0 +1,76 @@
+from decimal import Decimal
+
+from prometheus_client import Counter, Histogram
+
+from .exceptions import (
+    AdminWalletException,
+    NotEnoughMineralsException,
+    RaceConditionException,
+    TransferInProgressException,
+    VersionConflictException,
+    WalletNotFoundException,
+)
+from .models import Wallet, WalletBalance
+
+TRANSFER_DURATION = Histogram(
+    "transfer_duration_seconds",
+    "Время transfer_funds вместе с повторами, по движку и исходу",
+    ["engine", "outcome"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+TRANSFER_RETRIES = Counter(
+    "transfer_retries",
+    "Повторы перевода после конфликта версий, по кошельку с изменившейся версией",
+    ["engine", "wallet"],
+)
+TRANSFER_FEE = Histogram(
+    "transfer_fee_amount",
+    "Комиссия созданного перевода",
+    buckets=(100, 150, 250, 500, 1000, 2500, 5000, 10000, 50000),
+)
+IDEMPOTENCY_CACHE_REPLAYS = Counter(
+    "transfer_idempotency_cache_replays",
+    "Повторы перевода, отвеченные из кэша идемпотентности в Redis без вызова transfer_funds",
+)
+
+NOTIFICATIONS = Counter(
+    "transfer_notifications",
+    "Уведомления получателям по итогу: sent - доставлено, dead - попытки исчерпаны",
+    ["outcome"],
+)
+NOTIFICATION_RETRIES = Counter(
+    "transfer_notification_retries",
+    "Повторные попытки отправки уведомления",
+)
+
+# Исход по исключению: первый подходящий класс, поэтому подклассы - раньше базовых
+OUTCOMES = (
+    (NotEnoughMineralsException, "insufficient_funds"),
+    (AdminWalletException, "admin_wallet"),
+    (TransferInProgressException, "in_progress"),
+    (RaceConditionException, "idempotency_conflict"),
+    (WalletNotFoundException, "wallet_not_found"),
+    (Wallet.DoesNotExist, "wallet_not_found"),
+    (WalletBalance.DoesNotExist, "wallet_not_found"),
+)
+
+
+def transfer_outcome(exception: BaseException) -> str:
+    if isinstance(exception, VersionConflictException):
+        return f"conflict_{exception.wallet}" if exception.wallet else "conflict"
+
+    return next((outcome for error_type, outcome in OUTCOMES if isinstance(exception, error_type)), "error")
+
+
+def observe_transfer(engine: str, duration: float, created: bool, fee: Decimal) -> None:
+    TRANSFER_DURATION.labels(engine, "ok" if created else "replay").observe(duration)
+    if created and fee:
+        TRANSFER_FEE.observe(float(fee))
+
+
+def observe_transfer_error(engine: str, duration: float, exception: BaseException) -> None:
+    TRANSFER_DURATION.labels(engine, transfer_outcome(exception)).observe(duration)
+
+
+def observe_retry(engine: str, exception: VersionConflictException) -> None:
+    TRANSFER_RETRIES.labels(engine, exception.wallet or "unknown").inc()
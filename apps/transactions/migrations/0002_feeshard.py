@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-18 08:47
+
+import uuid
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FeeShard",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="Создано")),
+                ("updated_at", models.DateTimeField(auto_now=True, verbose_name="Обновлено")),
+                ("shard", models.PositiveSmallIntegerField(unique=True, verbose_name="Шард")),
+                (
+                    "balance",
+                    models.DecimalField(
+                        decimal_places=2, default=Decimal("0.00"), max_digits=10, verbose_name="Накопленная комиссия"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Шард комиссий",
+                "verbose_name_plural": "Шарды комиссий",
+            },
+        ),
+    ]
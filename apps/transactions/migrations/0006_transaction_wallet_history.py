@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-18 12:15
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не блокирует запись проводок, но не работает внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ("transactions", "0005_transfer_funds_coalesce"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="transaction",
+            index=models.Index(
+                fields=["wallet", "-created_at", "-id"],
+                include=("transfer", "flow", "amount"),
+                name="transaction_wallet_history",
+            ),
+        ),
+    ]
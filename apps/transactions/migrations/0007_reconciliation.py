@@ -0,0 +1,110 @@
+# Generated by Django 6.0 on 2026-10-18 13:20
+
+import django.db.models.deletion
+import uuid
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0006_transaction_wallet_history"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReconciliationRun",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="Создано")),
+                ("updated_at", models.DateTimeField(auto_now=True, verbose_name="Обновлено")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("running", "Выполняется"), ("succeeded", "Выполнена"), ("failed", "Ошибка")],
+                        default="running",
+                        verbose_name="Статус",
+                    ),
+                ),
+                ("cutoff", models.DateTimeField(verbose_name="Проводки учтены до")),
+                ("finished_at", models.DateTimeField(blank=True, null=True, verbose_name="Завершено")),
+                ("wallets_checked", models.PositiveIntegerField(default=0, verbose_name="Проверено кошельков")),
+                (
+                    "transactions_processed",
+                    models.PositiveBigIntegerField(default=0, verbose_name="Обработано проводок"),
+                ),
+                ("discrepancies_found", models.PositiveIntegerField(default=0, verbose_name="Найдено расхождений")),
+            ],
+            options={
+                "verbose_name": "Сверка",
+                "verbose_name_plural": "Сверки",
+            },
+        ),
+        migrations.CreateModel(
+            name="LedgerTotal",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="Создано")),
+                ("updated_at", models.DateTimeField(auto_now=True, verbose_name="Обновлено")),
+                (
+                    "opening",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("0.00"),
+                        max_digits=14,
+                        verbose_name="Баланс без проводок на первой сверке",
+                    ),
+                ),
+                (
+                    "total",
+                    models.DecimalField(
+                        decimal_places=2, default=Decimal("0.00"), max_digits=14, verbose_name="Сумма проводок"
+                    ),
+                ),
+                ("through", models.DateTimeField(verbose_name="Учтены проводки до")),
+                (
+                    "wallet",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.PROTECT, to="transactions.wallet", verbose_name="Кошелёк"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Итог проводок кошелька",
+                "verbose_name_plural": "Итоги проводок кошельков",
+            },
+        ),
+        migrations.CreateModel(
+            name="ReconciliationDiscrepancy",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="Создано")),
+                ("updated_at", models.DateTimeField(auto_now=True, verbose_name="Обновлено")),
+                ("balance", models.DecimalField(decimal_places=2, max_digits=14, verbose_name="Баланс")),
+                (
+                    "expected",
+                    models.DecimalField(decimal_places=2, max_digits=14, verbose_name="Ожидаемый баланс по проводкам"),
+                ),
+                (
+                    "wallet",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT, to="transactions.wallet", verbose_name="Кошелёк"
+                    ),
+                ),
+                (
+                    "run",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="discrepancies",
+                        to="transactions.reconciliationrun",
+                        verbose_name="Сверка",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Расхождение сверки",
+                "verbose_name_plural": "Расхождения сверки",
+            },
+        ),
+    ]
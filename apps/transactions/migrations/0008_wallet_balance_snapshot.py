@@ -0,0 +1,40 @@
+# Generated by Django 6.0 on 2026-10-18 14:05
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0007_reconciliation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WalletBalanceSnapshot",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="Создано")),
+                ("updated_at", models.DateTimeField(auto_now=True, verbose_name="Обновлено")),
+                ("day", models.DateField(verbose_name="День")),
+                ("balance", models.DecimalField(decimal_places=2, max_digits=14, verbose_name="Баланс на конец дня")),
+            ],
+            options={
+                "verbose_name": "Снимок баланса",
+                "verbose_name_plural": "Снимки балансов",
+            },
+        ),
+        migrations.AddField(
+            model_name="walletbalancesnapshot",
+            name="wallet",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT, to="transactions.wallet", verbose_name="Кошелёк"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="walletbalancesnapshot",
+            constraint=models.UniqueConstraint(fields=("wallet", "day"), name="unique_wallet_balance_snapshot"),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0 on 2026-10-18 14:05
+
+from django.contrib.postgres.indexes import BrinIndex
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не блокирует запись проводок, но не работает внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ("transactions", "0008_wallet_balance_snapshot"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="transaction",
+            index=BrinIndex(fields=["created_at"], name="transaction_created_at_brin"),
+        ),
+    ]
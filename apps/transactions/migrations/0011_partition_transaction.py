@@ -0,0 +1,130 @@
+# Generated by Django 6.0 on 2026-10-18 16:30
+
+import datetime
+
+from django.db import migrations, transaction
+from django.utils import timezone
+
+TABLE = "transactions_transaction"
+LEGACY = "transactions_transaction_legacy"
+DEFAULT = "transactions_transaction_default"
+PKEY = "transactions_transaction_pkey"
+# Первичный ключ таблицы до конвертации станет ключом партиции legacy, индекс строится заранее без блокировки записи
+LEGACY_PKEY = "transactions_transaction_legacy_pkey"
+LEGACY_BOUND = "transactions_transaction_legacy_bound"
+
+# Партиции, которые создаются сразу, дальше их заранее создаёт manage_partitions
+INITIAL_PARTITIONS = 3
+
+INDEXES_SQL = "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s"
+FOREIGN_KEYS_SQL = """
+SELECT conname, pg_get_constraintdef(oid)
+FROM pg_constraint
+WHERE conrelid = %s::regclass AND contype = 'f' AND conparentid = 0
+"""
+
+
+def add_months(month: datetime.date, count: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def month_bound(month: datetime.date) -> datetime.datetime:
+    return datetime.datetime.combine(month, datetime.time.min, tzinfo=datetime.UTC)
+
+
+def legacy_name(name: str) -> str:
+    return f"{name[:56]}_legacy"
+
+
+def partition_transaction(apps, schema_editor):
+    """
+    Существующая таблица без копирования данных становится партицией legacy (MINVALUE, boundary) новой
+    таблицы, партиционированной по месяцам created_at. Проверка границы и индекс (id, created_at) готовятся
+    заранее без блокировки записи, под ACCESS EXCLUSIVE выполняются только изменения каталога.
+    """
+    today = timezone.now().astimezone(datetime.UTC).date()
+    boundary = add_months(today.replace(day=1), 1)
+    if (boundary - today).days < 2:
+        # Граница проверки действует на запись до переключения, у конца месяца её сдвигаем ещё на месяц
+        boundary = add_months(boundary, 1)
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {LEGACY_PKEY} ON {TABLE} (id, created_at)")
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ADD CONSTRAINT {LEGACY_BOUND} CHECK (created_at < %s) NOT VALID",
+            [month_bound(boundary)],
+        )
+        # SHARE UPDATE EXCLUSIVE: проверка существующих строк идёт параллельно с записью
+        cursor.execute(f"ALTER TABLE {TABLE} VALIDATE CONSTRAINT {LEGACY_BOUND}")
+
+    with transaction.atomic(using=schema_editor.connection.alias), schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(INDEXES_SQL, [TABLE])
+        indexes = [(name, definition) for name, definition in cursor.fetchall() if name not in (PKEY, LEGACY_PKEY)]
+        cursor.execute(FOREIGN_KEYS_SQL, [TABLE])
+        foreign_keys = cursor.fetchall()
+
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {LEGACY}")
+        cursor.execute(f"ALTER TABLE {LEGACY} DROP CONSTRAINT {PKEY}")
+        cursor.execute(f"ALTER TABLE {LEGACY} ADD CONSTRAINT {LEGACY_PKEY} PRIMARY KEY USING INDEX {LEGACY_PKEY}")
+        for name, _ in indexes:
+            cursor.execute(f"ALTER INDEX {name} RENAME TO {legacy_name(name)}")
+        for name, _ in foreign_keys:
+            cursor.execute(f"ALTER TABLE {LEGACY} RENAME CONSTRAINT {name} TO {legacy_name(name)}")
+
+        # Имена индексов и ограничений сохраняются, Django о партиционировании не знает.
+        # Ключ партиционирования обязан входить в первичный ключ
+        cursor.execute(f"CREATE TABLE {TABLE} (LIKE {LEGACY} INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)")
+        cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {PKEY} PRIMARY KEY (id, created_at)")
+        for _, definition in indexes:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}")
+
+        # Проверка границы избавляет от сканирования, индексы и внешние ключи legacy подключаются к родительским
+        cursor.execute(
+            f"ALTER TABLE {TABLE} ATTACH PARTITION {LEGACY} FOR VALUES FROM (MINVALUE) TO (%s)", [month_bound(boundary)]
+        )
+        cursor.execute(f"ALTER TABLE {LEGACY} DROP CONSTRAINT {LEGACY_BOUND}")
+        cursor.execute(f"CREATE TABLE {DEFAULT} PARTITION OF {TABLE} DEFAULT")
+        for offset in range(INITIAL_PARTITIONS):
+            month = add_months(boundary, offset)
+            cursor.execute(
+                f"CREATE TABLE {TABLE}_p{month:%Y_%m} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)",
+                [month_bound(month), month_bound(add_months(month, 1))],
+            )
+
+
+def unpartition_transaction(apps, schema_editor):
+    # Обратно - копированием в обычную таблицу, отсоединённые партиции в неё не попадают
+    plain = f"{TABLE}_plain"
+    with transaction.atomic(using=schema_editor.connection.alias), schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(INDEXES_SQL, [TABLE])
+        indexes = [(name, definition) for name, definition in cursor.fetchall() if name != PKEY]
+        cursor.execute(FOREIGN_KEYS_SQL, [TABLE])
+        foreign_keys = cursor.fetchall()
+
+        cursor.execute(f"CREATE TABLE {plain} (LIKE {TABLE} INCLUDING DEFAULTS)")
+        cursor.execute(f"INSERT INTO {plain} SELECT * FROM {TABLE}")
+        cursor.execute(f"DROP TABLE {TABLE}")
+        cursor.execute(f"ALTER TABLE {plain} RENAME TO {TABLE}")
+        cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {PKEY} PRIMARY KEY (id)")
+        for _, definition in indexes:
+            cursor.execute(definition.replace(" ON ONLY ", " ON ", 1))
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}")
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY и проверка границы выполняются вне транзакции переключения
+    atomic = False
+
+    dependencies = [
+        ("transactions", "0010_transaction_balance_after"),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_transaction, unpartition_transaction),
+    ]
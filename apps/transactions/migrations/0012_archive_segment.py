@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-18 17:40
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0011_partition_transaction"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchiveSegment",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="Создано")),
+                ("updated_at", models.DateTimeField(auto_now=True, verbose_name="Обновлено")),
+                ("period_start", models.DateTimeField(verbose_name="Начало периода")),
+                ("period_end", models.DateTimeField(verbose_name="Конец периода")),
+                ("name", models.CharField(max_length=64, unique=True, verbose_name="Файл сегмента")),
+                ("transactions", models.PositiveBigIntegerField(default=0, verbose_name="Проводок")),
+                ("transfers", models.PositiveBigIntegerField(default=0, verbose_name="Переводов")),
+                ("size", models.PositiveBigIntegerField(default=0, verbose_name="Размер, байт")),
+            ],
+            options={
+                "verbose_name": "Сегмент архива",
+                "verbose_name_plural": "Сегменты архива",
+                "ordering": ["period_start"],
+            },
+        ),
+    ]
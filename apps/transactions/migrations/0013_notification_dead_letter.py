@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-18 18:50
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0012_archive_segment"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NotificationDeadLetter",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="Создано")),
+                ("updated_at", models.DateTimeField(auto_now=True, verbose_name="Обновлено")),
+                ("transfer_id", models.UUIDField(db_index=True, verbose_name="Перевод")),
+                ("payload", models.JSONField(verbose_name="Уведомление")),
+                ("attempts", models.PositiveIntegerField(default=0, verbose_name="Попыток")),
+                ("error", models.TextField(blank=True, verbose_name="Последняя ошибка")),
+            ],
+            options={
+                "verbose_name": "Неотправленное уведомление",
+                "verbose_name_plural": "Неотправленные уведомления",
+                "ordering": ["created_at"],
+            },
+        ),
+    ]
@@ -0,0 +1,218 @@
+# Generated by Django 6.0 on 2026-10-18 19:45
+
+import uuid
+from importlib import import_module
+
+from django.db import migrations, models
+
+PREVIOUS_SQL = import_module("apps.transactions.migrations.0010_transaction_balance_after").TRANSFER_FUNDS_SQL
+
+# Событие outbox пишется в той же транзакции, что и перевод
+TRANSFER_FUNDS_SQL = """
+CREATE OR REPLACE FUNCTION transactions_transfer_funds(
+    p_from_wallet_id uuid,
+    p_to_wallet_id uuid,
+    p_amount numeric,
+    p_fee numeric,
+    p_idempotency_key varchar,
+    p_fee_shard integer,
+    p_coalesce_wait_ms integer
+)
+RETURNS TABLE (
+    id uuid,
+    created_at timestamptz,
+    updated_at timestamptz,
+    amount numeric,
+    fee numeric,
+    idempotency_key varchar,
+    from_wallet_id uuid,
+    to_wallet_id uuid,
+    created boolean
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_admin_balance_after numeric;
+    v_admin_wallet_id uuid;
+    v_credit numeric := p_amount + p_fee;
+    v_credit_admin boolean := p_fee > 0 AND p_fee_shard IS NULL;
+    v_from_balance numeric;
+    v_from_balance_after numeric;
+    v_lock_timeout text;
+    v_locked integer;
+    v_now timestamptz := now();
+    v_to_balance_after numeric;
+    v_transfer transactions_transfer%ROWTYPE;
+BEGIN
+    SELECT w.id INTO v_admin_wallet_id FROM transactions_wallet w WHERE w.is_admin_wallet;
+    IF v_admin_wallet_id IS NULL THEN
+        RAISE EXCEPTION 'Админский кошелёк не найден' USING ERRCODE = 'FT004';
+    END IF;
+
+    IF v_admin_wallet_id IN (p_from_wallet_id, p_to_wallet_id) THEN
+        RAISE EXCEPTION 'Админский кошелёк не может участвовать в переводах' USING ERRCODE = 'FT001';
+    END IF;
+
+    -- Конкурентные дубли (тот же from_wallet + idempotency_key) ждут первый запрос
+    -- и получают его перевод вместо гонки за строки балансов
+    IF p_coalesce_wait_ms > 0 THEN
+        v_lock_timeout := current_setting('lock_timeout');
+        PERFORM set_config('lock_timeout', p_coalesce_wait_ms || 'ms', true);
+        BEGIN
+            PERFORM pg_advisory_xact_lock(hashtextextended(p_from_wallet_id::text || ':' || p_idempotency_key, 0));
+        EXCEPTION WHEN lock_not_available THEN
+            RAISE EXCEPTION 'Перевод с этим ключом идемпотентности ещё выполняется' USING ERRCODE = 'FT006';
+        END;
+        PERFORM set_config('lock_timeout', v_lock_timeout, true);
+
+        SELECT t.* INTO v_transfer
+        FROM transactions_transfer t
+        WHERE t.from_wallet_id = p_from_wallet_id AND t.idempotency_key = p_idempotency_key;
+
+        IF FOUND THEN
+            IF (v_transfer.to_wallet_id, v_transfer.amount, v_transfer.fee) IS DISTINCT FROM (p_to_wallet_id, p_amount, p_fee) THEN
+                RAISE EXCEPTION 'Невозможно выполнить перевод (констрейнт)' USING ERRCODE = 'FT003';
+            END IF;
+
+            RETURN QUERY SELECT
+                v_transfer.id, v_transfer.created_at, v_transfer.updated_at, v_transfer.amount, v_transfer.fee,
+                v_transfer.idempotency_key, v_transfer.from_wallet_id, v_transfer.to_wallet_id, false;
+            RETURN;
+        END IF;
+    END IF;
+
+    -- Блокировки в порядке wallet_id, как и в ORM-движке
+    SELECT count(*) INTO v_locked FROM (
+        SELECT b.wallet_id
+        FROM transactions_walletbalance b
+        WHERE b.wallet_id IN (
+            p_from_wallet_id,
+            p_to_wallet_id,
+            CASE WHEN v_credit_admin THEN v_admin_wallet_id END
+        )
+        ORDER BY b.wallet_id
+        FOR UPDATE
+    ) locked;
+
+    -- Существование кошельков проверяется по их балансам, DETAIL - id ненайденного кошелька
+    SELECT b.balance INTO v_from_balance FROM transactions_walletbalance b WHERE b.wallet_id = p_from_wallet_id;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Кошелёк не найден' USING ERRCODE = 'FT005', DETAIL = p_from_wallet_id::text;
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM transactions_walletbalance b WHERE b.wallet_id = p_to_wallet_id) THEN
+        RAISE EXCEPTION 'Кошелёк не найден' USING ERRCODE = 'FT005', DETAIL = p_to_wallet_id::text;
+    END IF;
+
+    IF v_locked < 2 + v_credit_admin::integer THEN
+        RAISE EXCEPTION 'Баланс админского кошелька не найден' USING ERRCODE = 'FT005', DETAIL = v_admin_wallet_id::text;
+    END IF;
+
+    IF v_from_balance < v_credit THEN
+        RAISE EXCEPTION 'Недостаточно минералов' USING ERRCODE = 'FT002';
+    END IF;
+
+    INSERT INTO transactions_transfer AS t (
+        id, created_at, updated_at, amount, fee, idempotency_key, from_wallet_id, to_wallet_id
+    )
+    VALUES (
+        gen_random_uuid(), v_now, v_now, p_amount, p_fee, p_idempotency_key, p_from_wallet_id, p_to_wallet_id
+    )
+    ON CONFLICT ON CONSTRAINT unique_transfer DO NOTHING
+    RETURNING t.* INTO v_transfer;
+
+    IF v_transfer.id IS NULL THEN
+        SELECT t.* INTO v_transfer
+        FROM transactions_transfer t
+        WHERE t.from_wallet_id = p_from_wallet_id AND t.idempotency_key = p_idempotency_key;
+
+        IF (v_transfer.to_wallet_id, v_transfer.amount, v_transfer.fee) IS DISTINCT FROM (p_to_wallet_id, p_amount, p_fee) THEN
+            RAISE EXCEPTION 'Невозможно выполнить перевод (констрейнт)' USING ERRCODE = 'FT003';
+        END IF;
+
+        RETURN QUERY SELECT
+            v_transfer.id, v_transfer.created_at, v_transfer.updated_at, v_transfer.amount, v_transfer.fee,
+            v_transfer.idempotency_key, v_transfer.from_wallet_id, v_transfer.to_wallet_id, false;
+        RETURN;
+    END IF;
+
+    UPDATE transactions_walletbalance b
+    SET balance = b.balance - v_credit, version = b.version + 1
+    WHERE b.wallet_id = p_from_wallet_id
+    RETURNING b.balance INTO v_from_balance_after;
+
+    UPDATE transactions_walletbalance b
+    SET balance = b.balance + p_amount, version = b.version + 1
+    WHERE b.wallet_id = p_to_wallet_id
+    RETURNING b.balance INTO v_to_balance_after;
+
+    IF p_fee > 0 THEN
+        IF v_credit_admin THEN
+            UPDATE transactions_walletbalance b
+            SET balance = b.balance + p_fee, version = b.version + 1
+            WHERE b.wallet_id = v_admin_wallet_id
+            RETURNING b.balance INTO v_admin_balance_after;
+        ELSE
+            INSERT INTO transactions_feeshard AS s (id, created_at, updated_at, shard, balance)
+            VALUES (gen_random_uuid(), v_now, v_now, p_fee_shard, p_fee)
+            ON CONFLICT (shard) DO UPDATE SET balance = s.balance + EXCLUDED.balance;
+        END IF;
+    END IF;
+
+    -- Комиссия в шарде не меняет баланс админского кошелька, её balance_after остаётся пустым
+    INSERT INTO transactions_transaction (
+        id, created_at, updated_at, wallet_id, transfer_id, flow, amount, balance_after
+    )
+    SELECT gen_random_uuid(), v_now, v_now, entry.wallet_id, v_transfer.id, entry.flow, entry.amount, entry.balance_after
+    FROM (
+        VALUES
+            (p_from_wallet_id, 'credit', v_credit, v_from_balance_after),
+            (p_to_wallet_id, 'debit', p_amount, v_to_balance_after),
+            (v_admin_wallet_id, 'fee', p_fee, v_admin_balance_after)
+    ) AS entry (wallet_id, flow, amount, balance_after)
+    WHERE entry.amount > 0;
+
+    INSERT INTO transactions_outboxevent (id, created_at, updated_at, kind, transfer_id)
+    VALUES (gen_random_uuid(), v_now, v_now, 'transfer_created', v_transfer.id);
+
+    RETURN QUERY SELECT
+        v_transfer.id, v_transfer.created_at, v_transfer.updated_at, v_transfer.amount, v_transfer.fee,
+        v_transfer.idempotency_key, v_transfer.from_wallet_id, v_transfer.to_wallet_id, true;
+END;
+$$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0013_notification_dead_letter"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutboxEvent",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="Создано")),
+                ("updated_at", models.DateTimeField(auto_now=True, verbose_name="Обновлено")),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("transfer_created", "Перевод создан")], max_length=32, verbose_name="Событие"
+                    ),
+                ),
+                ("transfer_id", models.UUIDField(verbose_name="Перевод")),
+            ],
+            options={
+                "verbose_name": "Событие outbox",
+                "verbose_name_plural": "События outbox",
+                "indexes": [models.Index(fields=["created_at"], name="outbox_event_created_at")],
+            },
+        ),
+        migrations.RunSQL(
+            sql=[TRANSFER_FUNDS_SQL],
+            reverse_sql=[PREVIOUS_SQL],
+        ),
+    ]
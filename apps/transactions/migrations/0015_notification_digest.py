@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 20:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0014_outbox_event"),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name="notificationdeadletter",
+            old_name="transfer_id",
+            new_name="key",
+        ),
+        migrations.AlterField(
+            model_name="notificationdeadletter",
+            name="key",
+            field=models.UUIDField(db_index=True, verbose_name="Ключ уведомления"),
+        ),
+    ]
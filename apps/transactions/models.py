@@ -2,6 +2,7 @@ import uuid
 from decimal import Decimal
 
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
 
 
@@ -81,6 +82,27 @@ class WalletBalance(BaseModel):
         return f"Баланс кошелька {self.wallet}"
 
 
+class FeeShard(BaseModel):
+
+    shard = models.PositiveSmallIntegerField(
+        unique=True,
+        verbose_name="Шард",
+    )
+    balance = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=Decimal("0.00"),
+        verbose_name="Накопленная комиссия",
+    )
+
+    class Meta:
+        verbose_name = "Шард комиссий"
+        verbose_name_plural = "Шарды комиссий"
+
+    def __str__(self):
+        return f"Шард комиссий #{self.shard}"
+
+
 class Transfer(BaseModel):
 
     from_wallet = models.ForeignKey(
@@ -152,10 +174,257 @@ class Transaction(BaseModel):
         decimal_places=2,
         verbose_name="Сумма",
     )
+    # Пусто у комиссий, копящихся в шардах (баланс админского кошелька при этом не меняется),
+    # и у старых проводок до backfill_balance_after
+    balance_after = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name="Баланс после операции",
+    )
 
     class Meta:
+        # Таблица партиционирована по месяцам created_at (0011_partition_transaction, partitions.py),
+        # первичный ключ в БД - (id, created_at), для ORM ключом остаётся id
         verbose_name = "Транзакция"
         verbose_name_plural = "Транзакции"
+        indexes = [
+            # История кошелька (keyset по created_at, id): index-only scan без сортировки в памяти
+            models.Index(
+                fields=["wallet", "-created_at", "-id"],
+                include=["transfer", "flow", "amount"],
+                name="transaction_wallet_history",
+            ),
+            # Выборки за период по всем кошелькам (снимки балансов): проводки пишутся по порядку времени,
+            # поэтому BRIN в несколько страниц заменяет B-tree
+            BrinIndex(fields=["created_at"], name="transaction_created_at_brin"),
+        ]
 
     def __str__(self):
         return f"{str(self.transfer.from_wallet_id)[:6]} -> {str(self.transfer.to_wallet_id)[:6]}"
+
+
+class LedgerTotal(BaseModel):
+
+    wallet = models.OneToOneField(
+        Wallet,
+        on_delete=models.PROTECT,
+        verbose_name="Кошелёк",
+    )
+    opening = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal("0.00"),
+        verbose_name="Баланс без проводок на первой сверке",
+    )
+    total = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal("0.00"),
+        verbose_name="Сумма проводок",
+    )
+    through = models.DateTimeField(
+        verbose_name="Учтены проводки до",
+    )
+
+    class Meta:
+        verbose_name = "Итог проводок кошелька"
+        verbose_name_plural = "Итоги проводок кошельков"
+
+    def __str__(self):
+        return f"Итог проводок {str(self.wallet_id)[:6]}"
+
+
+class ReconciliationRun(BaseModel):
+
+    class Status(models.TextChoices):
+        running = "running", "Выполняется"
+        succeeded = "succeeded", "Выполнена"
+        failed = "failed", "Ошибка"
+
+    status = models.CharField(
+        choices=Status.choices,
+        default=Status.running,
+        verbose_name="Статус",
+    )
+    cutoff = models.DateTimeField(
+        verbose_name="Проводки учтены до",
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Завершено",
+    )
+    wallets_checked = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Проверено кошельков",
+    )
+    transactions_processed = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name="Обработано проводок",
+    )
+    discrepancies_found = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Найдено расхождений",
+    )
+
+    class Meta:
+        verbose_name = "Сверка"
+        verbose_name_plural = "Сверки"
+
+    def __str__(self):
+        return f"Сверка {self.created_at:%Y-%m-%d %H:%M} ({self.get_status_display()})"
+
+
+class ReconciliationDiscrepancy(BaseModel):
+
+    run = models.ForeignKey(
+        ReconciliationRun,
+        on_delete=models.CASCADE,
+        related_name="discrepancies",
+        verbose_name="Сверка",
+    )
+    wallet = models.ForeignKey(
+        Wallet,
+        on_delete=models.PROTECT,
+        verbose_name="Кошелёк",
+    )
+    balance = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        verbose_name="Баланс",
+    )
+    expected = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        verbose_name="Ожидаемый баланс по проводкам",
+    )
+
+    class Meta:
+        verbose_name = "Расхождение сверки"
+        verbose_name_plural = "Расхождения сверки"
+
+    def __str__(self):
+        return f"Расхождение {str(self.wallet_id)[:6]}: {self.balance} != {self.expected}"
+
+
+class WalletBalanceSnapshot(BaseModel):
+
+    wallet = models.ForeignKey(
+        Wallet,
+        on_delete=models.PROTECT,
+        verbose_name="Кошелёк",
+    )
+    day = models.DateField(
+        verbose_name="День",
+    )
+    balance = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        verbose_name="Баланс на конец дня",
+    )
+
+    class Meta:
+        verbose_name = "Снимок баланса"
+        verbose_name_plural = "Снимки балансов"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["wallet", "day"],
+                name="unique_wallet_balance_snapshot",
+            )
+        ]
+
+    def __str__(self):
+        return f"Баланс {str(self.wallet_id)[:6]} на {self.day}"
+
+
+class ArchiveSegment(BaseModel):
+
+    period_start = models.DateTimeField(
+        verbose_name="Начало периода",
+    )
+    period_end = models.DateTimeField(
+        verbose_name="Конец периода",
+    )
+    name = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name="Файл сегмента",
+    )
+    transactions = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name="Проводок",
+    )
+    transfers = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name="Переводов",
+    )
+    size = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name="Размер, байт",
+    )
+
+    class Meta:
+        verbose_name = "Сегмент архива"
+        verbose_name_plural = "Сегменты архива"
+        ordering = ["period_start"]
+
+    def __str__(self):
+        return f"Архив {self.period_start:%Y-%m-%d} - {self.period_end:%Y-%m-%d}"
+
+
+class NotificationDeadLetter(BaseModel):
+
+    # id перевода или дайджеста (уведомления о нескольких переводах получателю), он же Idempotency-Key.
+    # Без внешнего ключа: перевод может уйти в архив раньше, чем уведомление отправят повторно
+    key = models.UUIDField(
+        db_index=True,
+        verbose_name="Ключ уведомления",
+    )
+    payload = models.JSONField(
+        verbose_name="Уведомление",
+    )
+    attempts = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Попыток",
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name="Последняя ошибка",
+    )
+
+    class Meta:
+        verbose_name = "Неотправленное уведомление"
+        verbose_name_plural = "Неотправленные уведомления"
+        ordering = ["created_at"]
+
+    def __str__(self):
+        return f"Уведомление {str(self.key)[:6]}"
+
+
+class OutboxEvent(BaseModel):
+
+    class Kind(models.TextChoices):
+        transfer_created = "transfer_created", "Перевод создан"
+
+    kind = models.CharField(
+        max_length=32,
+        choices=Kind.choices,
+        verbose_name="Событие",
+    )
+    # Без внешнего ключа: событие пишется и в функции transactions_transfer_funds, а после публикации удаляется
+    transfer_id = models.UUIDField(
+        verbose_name="Перевод",
+    )
+
+    class Meta:
+        # Пишется в транзакции перевода, публикуется и удаляется relay_outbox
+        verbose_name = "Событие outbox"
+        verbose_name_plural = "События outbox"
+        indexes = [
+            models.Index(fields=["created_at"], name="outbox_event_created_at"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {str(self.transfer_id)[:6]}"
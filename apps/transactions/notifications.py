@@ -0,0 +1,428 @@
+import abc
+import asyncio
+import collections
+import dataclasses
+import logging
+import random
+import time
+import uuid
+from collections.abc import Iterable
+
+import aiohttp
+import redis
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.utils.module_loading import import_string
+
+from apps.core.redis_client import get_redis
+from . import metrics
+from .models import NotificationDeadLetter, Transfer
+
+logger = logging.getLogger("transactions")
+logger.setLevel(logging.DEBUG)
+
+
+# Получатель за окно NOTIFICATION_DIGEST_WINDOW уже получил больше NOTIFICATION_DIGEST_THRESHOLD уведомлений:
+# новые переводы копятся в буфере получателя до конца окна или NOTIFICATION_DIGEST_MAX_SIZE штук.
+# Из пачки сразу уходят только переводы до порога, в буфер - остальные. Получатель с непустым буфером - в sorted set
+# KEYS[4] со временем первого перевода в буфере: по нему recover_digests найдёт буфер, чья отправка потерялась.
+# Ответ: {действие, сколько первых переводов пачки отправить сразу}; действие: 0 - отправить сразу,
+# 1 - первые в буфере (запланировать отправку), 2 - буфер полон, 3 - в буфере
+DIGEST_BUFFER_SCRIPT = """
+local size = #ARGV - 6
+local count = redis.call("INCRBY", KEYS[1], size)
+if count == size then
+    redis.call("PEXPIRE", KEYS[1], ARGV[1])
+end
+local immediate = math.max(0, math.min(size, tonumber(ARGV[2]) - (count - size)))
+if immediate == size then
+    return {0, size}
+end
+local buffered = redis.call("RPUSH", KEYS[2], unpack(ARGV, 7 + immediate))
+redis.call("ZADD", KEYS[4], "NX", ARGV[5], ARGV[6])
+if buffered >= tonumber(ARGV[3]) then
+    return {2, immediate}
+end
+if redis.call("SET", KEYS[3], 1, "NX", "PX", ARGV[4]) then
+    return {1, immediate}
+end
+return {3, immediate}
+"""
+# Буфер переносится в processing-список получателя и удаляется из него только после отправки (DIGEST_ACK_SCRIPT).
+# Получатель с непустым списком - в sorted set KEYS[4] со временем последнего сбора. Если сбор свежее
+# ARGV[3] мс, начало списка ещё отправляет другой воркер и забирается только перенесённое сейчас,
+# иначе - весь список, включая оставшееся от упавшего воркера
+DIGEST_TAKE_SCRIPT = """
+local start = 0
+local taken_at = redis.call("ZSCORE", KEYS[4], ARGV[1])
+if taken_at and tonumber(taken_at) > tonumber(ARGV[2]) - tonumber(ARGV[3]) then
+    start = redis.call("LLEN", KEYS[3])
+end
+while redis.call("LMOVE", KEYS[1], KEYS[3], "LEFT", "RIGHT") do
+end
+redis.call("DEL", KEYS[1], KEYS[2])
+redis.call("ZREM", KEYS[5], ARGV[1])
+local ids = redis.call("LRANGE", KEYS[3], start, -1)
+if #ids > 0 then
+    redis.call("ZADD", KEYS[4], ARGV[2], ARGV[1])
+end
+return ids
+"""
+DIGEST_ACK_SCRIPT = """
+for index = 2, #ARGV do
+    redis.call("LREM", KEYS[1], 1, ARGV[index])
+end
+if redis.call("LLEN", KEYS[1]) == 0 then
+    redis.call("ZREM", KEYS[2], ARGV[1])
+end
+return 0
+"""
+
+SEND_NOW, DIGEST_SCHEDULE, DIGEST_FULL, DIGEST_BUFFERED = range(4)
+
+
+@dataclasses.dataclass(frozen=True)
+class Notification:
+    # id перевода или дайджеста, он же Idempotency-Key у получателя
+    key: uuid.UUID
+    payload: dict
+
+
+@dataclasses.dataclass
+class DispatchResult:
+    sent: int = 0
+    dead: list[NotificationDeadLetter] = dataclasses.field(default_factory=list)
+    # Получатели, у которых начался буфер дайджеста: его отправку нужно запланировать через окно
+    scheduled: list[uuid.UUID] = dataclasses.field(default_factory=list)
+
+
+class Transport(abc.ABC):
+    """
+    Доставка одного уведомления. Исключение из send - неудачная попытка, она будет повторена.
+    """
+
+    @abc.abstractmethod
+    async def send(self, notification: Notification) -> None: ...
+
+    async def aclose(self) -> None:
+        pass
+
+
+class LogTransport(Transport):
+    async def send(self, notification: Notification) -> None:
+        logger.debug(f"Уведомление {notification.key}: {notification.payload}")
+
+
+class HttpTransport(Transport):
+    def __init__(self, url: str = None, timeout: float = None, concurrency: int = None):
+        self.url = url or settings.NOTIFICATION_URL
+        self.timeout = aiohttp.ClientTimeout(total=timeout or settings.NOTIFICATION_TIMEOUT)
+        self.concurrency = concurrency or settings.NOTIFICATION_CONCURRENCY
+        self.session = None
+
+    async def send(self, notification: Notification) -> None:
+        if self.session is None:
+            # Сессия привязана к event loop, поэтому создаётся в нём, а не в __init__
+            self.session = aiohttp.ClientSession(
+                timeout=self.timeout, connector=aiohttp.TCPConnector(limit=self.concurrency)
+            )
+
+        # Повтор после таймаута может дойти дважды, получатель отсекает дубли по ключу
+        async with self.session.post(
+            self.url, json=notification.payload, headers={"Idempotency-Key": str(notification.key)}
+        ) as response:
+            response.raise_for_status()
+
+    async def aclose(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+
+
+def get_transport() -> Transport:
+    return import_string(settings.NOTIFICATION_TRANSPORT)()
+
+
+@dataclasses.dataclass(frozen=True)
+class NotificationDispatcher:
+    """
+    Отправляет уведомления конкурентно в одном event loop: в полёте до concurrency штук, ожидание ответа
+    и паузы между попытками не занимают ни процесс, ни поток воркера.
+    """
+
+    transport: Transport
+    concurrency: int
+    max_attempts: int
+    base_delay: float
+    max_delay: float
+
+    @classmethod
+    def from_settings(cls, transport: Transport) -> "NotificationDispatcher":
+        return cls(
+            transport=transport,
+            concurrency=settings.NOTIFICATION_CONCURRENCY,
+            max_attempts=settings.NOTIFICATION_MAX_ATTEMPTS,
+            base_delay=settings.NOTIFICATION_RETRY_BASE_DELAY,
+            max_delay=settings.NOTIFICATION_RETRY_MAX_DELAY,
+        )
+
+    def backoff(self, attempt: int) -> float:
+        # Экспоненциальная задержка с full jitter: повторы к упавшему получателю не приходят одной волной
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    async def dispatch(self, notifications: Iterable[Notification]) -> DispatchResult:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        dead = await asyncio.gather(*(self.deliver(semaphore, notification) for notification in notifications))
+
+        result = DispatchResult(dead=[letter for letter in dead if letter is not None])
+        result.sent = len(dead) - len(result.dead)
+        return result
+
+    async def deliver(self, semaphore: asyncio.Semaphore, notification: Notification) -> NotificationDeadLetter | None:
+        attempt = 1
+        while True:
+            async with semaphore:
+                try:
+                    await self.transport.send(notification)
+                except Exception as exception:
+                    # Транспорт подключаемый, поэтому неудачей считается любое его исключение
+                    error = repr(exception)
+                else:
+                    metrics.NOTIFICATIONS.labels("sent").inc()
+                    return None
+
+            if attempt >= self.max_attempts:
+                logger.warning(f"Уведомление {notification.key} не отправлено: {error}")
+                metrics.NOTIFICATIONS.labels("dead").inc()
+                return NotificationDeadLetter(
+                    key=notification.key,
+                    payload=notification.payload,
+                    attempts=attempt,
+                    error=error,
+                )
+
+            # Пауза - вне семафора: слот занимает только запрос
+            await asyncio.sleep(self.backoff(attempt))
+            metrics.NOTIFICATION_RETRIES.inc()
+            attempt += 1
+
+
+async def _dispatch(notifications: list[Notification]) -> DispatchResult:
+    transport = get_transport()
+    try:
+        return await NotificationDispatcher.from_settings(transport).dispatch(notifications)
+    finally:
+        await transport.aclose()
+
+
+def notification_payload(transfer: Transfer) -> dict:
+    return {
+        "transfer": str(transfer.id),
+        "recipient": transfer.to_wallet.user_id,
+        "from_wallet": str(transfer.from_wallet_id),
+        "to_wallet": str(transfer.to_wallet_id),
+        "amount": str(transfer.amount),
+        "created_at": transfer.created_at.isoformat(),
+    }
+
+
+def digest_payload(transfers: list[Transfer]) -> dict:
+    return {
+        "recipient": transfers[0].to_wallet.user_id,
+        "to_wallet": str(transfers[0].to_wallet_id),
+        "count": len(transfers),
+        "transfers": [notification_payload(transfer) for transfer in transfers],
+    }
+
+
+def digest_keys(wallet_id: uuid.UUID) -> list[str]:
+    prefix = f"{settings.NOTIFICATION_DIGEST_PREFIX}:{wallet_id}"
+    return [f"{prefix}:rate", f"{prefix}:buffer", f"{prefix}:scheduled", f"{prefix}:processing"]
+
+
+def digests_in_progress_key() -> str:
+    return f"{settings.NOTIFICATION_DIGEST_PREFIX}:processing"
+
+
+def digests_buffered_key() -> str:
+    return f"{settings.NOTIFICATION_DIGEST_PREFIX}:buffered"
+
+
+def buffer_for_digest(wallet_id: uuid.UUID, transfer_ids: list[uuid.UUID]) -> tuple[int, int]:
+    """
+    Возвращает действие и сколько первых transfer_ids отправить сразу, остальные уже в буфере получателя.
+    """
+    window = settings.NOTIFICATION_DIGEST_WINDOW
+    if window <= 0:
+        return SEND_NOW, len(transfer_ids)
+
+    # Отправка буфера может потеряться (воркер упал): флаг истекает, и следующий перевод запланирует её снова
+    args = [int(window * 1000), settings.NOTIFICATION_DIGEST_THRESHOLD, settings.NOTIFICATION_DIGEST_MAX_SIZE]
+    args += [int(window * 10 * 1000), int(time.time() * 1000), str(wallet_id)]
+    args += [str(transfer_id) for transfer_id in transfer_ids]
+    keys = [*digest_keys(wallet_id)[:3], digests_buffered_key()]
+    try:
+        action, immediate = get_redis().eval(DIGEST_BUFFER_SCRIPT, 4, *keys, *args)
+    except redis.RedisError as exception:
+        logger.warning(f"Redis недоступен, уведомления отправляются без дайджеста: {exception!r}")
+        return SEND_NOW, len(transfer_ids)
+
+    return action, immediate
+
+
+def take_digests(wallet_ids: Iterable[uuid.UUID]) -> dict[uuid.UUID, list[bytes]]:
+    """
+    Забирает буферы получателей в их processing-списки. До ack_digests переводы остаются в Redis.
+    """
+    now = int(time.time() * 1000)
+    recover_after = int(settings.NOTIFICATION_DIGEST_RECOVER_AFTER * 1000)
+    taken = {}
+    for wallet_id in wallet_ids:
+        keys = [*digest_keys(wallet_id)[1:], digests_in_progress_key(), digests_buffered_key()]
+        buffered = get_redis().eval(DIGEST_TAKE_SCRIPT, 5, *keys, str(wallet_id), now, recover_after)
+        if buffered:
+            taken[wallet_id] = buffered
+    return taken
+
+
+def ack_digests(taken: dict[uuid.UUID, list[bytes]]) -> None:
+    for wallet_id, buffered in taken.items():
+        keys = [digest_keys(wallet_id)[3], digests_in_progress_key()]
+        get_redis().eval(DIGEST_ACK_SCRIPT, 2, *keys, str(wallet_id), *buffered)
+
+
+def digest_notifications(taken: dict[uuid.UUID, list[bytes]]) -> list[Notification]:
+    """
+    Собирает по дайджесту на получателя из забранных буферов, переводы - одним запросом.
+    """
+    transfer_ids = [uuid.UUID(value.decode()) for buffered in taken.values() for value in buffered]
+    if not transfer_ids:
+        return []
+
+    by_wallet = collections.defaultdict(list)
+    transfers = (
+        Transfer.objects.filter(id__in=transfer_ids)
+        .select_related("from_wallet", "to_wallet")
+        .order_by("created_at", "id")
+    )
+    for transfer in transfers:
+        by_wallet[transfer.to_wallet_id].append(transfer)
+
+    notifications = []
+    for transfers in by_wallet.values():
+        if len(transfers) == 1:
+            notifications.append(Notification(transfers[0].id, notification_payload(transfers[0])))
+            continue
+
+        # Ключ зависит от состава: повторная отправка того же дайджеста отсекается получателем
+        key = uuid.uuid5(uuid.NAMESPACE_OID, ",".join(sorted(str(transfer.id) for transfer in transfers)))
+        notifications.append(Notification(key, digest_payload(transfers)))
+
+    return notifications
+
+
+def send_digests(wallet_ids: Iterable[uuid.UUID], notifications: list[Notification] = None) -> DispatchResult:
+    """
+    Отправляет дайджесты получателей (вместе с notifications). Буфер удаляется из Redis только после отправки
+    или записи в NotificationDeadLetter: упавший воркер ничего не теряет, дайджест соберёт recover_digests.
+    """
+    taken = take_digests(wallet_ids)
+    result = send_notifications([*(notifications or []), *digest_notifications(taken)])
+    ack_digests(taken)
+    return result
+
+
+def send_notifications(notifications: list[Notification]) -> DispatchResult:
+    if not notifications:
+        return DispatchResult()
+
+    result = asyncio.run(_dispatch(notifications))
+    NotificationDeadLetter.objects.bulk_create(result.dead)
+
+    logger.debug(f"Уведомления: отправлено {result.sent}, не отправлено {len(result.dead)}")
+    return result
+
+
+def dispatch_notifications(transfer_ids: Iterable[uuid.UUID]) -> DispatchResult:
+    """
+    Уведомляет получателей переводов. Получатель с небольшим потоком переводов получает уведомление
+    о каждом сразу, самым загруженным уходит дайджест за окно NOTIFICATION_DIGEST_WINDOW.
+    Не доставленные за NOTIFICATION_MAX_ATTEMPTS попыток сохраняются в NotificationDeadLetter.
+    """
+    transfers = (
+        Transfer.objects.filter(id__in=list(transfer_ids))
+        .select_related("from_wallet", "to_wallet")
+        .order_by("created_at", "id")
+    )
+    by_wallet = collections.defaultdict(list)
+    for transfer in transfers:
+        by_wallet[transfer.to_wallet_id].append(transfer)
+
+    notifications = []
+    scheduled = []
+    full = []
+    for wallet_id, wallet_transfers in by_wallet.items():
+        action, immediate = buffer_for_digest(wallet_id, [transfer.id for transfer in wallet_transfers])
+        # Переводы до порога - сразу, даже если остальные из той же пачки ушли в буфер
+        notifications += [
+            Notification(transfer.id, notification_payload(transfer)) for transfer in wallet_transfers[:immediate]
+        ]
+        if action == DIGEST_SCHEDULE:
+            scheduled.append(wallet_id)
+        elif action == DIGEST_FULL:
+            full.append(wallet_id)
+
+    result = send_digests(full, notifications)
+    result.scheduled = scheduled
+    return result
+
+
+def flush_digests(wallet_ids: Iterable[uuid.UUID]) -> DispatchResult:
+    return send_digests(wallet_ids)
+
+
+def recover_digests() -> DispatchResult:
+    """
+    Досылает потерянные дайджесты: забранные дольше NOTIFICATION_DIGEST_RECOVER_AFTER секунд назад и так и не
+    подтверждённые (воркер упал между сбором и отправкой) и буферы, которые ждут дольше окна
+    NOTIFICATION_DIGEST_RECOVER_AFTER секунд (задача flush_notification_digest потерялась).
+    """
+    now = time.time()
+    grace = settings.NOTIFICATION_DIGEST_RECOVER_AFTER
+    client = get_redis()
+    unacked = client.zrangebyscore(digests_in_progress_key(), "-inf", (now - grace) * 1000)
+    stale = client.zrangebyscore(
+        digests_buffered_key(), "-inf", (now - settings.NOTIFICATION_DIGEST_WINDOW - grace) * 1000
+    )
+    wallet_ids = list(dict.fromkeys(uuid.UUID(value.decode()) for value in [*unacked, *stale]))
+    if wallet_ids:
+        logger.warning(
+            f"Дайджесты: досылаются буферы {len(wallet_ids)} получателей "
+            f"(не подтверждено {len(unacked)}, не отправлено вовремя {len(stale)})"
+        )
+    return send_digests(wallet_ids)
+
+
+def redeliver_dead_letters(limit: int = None) -> DispatchResult:
+    """
+    Повторно отправляет неотправленные уведомления (старые первыми), снова не доставленные остаются в таблице.
+    """
+    letters = NotificationDeadLetter.objects.all()
+    letters = list(letters[:limit] if limit else letters)
+    notifications = [Notification(letter.key, letter.payload) for letter in letters]
+    result = asyncio.run(_dispatch(notifications))
+
+    failed = {letter.key: letter for letter in result.dead}
+    for letter in letters:
+        if letter.key in failed:
+            letter.attempts += failed[letter.key].attempts
+            letter.error = failed[letter.key].error
+
+    with db_transaction.atomic():
+        NotificationDeadLetter.objects.filter(
+            id__in=[letter.id for letter in letters if letter.key not in failed]
+        ).delete()
+        NotificationDeadLetter.objects.bulk_update(
+            [letter for letter in letters if letter.key in failed], ["attempts", "error"]
+        )
+
+    return result
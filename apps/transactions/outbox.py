@@ -0,0 +1,67 @@
+import logging
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction as db_transaction
+
+from .models import OutboxEvent
+from .tasks import notify_recipients
+
+logger = logging.getLogger("transactions")
+logger.setLevel(logging.DEBUG)
+
+
+def publish_transfers_created(events: list[OutboxEvent]) -> None:
+    # Одно сообщение брокеру на пачку: диспетчер уведомлений отправит её конкурентно
+    notify_recipients.apply_async(kwargs={"transfer_ids": [event.transfer_id for event in events]})
+
+
+PUBLISHERS = {
+    OutboxEvent.Kind.transfer_created: publish_transfers_created,
+}
+
+
+def relay_outbox(batch_size: int = None) -> int:
+    """
+    Публикует и удаляет до batch_size старейших событий. Строки, захваченные другим relay, пропускаются
+    (SKIP LOCKED), поэтому relay можно запускать в несколько процессов. Если публикация упала,
+    события остаются в outbox; если упал коммит после публикации - событие будет опубликовано повторно.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    with db_transaction.atomic():
+        events = list(OutboxEvent.objects.select_for_update(skip_locked=True).order_by("created_at")[:batch_size])
+        if not events:
+            return 0
+
+        for kind, publish in PUBLISHERS.items():
+            kind_events = [event for event in events if event.kind == kind]
+            if kind_events:
+                publish(kind_events)
+
+        OutboxEvent.objects.filter(id__in=[event.id for event in events]).delete()
+
+    logger.debug(f"Outbox: опубликовано {len(events)} событий")
+    return len(events)
+
+
+def run_relay(batch_size: int = None, poll_interval: float = None) -> None:
+    # Пока outbox не пуст - пачка за пачкой без пауз, пустой опрашивается раз в poll_interval.
+    # Ошибка брокера или БД не останавливает relay: пауза растёт до OUTBOX_ERROR_MAX_DELAY, события ждут в outbox
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    poll_interval = settings.OUTBOX_POLL_INTERVAL if poll_interval is None else poll_interval
+    errors = 0
+    while True:
+        try:
+            published = relay_outbox(batch_size)
+        except Exception:
+            errors += 1
+            delay = min(settings.OUTBOX_ERROR_MAX_DELAY, settings.OUTBOX_ERROR_BASE_DELAY * 2 ** (errors - 1))
+            logger.exception(f"Outbox: ошибка публикации (подряд {errors}), повтор через {delay:.1f} с")
+            # Соединение могло оборваться - следующая попытка откроет новое
+            close_old_connections()
+            time.sleep(delay)
+            continue
+
+        errors = 0
+        if published < batch_size:
+            time.sleep(poll_interval)
@@ -0,0 +1,64 @@
+import base64
+import datetime
+import json
+import uuid
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Страницы по (created_at, id) по убыванию: следующая страница начинается строго после последней записи
+    предыдущей, поэтому глубина страницы не влияет на стоимость запроса (без OFFSET).
+    """
+
+    cursor_query_param = "cursor"
+    limit_query_param = "limit"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        limit = self.get_limit(request)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            created_at, pk = self.decode_cursor(cursor)
+            # created_at <= X задаёт диапазон по индексу, вторая часть отсекает уже отданные записи с тем же created_at
+            queryset = queryset.filter(Q(created_at__lte=created_at) & (Q(created_at__lt=created_at) | Q(id__lt=pk)))
+
+        page = list(queryset.order_by("-created_at", "-id")[: limit + 1])
+        self.next_cursor = self.encode_cursor(page[limit - 1]) if len(page) > limit else None
+        return page[:limit]
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get(self.limit_query_param, settings.WALLET_HISTORY_PAGE_SIZE))
+        except ValueError as exception:
+            raise ValidationError({self.limit_query_param: ["Ожидается целое число"]}) from exception
+
+        return max(1, min(limit, settings.WALLET_HISTORY_MAX_PAGE_SIZE))
+
+    @staticmethod
+    def encode_cursor(instance) -> str:
+        position = json.dumps([instance.created_at.isoformat(), str(instance.id)])
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, cursor: str) -> tuple[datetime.datetime, uuid.UUID]:
+        try:
+            created_at, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return datetime.datetime.fromisoformat(created_at), uuid.UUID(pk)
+        except (ValueError, TypeError) as exception:
+            raise ValidationError({self.cursor_query_param: ["Некорректный курсор"]}) from exception
@@ -0,0 +1,154 @@
+import dataclasses
+import datetime
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction as db_transaction
+from django.utils import timezone
+
+from .models import Transaction
+
+logger = logging.getLogger("transactions")
+logger.setLevel(logging.DEBUG)
+
+# Проводки партиционированы по месяцам created_at (миграция 0011_partition_transaction).
+# Переводы - нет: unique_transfer (from_wallet, idempotency_key) на партиционированной таблице обязан
+# включать created_at и перестал бы защищать от повтора в другом месяце
+PARTITIONED_TABLE = Transaction._meta.db_table
+
+PARTITIONS_SQL = r"""
+SELECT
+    c.relname,
+    (regexp_match(pg_get_expr(c.relpartbound, c.oid), 'FROM \(''([^'']+)''\)'))[1]::timestamptz,
+    (regexp_match(pg_get_expr(c.relpartbound, c.oid), 'TO \(''([^'']+)''\)'))[1]::timestamptz,
+    pg_get_expr(c.relpartbound, c.oid) = 'DEFAULT'
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = %s::regclass
+ORDER BY 3 NULLS LAST
+"""
+
+# Отсоединение без CONCURRENTLY (оно невозможно при наличии DEFAULT-партиции) берёт ACCESS EXCLUSIVE
+# на таблицу проводок: не ждём в очереди за длинными запросами, а пробуем на следующем запуске
+DETACH_LOCK_TIMEOUT = "5s"
+
+
+@dataclasses.dataclass
+class Partition:
+    name: str
+    # None - MINVALUE (партиция legacy с данными до партиционирования)
+    lower: datetime.datetime | None
+    upper: datetime.datetime | None
+    is_default: bool
+
+    def covers(self, value: datetime.datetime) -> bool:
+        if self.is_default:
+            return False
+
+        return (self.lower is None or self.lower <= value) and value < self.upper
+
+
+def add_months(month: datetime.date, count: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def month_bound(month: datetime.date) -> datetime.datetime:
+    return datetime.datetime.combine(month, datetime.time.min, tzinfo=datetime.UTC)
+
+
+def partition_name(month: datetime.date) -> str:
+    return f"{PARTITIONED_TABLE}_p{month:%Y_%m}"
+
+
+def list_partitions() -> list[Partition]:
+    with connection.cursor() as cursor:
+        cursor.execute(PARTITIONS_SQL, [PARTITIONED_TABLE])
+        return [Partition(*row) for row in cursor.fetchall()]
+
+
+def create_partition(month: datetime.date) -> str:
+    """
+    Партиция проводок за месяц. Строки этого месяца, попавшие в DEFAULT-партицию (партиция не была создана
+    вовремя), переносятся в неё в той же транзакции.
+    """
+    name = partition_name(month)
+    lower, upper = month_bound(month), month_bound(add_months(month, 1))
+    with db_transaction.atomic(), connection.cursor() as cursor:
+        # CREATE TABLE ... PARTITION OF упал бы, если в DEFAULT уже есть строки этого диапазона
+        cursor.execute(f"CREATE TABLE {name} (LIKE {PARTITIONED_TABLE} INCLUDING DEFAULTS)")
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {PARTITIONED_TABLE}_default WHERE created_at >= %s AND created_at < %s RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+            """,
+            [lower, upper],
+        )
+        moved = cursor.rowcount
+        cursor.execute(
+            f"ALTER TABLE {PARTITIONED_TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", [lower, upper]
+        )
+
+    if moved:
+        logger.warning(f"В партицию {name} перенесено {moved} проводок из DEFAULT")
+    return name
+
+
+def ensure_partitions(months_ahead: int = None, today: datetime.date = None) -> list[str]:
+    """
+    Создаёт недостающие партиции с текущего месяца на months_ahead месяцев вперёд.
+    """
+    months_ahead = settings.TRANSACTION_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    current = (today or timezone.now().astimezone(datetime.UTC).date()).replace(day=1)
+
+    partitions = list_partitions()
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if not any(partition.covers(month_bound(month)) for partition in partitions):
+            created.append(create_partition(month))
+
+    return created
+
+
+def detach_partitions(retention_months: int = None, today: datetime.date = None) -> list[str]:
+    """
+    Отсоединяет партиции, целиком старше retention_months месяцев (0 - хранить всё).
+    Отсоединяется только пустая партиция: её проводки уже перенесены в сегменты archive_ledger, остальные
+    ждут архивации - иначе они пропали бы из выписок, сверки и балансов на дату. Пустые таблицы остаются в БД.
+    """
+    retention_months = settings.TRANSACTION_PARTITION_RETENTION_MONTHS if retention_months is None else retention_months
+    if retention_months <= 0:
+        return []
+
+    current = (today or timezone.now().astimezone(datetime.UTC).date()).replace(day=1)
+    cutoff = month_bound(add_months(current, -retention_months))
+
+    detached = []
+    for partition in list_partitions():
+        if partition.is_default or partition.upper > cutoff:
+            continue
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {partition.name})")
+            if cursor.fetchone()[0]:
+                logger.warning(f"Партиция {partition.name} ещё не заархивирована, отсоединение пропущено")
+                continue
+
+        with db_transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SELECT set_config('lock_timeout', %s, true)", [DETACH_LOCK_TIMEOUT])
+            cursor.execute(f"ALTER TABLE {PARTITIONED_TABLE} DETACH PARTITION {partition.name}")
+        logger.info(f"Партиция {partition.name} отсоединена")
+        detached.append(partition.name)
+
+    return detached
+
+
+def manage_partitions(
+    months_ahead: int = None, retention_months: int = None, today: datetime.date = None
+) -> tuple[list[str], list[str]]:
+    created = ensure_partitions(months_ahead, today)
+    detached = detach_partitions(retention_months, today)
+    return created, detached
@@ -0,0 +1,202 @@
+import concurrent.futures
+import dataclasses
+import datetime
+import logging
+import multiprocessing
+import uuid
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.db import connection, connections, transaction as db_transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from apps.core.db import advisory_lock
+
+from .archive import archived_delta
+from .cache import get_admin_wallet
+from .models import ArchiveSegment, FeeShard, LedgerTotal, ReconciliationDiscrepancy, ReconciliationRun, Wallet
+
+logger = logging.getLogger("transactions")
+logger.setLevel(logging.DEBUG)
+
+# Одна сверка за раз: LedgerTotal пишет только она
+RECONCILIATION_LOCK = "transactions:reconciliation"
+
+# Для каждого кошелька диапазона: баланс, итог проводок на прошлой сверке и новые проводки после него.
+# Проводки до cutoff прибавляются к итогу, более поздние (ещё не закрытое окно) участвуют только в сравнении.
+# Новые проводки ищутся по индексу transaction_wallet_history, старые не читаются
+CHUNK_SQL = """
+SELECT
+    b.wallet_id,
+    b.balance,
+    t.opening,
+    t.total,
+    t.through,
+    COUNT(tx.id) FILTER (WHERE tx.created_at <= %(cutoff)s),
+    COALESCE(SUM(CASE WHEN tx.flow = 'credit' THEN -tx.amount ELSE tx.amount END)
+        FILTER (WHERE tx.created_at <= %(cutoff)s), 0),
+    COALESCE(SUM(CASE WHEN tx.flow = 'credit' THEN -tx.amount ELSE tx.amount END)
+        FILTER (WHERE tx.created_at > %(cutoff)s), 0)
+FROM transactions_walletbalance b
+LEFT JOIN transactions_ledgertotal t ON t.wallet_id = b.wallet_id
+LEFT JOIN transactions_transaction tx
+    ON tx.wallet_id = b.wallet_id AND tx.created_at > COALESCE(t.through, '-infinity')
+WHERE b.wallet_id >= %(lower)s AND (%(upper)s::uuid IS NULL OR b.wallet_id < %(upper)s::uuid)
+GROUP BY b.wallet_id, b.balance, t.opening, t.total, t.through
+"""
+
+
+@dataclasses.dataclass
+class ChunkResult:
+    wallets_checked: int = 0
+    transactions_processed: int = 0
+    discrepancies_found: int = 0
+
+
+def wallet_chunks(count: int) -> list[tuple[uuid.UUID, uuid.UUID | None]]:
+    # Равные диапазоны uuid4: кошельки распределены по ним равномерно
+    step = 2**128 // count
+    bounds = [uuid.UUID(int=step * index) for index in range(count)]
+    return list(zip(bounds, bounds[1:] + [None]))
+
+
+def reconcile_ledger(workers: int = None, chunks: int = None) -> ReconciliationRun | None:
+    """
+    Сверяет баланс каждого кошелька с суммой его проводок (debit +, credit -, fee +) с учётом opening.
+    Возвращает None, если уже идёт другая сверка.
+    """
+    workers = workers or settings.RECONCILIATION_WORKERS
+    chunks = chunks or settings.RECONCILIATION_CHUNKS
+
+    with advisory_lock(RECONCILIATION_LOCK) as acquired:
+        if not acquired:
+            logger.warning("Сверка уже выполняется")
+            return None
+
+        # Проводки создаются с временем начала транзакции перевода и могут закоммититься позже более новых.
+        # Окно RECONCILIATION_SAFETY_LAG закрыто: незакоммиченных проводок в нём не осталось
+        cutoff = timezone.now() - datetime.timedelta(seconds=settings.RECONCILIATION_SAFETY_LAG)
+        run = ReconciliationRun.objects.create(cutoff=cutoff)
+        try:
+            result = _run_chunks(run, wallet_chunks(chunks), workers)
+        except Exception:
+            run.status = ReconciliationRun.Status.failed
+            run.finished_at = timezone.now()
+            run.save(update_fields=["status", "finished_at", "updated_at"])
+            raise
+
+        run.status = ReconciliationRun.Status.succeeded
+        run.finished_at = timezone.now()
+        run.wallets_checked = result.wallets_checked
+        run.transactions_processed = result.transactions_processed
+        run.discrepancies_found = result.discrepancies_found
+        run.save()
+
+    logger.info(
+        f"Сверка {run.id}: кошельков {run.wallets_checked}, новых проводок {run.transactions_processed}, "
+        f"расхождений {run.discrepancies_found}"
+    )
+    return run
+
+
+def _run_chunks(run: ReconciliationRun, chunks: list, workers: int) -> ChunkResult:
+    try:
+        admin_wallet_id = get_admin_wallet().wallet_id
+    except Wallet.DoesNotExist:
+        admin_wallet_id = None
+    tasks = [(run.id, run.cutoff, lower, upper, admin_wallet_id) for lower, upper in chunks]
+    if workers <= 1:
+        results = [reconcile_chunk(*task) for task in tasks]
+    else:
+        with _executor(workers) as executor:
+            results = list(executor.map(_reconcile_chunk_in_pool, *zip(*tasks)))
+
+    total = ChunkResult()
+    for result in results:
+        total.wallets_checked += result.wallets_checked
+        total.transactions_processed += result.transactions_processed
+        total.discrepancies_found += result.discrepancies_found
+
+    return total
+
+
+def _executor(workers: int) -> concurrent.futures.Executor:
+    if multiprocessing.current_process().daemon:
+        # Воркер Celery (prefork) - daemon-процесс, дочерние процессы ему запрещены
+        return concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reconciliation")
+
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        # Функции задач импортируют модели, поэтому Django настраивается раньше, чем они распаковываются
+        initializer=django.setup,
+    )
+
+
+def _reconcile_chunk_in_pool(*args) -> ChunkResult:
+    try:
+        return reconcile_chunk(*args)
+    finally:
+        # Иначе поток или процесс пула держал бы своё соединение до конца сверки
+        connections.close_all()
+
+
+def reconcile_chunk(
+    run_id: uuid.UUID,
+    cutoff: datetime.datetime,
+    lower: uuid.UUID,
+    upper: uuid.UUID | None,
+    admin_wallet_id: uuid.UUID,
+) -> ChunkResult:
+    isolate = not connection.in_atomic_block
+    with db_transaction.atomic():
+        with connection.cursor() as cursor:
+            if isolate:
+                # Балансы и проводки диапазона из одного снимка, иначе перевод между чтениями дал бы ложное расхождение
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            cursor.execute(CHUNK_SQL, {"cutoff": cutoff, "lower": lower, "upper": upper})
+            rows = cursor.fetchall()
+        # Сегменты из того же снимка: проводки, заархивированные между чтениями, не посчитаются дважды
+        segments = list(ArchiveSegment.objects.values_list("name", "period_end"))
+
+        result = ChunkResult(wallets_checked=len(rows))
+        totals = []
+        discrepancies = []
+        for wallet_id, balance, opening, total, through, settled_count, settled, pending in rows:
+            # Архивные проводки после прошлой сверки (или все, если сверки не было) - такие же закрытые
+            names = [name for name, period_end in segments if through is None or period_end > through]
+            if names:
+                after = None if through is None else through + datetime.timedelta(microseconds=1)
+                settled += archived_delta(wallet_id, after, cutoff + datetime.timedelta(microseconds=1), names)
+            result.transactions_processed += settled_count
+            ledger = (total or Decimal("0.00")) + settled + pending
+            if wallet_id == admin_wallet_id:
+                # Комиссии в шардах уже в проводках, но на баланс попадут только при переносе
+                ledger -= FeeShard.objects.aggregate(pending=Sum("balance"))["pending"] or Decimal("0.00")
+
+            if total is None:
+                # Первая сверка кошелька: начальные балансы и пополнения (seed_wallets) идут мимо проводок,
+                # они фиксируются как opening, а расхождением считается всё, что появится после
+                opening = balance - ledger
+                totals.append(LedgerTotal(wallet_id=wallet_id, opening=opening, total=settled, through=cutoff))
+            elif settled_count:
+                totals.append(LedgerTotal(wallet_id=wallet_id, opening=opening, total=total + settled, through=cutoff))
+
+            expected = opening + ledger
+            if balance != expected:
+                discrepancies.append(
+                    ReconciliationDiscrepancy(run_id=run_id, wallet_id=wallet_id, balance=balance, expected=expected)
+                )
+
+        LedgerTotal.objects.bulk_create(
+            totals,
+            update_conflicts=True,
+            unique_fields=["wallet"],
+            update_fields=["total", "through", "updated_at"],
+        )
+        ReconciliationDiscrepancy.objects.bulk_create(discrepancies)
+
+    result.discrepancies_found = len(discrepancies)
+    return result
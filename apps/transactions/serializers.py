@@ -1,45 +1,73 @@
+import contextlib
+
+from django.conf import settings
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError, PermissionDenied
 
+from apps.core.timing import TimedSerializerMixin, timed
 from apps.transactions.dto import TransferCreateCommand
 from apps.transactions.exceptions import (
     NotEnoughMineralsException,
     RaceConditionException,
     ConflictError,
     AdminWalletException,
+    TransferInProgressException,
+    WalletNotFoundException,
 )
-from apps.transactions.models import Transfer, Wallet
-from apps.transactions.services import transfer_funds
-from apps.transactions.tasks import notify_recipient
+from apps.transactions.models import Transfer, Transaction
+from apps.transactions.services import atransfer_funds, transfer_funds, transfer_funds_batch
 
 
-class TransferSerializer(serializers.ModelSerializer):
+class TransferSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
-    from_wallet = serializers.PrimaryKeyRelatedField(queryset=Wallet.objects.all(), write_only=True)
-    to_wallet = serializers.PrimaryKeyRelatedField(queryset=Wallet.objects.all(), write_only=True)
+    # Только id: существование кошельков проверяет сервис тем же запросом, которым читает балансы
+    from_wallet = serializers.UUIDField(write_only=True)
+    to_wallet = serializers.UUIDField(write_only=True)
 
     def create(self, validated_data):
+        transfer_command = self.transfer_command(validated_data)
+        with self.service_errors(transfer_command), timed("service"):
+            response = transfer_funds(transfer_command)
+
+        # Уведомление о новом переводе записано в outbox в его транзакции
+        self.transfer_created = response.created
+        return response.transfer
+
+    async def asave(self) -> Transfer:
+        # save() для асинхронного представления: без хуков DRF, только создание перевода
+        transfer_command = self.transfer_command(self.validated_data)
+        with self.service_errors(transfer_command), timed("service"):
+            response = await atransfer_funds(transfer_command)
+
+        self.transfer_created = response.created
+        self.instance = response.transfer
+        return self.instance
+
+    def transfer_command(self, validated_data) -> TransferCreateCommand:
         try:
-            transfer_command = TransferCreateCommand(
-                from_wallet=validated_data["from_wallet"],
-                to_wallet=validated_data["to_wallet"],
+            return TransferCreateCommand(
+                from_wallet_id=validated_data["from_wallet"],
+                to_wallet_id=validated_data["to_wallet"],
                 amount=validated_data["amount"],
                 idempotency_key=self.context["idempotency_key"],
             )
         except ValueError as exception:
             raise ValidationError(detail=exception) from exception
 
+    @contextlib.contextmanager
+    def service_errors(self, transfer_command: TransferCreateCommand):
         try:
-            transfer = transfer_funds(transfer_command).transfer
+            yield
         except AdminWalletException as exception:
             raise PermissionDenied(detail=exception) from exception
+        except WalletNotFoundException as exception:
+            field = "from_wallet" if exception.wallet_id == transfer_command.from_wallet_id else "to_wallet"
+            message = serializers.PrimaryKeyRelatedField.default_error_messages["does_not_exist"]
+            raise ValidationError({field: [message.format(pk_value=exception.wallet_id)]}) from exception
         except NotEnoughMineralsException as exception:
             raise ValidationError(detail=exception) from exception
         except RaceConditionException as exception:
             raise ConflictError(detail=exception) from exception
-        else:
-            notify_recipient.delay(transfer_id=transfer.id)
-            return transfer
 
     class Meta:
         model = Transfer
@@ -52,3 +80,136 @@ class TransferSerializer(serializers.ModelSerializer):
         ]
         write_only_fields = ["amount"]
         read_only_fields = ["id"]
+
+
+class BatchTransferItemSerializer(serializers.Serializer):
+    from_wallet = serializers.UUIDField()
+    to_wallet = serializers.UUIDField()
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    idempotency_key = serializers.CharField(max_length=255)
+
+
+class BatchTransferSerializer(TimedSerializerMixin, serializers.Serializer):
+    ERROR_CODES = {
+        AdminWalletException: "admin_wallet",
+        NotEnoughMineralsException: "not_enough_minerals",
+        TransferInProgressException: "in_progress",
+        RaceConditionException: "conflict",
+        WalletNotFoundException: "wallet_not_found",
+    }
+
+    transfers = BatchTransferItemSerializer(many=True, allow_empty=False, max_length=settings.TRANSFER_BATCH_MAX_SIZE)
+
+    def validate_transfers(self, transfers):
+        # Существование кошельков проверяет сервис тем же запросом, которым блокирует балансы
+        commands = []
+        errors = {}
+        for index, item in enumerate(transfers):
+            try:
+                commands.append(
+                    TransferCreateCommand(
+                        from_wallet_id=item["from_wallet"],
+                        to_wallet_id=item["to_wallet"],
+                        amount=item["amount"],
+                        idempotency_key=item["idempotency_key"],
+                    )
+                )
+            except ValueError as exception:
+                errors[index] = [str(exception)]
+
+        if errors:
+            raise ValidationError(errors)
+
+        return commands
+
+    def create(self, validated_data):
+        try:
+            with timed("service"):
+                return {"results": transfer_funds_batch(validated_data["transfers"])}
+        except RaceConditionException as exception:
+            raise ConflictError(detail=exception) from exception
+
+    def to_representation(self, instance):
+        return {
+            "results": [self.result_representation(index, result) for index, result in enumerate(instance["results"])]
+        }
+
+    def result_representation(self, index, result):
+        if result.error:
+            code = next(code for error_type, code in self.ERROR_CODES.items() if isinstance(result.error, error_type))
+            return {"index": index, "status": "error", "code": code, "detail": str(result.error)}
+
+        return {
+            "index": index,
+            "status": "created" if result.created else "existing",
+            "id": str(result.transfer.id),
+        }
+
+
+class AdminBalanceSerializer(TimedSerializerMixin, serializers.Serializer):
+    balance = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    pending_fees = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+
+class WalletBalanceSerializer(TimedSerializerMixin, serializers.Serializer):
+    wallet_id = serializers.UUIDField(read_only=True)
+    balance = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    version = serializers.IntegerField(read_only=True)
+
+
+class WalletBalanceAsOfSerializer(TimedSerializerMixin, serializers.Serializer):
+    wallet_id = serializers.UUIDField(read_only=True)
+    balance = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+    as_of = serializers.DateTimeField()
+
+
+class BulkWalletBalanceSerializer(TimedSerializerMixin, serializers.Serializer):
+    wallet_ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False,
+        max_length=settings.WALLET_BALANCE_BULK_MAX_SIZE,
+        write_only=True,
+    )
+
+
+class WalletTransactionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    counterparty = serializers.SerializerMethodField()
+
+    def get_counterparty(self, instance):
+        # Для списания - получатель, для зачисления и комиссии - отправитель перевода
+        if instance.flow == Transaction.Flow.credit:
+            return instance.transfer.to_wallet_id
+
+        return instance.transfer.from_wallet_id
+
+    class Meta:
+        model = Transaction
+        fields = [
+            "id",
+            "created_at",
+            "flow",
+            "amount",
+            "balance_after",
+            "transfer",
+            "counterparty",
+        ]
+
+
+class WalletTransactionFilterSerializer(TimedSerializerMixin, serializers.Serializer):
+    flow = serializers.ChoiceField(choices=Transaction.Flow.choices, required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+
+
+class StatementQuerySerializer(TimedSerializerMixin, serializers.Serializer):
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    # Не format: этот параметр DRF использует для выбора рендерера
+    output = serializers.ChoiceField(choices=["csv", "ndjson"], default="csv")
+
+    def validate(self, attrs):
+        if attrs["date_from"] > attrs["date_to"]:
+            raise ValidationError({"date_to": ["Конец периода раньше начала"]})
+
+        return attrs
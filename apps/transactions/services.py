@@ -1,35 +1,194 @@
+import asyncio
+import contextlib
+import dataclasses
 import logging
+import random
+import time
 from decimal import Decimal
 import uuid
 
-from django.db import transaction as db_transaction, IntegrityError
-from django.db.models import F
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction as db_transaction, DatabaseError, IntegrityError
+from django.db.models import F, Sum
 
-from .dto import TransferCreateCommand, TransferResponse
-from .exceptions import RaceConditionException, NotEnoughMineralsException, AdminWalletException
-from .models import Wallet, WalletBalance, Transaction, Transfer
+from apps.core.db import prepared_cursor
+from . import metrics
+from .balances import invalidate_wallet_balances
+from .cache import get_admin_wallet
+from .dto import TransferCreateCommand, TransferResponse, AdminBalanceResponse, BatchTransferResult
+from .exceptions import (
+    RaceConditionException,
+    NotEnoughMineralsException,
+    AdminWalletException,
+    VersionConflictException,
+    TransferInProgressException,
+    WalletNotFoundException,
+)
+from .models import Wallet, WalletBalance, Transaction, Transfer, FeeShard, OutboxEvent
 
 logger = logging.getLogger("transactions")
 logger.setLevel(logging.DEBUG)
 
 
-def transfer_funds(transfer_command: TransferCreateCommand) -> TransferResponse:
-    admin_account = Wallet.objects.get(is_admin_wallet=True)
+@dataclasses.dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int
+    base_delay: float
+    max_delay: float
+    deadline: float
 
-    if admin_account.id in (transfer_command.from_wallet.id, transfer_command.to_wallet.id):
-        raise AdminWalletException("Админский кошелёк не может участвовать в переводах")
+    @classmethod
+    def from_settings(cls) -> "RetryPolicy":
+        return cls(
+            max_attempts=settings.TRANSFER_RETRY_MAX_ATTEMPTS,
+            base_delay=settings.TRANSFER_RETRY_BASE_DELAY,
+            max_delay=settings.TRANSFER_RETRY_MAX_DELAY,
+            deadline=settings.TRANSFER_RETRY_DEADLINE,
+        )
+
+    def backoff(self, attempt: int) -> float:
+        # Экспоненциальная задержка с full jitter, чтобы повторы конкурирующих запросов не совпадали
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+def transfer_funds(transfer_command: TransferCreateCommand, retry_policy: RetryPolicy = None) -> TransferResponse:
+    retry_policy = retry_policy or RetryPolicy.from_settings()
+    if not transfer_command.idempotency_key:
+        # Ключ фиксируется до повторов, иначе каждая попытка создала бы отдельный перевод
+        transfer_command = dataclasses.replace(transfer_command, idempotency_key=str(uuid.uuid4()))
+
+    started = time.perf_counter()
+    deadline = time.monotonic() + retry_policy.deadline
+    attempt = 1
+    try:
+        while True:
+            try:
+                response = _transfer_funds_once(transfer_command)
+            except VersionConflictException as exception:
+                delay = _retry_delay(transfer_command, retry_policy, attempt, deadline, exception)
+                if delay is None:
+                    raise
+
+                time.sleep(delay)
+                attempt += 1
+            else:
+                return _retried_response(transfer_command, response, attempt, started)
+    except Exception as exception:
+        metrics.observe_transfer_error(settings.TRANSFER_ENGINE, time.perf_counter() - started, exception)
+        raise
+
+
+async def atransfer_funds(
+    transfer_command: TransferCreateCommand, retry_policy: RetryPolicy = None
+) -> TransferResponse:
+    """
+    transfer_funds для ASGI. Транзакции Django выполняет только синхронно, поэтому попытка идёт через
+    sync_to_async - в потоке запроса, с его соединением с БД, - а пауза между попытками ждётся в event loop.
+    """
+    retry_policy = retry_policy or RetryPolicy.from_settings()
+    if not transfer_command.idempotency_key:
+        transfer_command = dataclasses.replace(transfer_command, idempotency_key=str(uuid.uuid4()))
+
+    transfer_once = sync_to_async(_transfer_funds_once)
+    started = time.perf_counter()
+    deadline = time.monotonic() + retry_policy.deadline
+    attempt = 1
+    try:
+        while True:
+            try:
+                response = await transfer_once(transfer_command)
+            except VersionConflictException as exception:
+                delay = _retry_delay(transfer_command, retry_policy, attempt, deadline, exception)
+                if delay is None:
+                    raise
+
+                await asyncio.sleep(delay)
+                attempt += 1
+            else:
+                return _retried_response(transfer_command, response, attempt, started)
+    except Exception as exception:
+        metrics.observe_transfer_error(settings.TRANSFER_ENGINE, time.perf_counter() - started, exception)
+        raise
+
+
+def _retry_delay(
+    transfer_command: TransferCreateCommand,
+    retry_policy: RetryPolicy,
+    attempt: int,
+    deadline: float,
+    exception: VersionConflictException,
+) -> float | None:
+    # None - попытки исчерпаны
+    delay = retry_policy.backoff(attempt)
+    if attempt >= retry_policy.max_attempts or time.monotonic() + delay > deadline:
+        logger.warning(f"Перевод {transfer_command.idempotency_key}: конфликт версий не разрешён за {attempt} попыток")
+        return None
+
+    logger.debug(f"Перевод {transfer_command.idempotency_key}: конфликт версий, попытка {attempt}")
+    metrics.observe_retry(settings.TRANSFER_ENGINE, exception)
+    return delay
 
-    if transfer_command.amount > Decimal("1000.00"):
-        fee = (transfer_command.amount * Decimal("0.10")).quantize(Decimal("0.01"))
-    else:
-        fee = Decimal("0.00")
 
+def _retried_response(
+    transfer_command: TransferCreateCommand, response: TransferResponse, attempt: int, started: float
+) -> TransferResponse:
+    if attempt > 1:
+        logger.info(f"Перевод {transfer_command.idempotency_key}: выполнен с попытки {attempt}")
+
+    duration = time.perf_counter() - started
+    metrics.observe_transfer(settings.TRANSFER_ENGINE, duration, response.created, response.transfer.fee)
+    return dataclasses.replace(response, attempts=attempt)
+
+
+def calculate_fee(amount: Decimal) -> Decimal:
+    if amount > Decimal("1000.00"):
+        return (amount * Decimal("0.10")).quantize(Decimal("0.01"))
+
+    return Decimal("0.00")
+
+
+def _transfer_funds_once(transfer_command: TransferCreateCommand) -> TransferResponse:
+    if settings.TRANSFER_ENGINE == "plpgsql":
+        return _transfer_funds_plpgsql(transfer_command)
+
+    return _transfer_funds_orm(transfer_command)
+
+
+def _transfer_funds_orm(transfer_command: TransferCreateCommand) -> TransferResponse:
+    admin_wallet = get_admin_wallet()
+
+    if admin_wallet.wallet_id in (transfer_command.from_wallet_id, transfer_command.to_wallet_id):
+        raise AdminWalletException("Админский кошелёк не может участвовать в переводах")
+
+    fee = calculate_fee(transfer_command.amount)
     credit = transfer_command.amount + fee
-    idempotency_key = transfer_command.idempotency_key or str(uuid.uuid4())
+    idempotency_key = transfer_command.idempotency_key
     with db_transaction.atomic():
-        from_balance = WalletBalance.objects.get(wallet=transfer_command.from_wallet)
-        to_balance = WalletBalance.objects.get(wallet=transfer_command.to_wallet)
-        admin_balance = WalletBalance.objects.get(wallet=admin_account)
+        if _acquire_coalesce_lock(transfer_command):
+            # Дождались конкурентного запроса с тем же ключом: его перевод уже закоммичен
+            transfer = Transfer.objects.filter(
+                from_wallet_id=transfer_command.from_wallet_id, idempotency_key=idempotency_key
+            ).first()
+            if transfer is not None:
+                return _existing_transfer_response(transfer, transfer_command, fee)
+
+        # Существование кошельков проверяется тем же запросом, которым загружаются балансы
+        wallet_ids = [transfer_command.from_wallet_id, transfer_command.to_wallet_id]
+        if not settings.FEE_SHARDS:
+            wallet_ids.append(admin_wallet.wallet_id)
+        balances = {balance.wallet_id: balance for balance in WalletBalance.objects.filter(wallet_id__in=wallet_ids)}
+
+        for wallet_id in (transfer_command.from_wallet_id, transfer_command.to_wallet_id):
+            if wallet_id not in balances:
+                raise WalletNotFoundException(wallet_id)
+
+        if not settings.FEE_SHARDS and admin_wallet.wallet_id not in balances:
+            raise WalletBalance.DoesNotExist("Баланс админского кошелька не найден")
+
+        from_balance = balances[transfer_command.from_wallet_id]
+        to_balance = balances[transfer_command.to_wallet_id]
+        admin_balance = balances.get(admin_wallet.wallet_id)
 
         if from_balance.balance < credit:
             raise NotEnoughMineralsException("Недостаточно минералов")
@@ -40,9 +199,9 @@ def transfer_funds(transfer_command: TransferCreateCommand) -> TransferResponse:
 
         try:
             transfer, created = Transfer.objects.get_or_create(
-                from_wallet=transfer_command.from_wallet,
+                from_wallet_id=transfer_command.from_wallet_id,
                 idempotency_key=idempotency_key,
-                to_wallet=transfer_command.to_wallet,
+                to_wallet_id=transfer_command.to_wallet_id,
                 amount=transfer_command.amount,
                 fee=fee,
             )
@@ -52,61 +211,377 @@ def transfer_funds(transfer_command: TransferCreateCommand) -> TransferResponse:
 
         if not created:
             # Если всё один в один, то отдадим существующий перевод
-            return TransferResponse(transfer=transfer)
-
-        updated = WalletBalance.objects.filter(
-            wallet=transfer_command.from_wallet,
-            version=from_version,
-            balance__gte=credit,
-        ).update(
-            balance=F("balance") - credit,
-            version=F("version") + 1,
-        )
-
-        if updated != 1:
-            raise RaceConditionException("Выполняется другая операция (версия)")
-
-        updated = WalletBalance.objects.filter(
-            wallet=transfer_command.to_wallet,
-            version=to_version,
-        ).update(
-            balance=F("balance") + transfer_command.amount,
-            version=F("version") + 1,
-        )
+            return TransferResponse(transfer=transfer, created=False)
 
-        if updated != 1:
-            raise RaceConditionException("Выполняется другая операция (версия)")
+        # Балансы обновляются в порядке wallet_id, как и в пакетных переводах, чтобы не ловить взаимные блокировки
+        balance_updates = [
+            ("from", from_balance.wallet_id, {"version": from_version, "balance__gte": credit}, -credit),
+            ("to", to_balance.wallet_id, {"version": to_version}, transfer_command.amount),
+        ]
+        if fee > Decimal("0.00") and admin_balance:
+            balance_updates.append(("admin", admin_balance.wallet_id, {"version": admin_version}, fee))
 
-        if fee > Decimal("0.00"):
+        for wallet, wallet_id, conditions, delta in sorted(balance_updates, key=lambda item: item[1]):
             updated = WalletBalance.objects.filter(
-                wallet=admin_account,
-                version=admin_version,
+                wallet_id=wallet_id,
+                **conditions,
             ).update(
-                balance=F("balance") + fee,
+                balance=F("balance") + delta,
                 version=F("version") + 1,
             )
 
             if updated != 1:
-                raise RaceConditionException("Выполняется другая операция (версия)")
+                raise VersionConflictException("Выполняется другая операция (версия)", wallet=wallet)
 
-        Transaction.objects.create(
-            wallet=transfer_command.from_wallet,
-            transfer=transfer,
-            flow=Transaction.Flow.credit,
-            amount=credit,
-        )
-        Transaction.objects.create(
-            wallet=transfer_command.to_wallet,
-            transfer=transfer,
-            flow=Transaction.Flow.debit,
-            amount=transfer_command.amount,
-        )
-        if fee > Decimal("0.00"):
-            Transaction.objects.create(
-                wallet=admin_account,
+        invalidate_wallet_balances([transfer_command.from_wallet_id, transfer_command.to_wallet_id])
+
+        if fee > Decimal("0.00") and settings.FEE_SHARDS:
+            credit_fee_shard(fee_shard_for(transfer_command.from_wallet_id), fee)
+
+        # Версии совпали, значит прочитанные балансы - ровно те, от которых выполнены обновления
+        transactions = [
+            Transaction(
+                wallet_id=transfer_command.from_wallet_id,
                 transfer=transfer,
-                flow=Transaction.Flow.fee,
-                amount=fee,
+                flow=Transaction.Flow.credit,
+                amount=credit,
+                balance_after=from_balance.balance - credit,
+            ),
+            Transaction(
+                wallet_id=transfer_command.to_wallet_id,
+                transfer=transfer,
+                flow=Transaction.Flow.debit,
+                amount=transfer_command.amount,
+                balance_after=to_balance.balance + transfer_command.amount,
+            ),
+        ]
+        if fee > Decimal("0.00"):
+            transactions.append(
+                Transaction(
+                    wallet_id=admin_wallet.wallet_id,
+                    transfer=transfer,
+                    flow=Transaction.Flow.fee,
+                    amount=fee,
+                    balance_after=admin_balance.balance + fee if admin_balance else None,
+                )
             )
+        Transaction.objects.bulk_create(transactions)
+        # Уведомление публикует relay_outbox после коммита, запрос к брокеру не ходит
+        OutboxEvent.objects.create(kind=OutboxEvent.Kind.transfer_created, transfer_id=transfer.id)
 
     return TransferResponse(transfer=transfer)
+
+
+def _acquire_coalesce_lock(transfer_command: TransferCreateCommand) -> bool:
+    """
+    Advisory-блокировка по (from_wallet, idempotency_key) до конца транзакции.
+    Возвращает True, если пришлось ждать другой запрос с тем же ключом.
+    """
+    wait = settings.TRANSFER_COALESCE_WAIT
+    if wait <= 0:
+        return False
+
+    lock_key = _coalesce_lock_key(transfer_command)
+    deadline = time.monotonic() + wait
+    attempt = 1
+    with prepared_cursor() as cursor:
+        while True:
+            # Без ожидания на стороне БД: lock_timeout задел бы и обновления балансов в этой транзакции
+            cursor.execute("SELECT pg_try_advisory_xact_lock(hashtextextended(%s, 0))", [lock_key])
+            if cursor.fetchone()[0]:
+                return attempt > 1
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TransferInProgressException("Перевод с этим ключом идемпотентности ещё выполняется")
+
+            time.sleep(min(remaining, settings.TRANSFER_COALESCE_POLL_INTERVAL * attempt))
+            attempt += 1
+
+
+def _acquire_batch_coalesce_locks(transfer_commands: list[TransferCreateCommand]) -> set[str]:
+    """
+    Те же advisory-блокировки, что и у одиночного перевода, для всех ключей пакета - одним запросом за попытку.
+    Возвращает ключи, которые другой запрос так и не освободил за TRANSFER_COALESCE_WAIT.
+    """
+    wait = settings.TRANSFER_COALESCE_WAIT
+    if wait <= 0:
+        return set()
+
+    pending = sorted({_coalesce_lock_key(command) for command in transfer_commands})
+    deadline = time.monotonic() + wait
+    attempt = 1
+    with prepared_cursor() as cursor:
+        while True:
+            # pg_try_* не ждёт, поэтому порядок захвата ключей не важен для взаимных блокировок
+            cursor.execute(
+                "SELECT lock_key FROM unnest(%s::text[]) AS lock_key "
+                "WHERE NOT pg_try_advisory_xact_lock(hashtextextended(lock_key, 0))",
+                [pending],
+            )
+            pending = [lock_key for (lock_key,) in cursor.fetchall()]
+            remaining = deadline - time.monotonic()
+            if not pending or remaining <= 0:
+                return set(pending)
+
+            time.sleep(min(remaining, settings.TRANSFER_COALESCE_POLL_INTERVAL * attempt))
+            attempt += 1
+
+
+def _coalesce_lock_key(transfer_command: TransferCreateCommand) -> str:
+    # Тот же ключ блокировки, что и в transactions_transfer_funds
+    return f"{transfer_command.from_wallet_id}:{transfer_command.idempotency_key}"
+
+
+def _existing_transfer_response(transfer: Transfer, transfer_command: TransferCreateCommand, fee: Decimal):
+    if (transfer.to_wallet_id, transfer.amount, transfer.fee) != (
+        transfer_command.to_wallet_id,
+        transfer_command.amount,
+        fee,
+    ):
+        raise RaceConditionException("Невозможно выполнить перевод (констрейнт)")
+
+    return TransferResponse(transfer=transfer, created=False)
+
+
+PLPGSQL_ERRORS = {
+    "FT001": AdminWalletException,
+    "FT002": NotEnoughMineralsException,
+    "FT003": RaceConditionException,
+    "FT004": Wallet.DoesNotExist,
+    "FT005": WalletBalance.DoesNotExist,
+    "FT006": TransferInProgressException,
+}
+
+
+def _transfer_funds_plpgsql(transfer_command: TransferCreateCommand) -> TransferResponse:
+    fee = calculate_fee(transfer_command.amount)
+    fee_shard = fee_shard_for(transfer_command.from_wallet_id) if settings.FEE_SHARDS and fee else None
+
+    # Функция атомарна сама по себе, savepoint нужен только внутри внешней транзакции
+    savepoint = db_transaction.atomic() if connection.in_atomic_block else contextlib.nullcontext()
+    try:
+        with savepoint, prepared_cursor() as cursor:
+            cursor.execute(
+                "SELECT * FROM transactions_transfer_funds(%s, %s, %s, %s, %s, %s, %s)",
+                [
+                    transfer_command.from_wallet_id,
+                    transfer_command.to_wallet_id,
+                    transfer_command.amount,
+                    fee,
+                    transfer_command.idempotency_key,
+                    fee_shard,
+                    int(settings.TRANSFER_COALESCE_WAIT * 1000),
+                ],
+            )
+            row = dict(zip([column.name for column in cursor.description], cursor.fetchone()))
+    except DatabaseError as exception:
+        sqlstate = getattr(exception.__cause__, "sqlstate", None)
+        wallet_id = exception.__cause__.diag.message_detail if sqlstate == "FT005" else None
+        if wallet_id in (str(transfer_command.from_wallet_id), str(transfer_command.to_wallet_id)):
+            raise WalletNotFoundException(uuid.UUID(wallet_id)) from exception
+
+        exception_class = PLPGSQL_ERRORS.get(sqlstate)
+        if exception_class is None:
+            raise
+
+        raise exception_class(exception.__cause__.diag.message_primary) from exception
+
+    # Перевод собирается из ответа функции без дополнительного SELECT
+    field_names = [field.attname for field in Transfer._meta.concrete_fields]
+    transfer = Transfer.from_db(connection.alias, field_names, [row[field_name] for field_name in field_names])
+    if row["created"]:
+        invalidate_wallet_balances([transfer_command.from_wallet_id, transfer_command.to_wallet_id])
+
+    return TransferResponse(transfer=transfer, created=row["created"])
+
+
+def transfer_funds_batch(transfer_commands: list[TransferCreateCommand]) -> list[BatchTransferResult]:
+    admin_wallet = get_admin_wallet()
+    results = [None] * len(transfer_commands)
+
+    wallet_ids = {command.from_wallet_id for command in transfer_commands}
+    wallet_ids |= {command.to_wallet_id for command in transfer_commands}
+    if not settings.FEE_SHARDS:
+        wallet_ids.add(admin_wallet.wallet_id)
+
+    with db_transaction.atomic():
+        # Ключи берутся до балансов, как и в одиночном переводе: конкурентный перевод с тем же ключом
+        # закоммитится раньше и попадёт в существующие переводы ниже
+        busy_keys = _acquire_batch_coalesce_locks(transfer_commands)
+
+        # Все строки балансов блокируются одним запросом в порядке wallet_id, поэтому пакеты не блокируют друг друга
+        balances = {
+            balance.wallet_id: balance
+            for balance in WalletBalance.objects.select_for_update()
+            .filter(wallet_id__in=wallet_ids)
+            .order_by("wallet_id")
+        }
+        transfers = {
+            (transfer.from_wallet_id, transfer.idempotency_key): transfer
+            for transfer in Transfer.objects.filter(
+                from_wallet_id__in={command.from_wallet_id for command in transfer_commands},
+                idempotency_key__in={command.idempotency_key for command in transfer_commands},
+            )
+        }
+
+        new_transfers = []
+        new_transactions = []
+        changed_balances = set()
+        shard_fees = {}
+        for index, command in enumerate(transfer_commands):
+            from_wallet_id = command.from_wallet_id
+            to_wallet_id = command.to_wallet_id
+            fee = calculate_fee(command.amount)
+            credit = command.amount + fee
+
+            if admin_wallet.wallet_id in (from_wallet_id, to_wallet_id):
+                results[index] = BatchTransferResult(
+                    error=AdminWalletException("Админский кошелёк не может участвовать в переводах")
+                )
+                continue
+
+            transfer = transfers.get((from_wallet_id, command.idempotency_key))
+            if transfer is None and _coalesce_lock_key(command) in busy_keys:
+                results[index] = BatchTransferResult(
+                    error=TransferInProgressException("Перевод с этим ключом идемпотентности ещё выполняется")
+                )
+                continue
+
+            if transfer:
+                if transfer.to_wallet_id == to_wallet_id and transfer.amount == command.amount:
+                    # Если всё один в один, то отдадим существующий перевод
+                    results[index] = BatchTransferResult(transfer=transfer, created=False)
+                else:
+                    results[index] = BatchTransferResult(
+                        error=RaceConditionException("Невозможно выполнить перевод (констрейнт)")
+                    )
+                continue
+
+            missing_wallet_id = next(
+                (wallet_id for wallet_id in (from_wallet_id, to_wallet_id) if wallet_id not in balances), None
+            )
+            if missing_wallet_id:
+                results[index] = BatchTransferResult(error=WalletNotFoundException(missing_wallet_id))
+                continue
+
+            from_balance = balances[from_wallet_id]
+            if from_balance.balance < credit:
+                results[index] = BatchTransferResult(error=NotEnoughMineralsException("Недостаточно минералов"))
+                continue
+
+            transfer = Transfer(
+                from_wallet_id=from_wallet_id,
+                to_wallet_id=to_wallet_id,
+                amount=command.amount,
+                fee=fee,
+                idempotency_key=command.idempotency_key,
+            )
+            transfers[(from_wallet_id, command.idempotency_key)] = transfer
+            new_transfers.append(transfer)
+            results[index] = BatchTransferResult(transfer=transfer, created=True)
+
+            from_balance.balance -= credit
+            balances[to_wallet_id].balance += command.amount
+            changed_balances |= {from_wallet_id, to_wallet_id}
+            new_transactions += [
+                Transaction(
+                    wallet_id=from_wallet_id,
+                    transfer=transfer,
+                    flow=Transaction.Flow.credit,
+                    amount=credit,
+                    balance_after=from_balance.balance,
+                ),
+                Transaction(
+                    wallet_id=to_wallet_id,
+                    transfer=transfer,
+                    flow=Transaction.Flow.debit,
+                    amount=command.amount,
+                    balance_after=balances[to_wallet_id].balance,
+                ),
+            ]
+
+            if fee > Decimal("0.00"):
+                admin_balance_after = None
+                if settings.FEE_SHARDS:
+                    shard = fee_shard_for(from_wallet_id)
+                    shard_fees[shard] = shard_fees.get(shard, Decimal("0.00")) + fee
+                else:
+                    balances[admin_wallet.wallet_id].balance += fee
+                    changed_balances.add(admin_wallet.wallet_id)
+                    admin_balance_after = balances[admin_wallet.wallet_id].balance
+                new_transactions.append(
+                    Transaction(
+                        wallet_id=admin_wallet.wallet_id,
+                        transfer=transfer,
+                        flow=Transaction.Flow.fee,
+                        amount=fee,
+                        balance_after=admin_balance_after,
+                    )
+                )
+
+        if not new_transfers:
+            return results
+
+        try:
+            Transfer.objects.bulk_create(new_transfers)
+        except IntegrityError as exception:
+            # Параллельный одиночный перевод успел создать перевод с тем же ключом (без TRANSFER_COALESCE_WAIT)
+            raise RaceConditionException("Невозможно выполнить перевод (констрейнт)") from exception
+
+        Transaction.objects.bulk_create(new_transactions)
+        OutboxEvent.objects.bulk_create(
+            [OutboxEvent(kind=OutboxEvent.Kind.transfer_created, transfer_id=transfer.id) for transfer in new_transfers]
+        )
+
+        changed = [balances[wallet_id] for wallet_id in sorted(changed_balances)]
+        for balance in changed:
+            balance.version += 1
+        WalletBalance.objects.bulk_update(changed, ["balance", "version"])
+        invalidate_wallet_balances(changed_balances - {admin_wallet.wallet_id})
+
+        for shard in sorted(shard_fees):
+            credit_fee_shard(shard, shard_fees[shard])
+
+    return results
+
+
+def fee_shard_for(wallet_id: uuid.UUID) -> int:
+    # Переводы с одного кошелька и так сериализуются на его балансе, поэтому шард выбирается по отправителю
+    return wallet_id.int % settings.FEE_SHARDS
+
+
+def credit_fee_shard(shard: int, fee: Decimal) -> None:
+    # Без версии: комиссия только прибавляется, а строку шарда блокирует сам UPDATE
+    updated = FeeShard.objects.filter(shard=shard).update(balance=F("balance") + fee)
+    if updated != 1:
+        FeeShard.objects.get_or_create(shard=shard)
+        FeeShard.objects.filter(shard=shard).update(balance=F("balance") + fee)
+
+
+def sweep_fee_shards() -> Decimal:
+    admin_wallet = get_admin_wallet()
+    with db_transaction.atomic():
+        shards = list(FeeShard.objects.select_for_update().filter(balance__gt=Decimal("0.00")).order_by("shard"))
+        total = sum((shard.balance for shard in shards), Decimal("0.00"))
+        if not total:
+            return total
+
+        FeeShard.objects.filter(pk__in=[shard.pk for shard in shards]).update(balance=Decimal("0.00"))
+        WalletBalance.objects.filter(pk=admin_wallet.balance_id).update(
+            balance=F("balance") + total,
+            version=F("version") + 1,
+        )
+
+    logger.info(f"Комиссия {total} перенесена из {len(shards)} шардов на админский кошелёк")
+    return total
+
+
+def get_admin_balance() -> AdminBalanceResponse:
+    admin_balance = WalletBalance.objects.get(pk=get_admin_wallet().balance_id)
+    pending = FeeShard.objects.aggregate(pending=Sum("balance"))["pending"] or Decimal("0.00")
+    return AdminBalanceResponse(
+        balance=admin_balance.balance,
+        pending_fees=pending,
+        total=admin_balance.balance + pending,
+    )
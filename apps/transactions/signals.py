@@ -0,0 +1,25 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .balances import invalidate_wallet_balances
+from .cache import invalidate_admin_wallet, is_cached_admin_wallet
+from .models import Wallet, WalletBalance
+
+
+@receiver([post_save, post_delete], sender=Wallet)
+def invalidate_admin_wallet_on_wallet_change(sender, instance, **kwargs):
+    if instance.is_admin_wallet or is_cached_admin_wallet(instance.id):
+        invalidate_admin_wallet()
+
+
+@receiver([post_save, post_delete], sender=WalletBalance)
+def invalidate_admin_wallet_on_balance_change(sender, instance, created=True, **kwargs):
+    # Обычные изменения баланса id строки не меняют
+    if created and is_cached_admin_wallet(instance.wallet_id):
+        invalidate_admin_wallet()
+
+
+@receiver([post_save, post_delete], sender=WalletBalance)
+def invalidate_wallet_balance_cache(sender, instance, **kwargs):
+    # Правки через админку и save() - переводы инвалидируют кэш сами, их update() сигналы не шлёт
+    invalidate_wallet_balances([instance.wallet_id])
@@ -0,0 +1,162 @@
+import datetime
+import logging
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+
+from .archive import archived_delta
+from .cache import get_admin_wallet
+from .exceptions import WalletNotFoundException
+from .models import Wallet, WalletBalanceSnapshot
+
+logger = logging.getLogger("transactions")
+logger.setLevel(logging.DEBUG)
+
+SIGNED_AMOUNT = "CASE WHEN t.flow = 'credit' THEN -t.amount ELSE t.amount END"
+
+# Деньги кошелька с точки зрения проводок: для админского кошелька комиссии в шардах уже учтены проводками,
+# но на баланс попадают только при переносе
+WALLET_FUNDS = """
+    (SELECT b.balance FROM transactions_walletbalance b WHERE b.wallet_id = %(wallet_id)s)
+    + CASE WHEN %(wallet_id)s = %(admin_wallet_id)s
+        THEN (SELECT COALESCE(SUM(f.balance), 0) FROM transactions_feeshard f)
+        ELSE 0
+    END
+"""
+
+# Снимки пишутся только для кошельков с проводками за день: баланс остальных не менялся.
+# Закрытие дня = прошлый снимок + проводки дня; первый снимок кошелька считается назад от текущего баланса
+SNAPSHOT_SQL = f"""
+INSERT INTO transactions_walletbalancesnapshot AS s (id, created_at, updated_at, wallet_id, day, balance)
+SELECT
+    gen_random_uuid(), now(), now(), d.wallet_id, %(day)s,
+    COALESCE(
+        (
+            SELECT p.balance + d.delta
+            FROM transactions_walletbalancesnapshot p
+            WHERE p.wallet_id = d.wallet_id AND p.day < %(day)s
+            ORDER BY p.day DESC
+            LIMIT 1
+        ),
+        {WALLET_FUNDS.replace("%(wallet_id)s", "d.wallet_id")}
+        - (
+            SELECT COALESCE(SUM({SIGNED_AMOUNT}), 0)
+            FROM transactions_transaction t
+            WHERE t.wallet_id = d.wallet_id AND t.created_at >= %(day_end)s
+        )
+    )
+FROM (
+    SELECT t.wallet_id, SUM({SIGNED_AMOUNT}) AS delta
+    FROM transactions_transaction t
+    WHERE t.created_at >= %(day_start)s AND t.created_at < %(day_end)s
+    GROUP BY t.wallet_id
+) d
+WHERE EXISTS (SELECT 1 FROM transactions_walletbalance b WHERE b.wallet_id = d.wallet_id)
+ON CONFLICT (wallet_id, day) DO UPDATE SET balance = EXCLUDED.balance, updated_at = EXCLUDED.updated_at
+"""
+
+# Без снимка: текущий баланс минус всё, что было после ts, одним запросом (одним снимком БД)
+AS_OF_FROM_BALANCE_SQL = f"""
+SELECT
+    {WALLET_FUNDS}
+    - (
+        SELECT COALESCE(SUM({SIGNED_AMOUNT}), 0)
+        FROM transactions_transaction t
+        WHERE t.wallet_id = %(wallet_id)s AND t.created_at > %(ts)s
+    )
+"""
+
+AS_OF_FROM_SNAPSHOT_SQL = f"""
+SELECT %(balance)s + COALESCE(SUM({SIGNED_AMOUNT}), 0)
+FROM transactions_transaction t
+WHERE t.wallet_id = %(wallet_id)s AND t.created_at >= %(day_end)s AND t.created_at <= %(ts)s
+"""
+
+
+def day_bounds(day: datetime.date) -> tuple[datetime.datetime, datetime.datetime]:
+    start = datetime.datetime.combine(day, datetime.time.min, tzinfo=datetime.UTC)
+    return start, start + datetime.timedelta(days=1)
+
+
+def _admin_wallet_id() -> uuid.UUID | None:
+    try:
+        return get_admin_wallet().wallet_id
+    except Wallet.DoesNotExist:
+        return None
+
+
+def last_closed_day() -> datetime.date:
+    # День закрыт, когда его проводки гарантированно закоммичены (то же окно, что и у сверки)
+    settled = timezone.now() - datetime.timedelta(seconds=settings.RECONCILIATION_SAFETY_LAG)
+    return settled.astimezone(datetime.UTC).date() - datetime.timedelta(days=1)
+
+
+def snapshot_day(day: datetime.date) -> int:
+    day_start, day_end = day_bounds(day)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            SNAPSHOT_SQL,
+            {"day": day, "day_start": day_start, "day_end": day_end, "admin_wallet_id": _admin_wallet_id()},
+        )
+        return cursor.rowcount
+
+
+def snapshot_balances(day: datetime.date = None) -> dict[datetime.date, int]:
+    """
+    Закрывающие балансы за день day или за все закрытые дни после последнего снимка.
+    Повторный запуск за тот же день перезаписывает его снимки.
+    """
+    if day is not None:
+        days = [day]
+    else:
+        last_day = last_closed_day()
+        previous = WalletBalanceSnapshot.objects.aggregate(day=Max("day"))["day"] or last_day - datetime.timedelta(
+            days=1
+        )
+        days = [previous + datetime.timedelta(days=offset) for offset in range(1, (last_day - previous).days + 1)]
+
+    written = {}
+    for current in days:
+        written[current] = snapshot_day(current)
+        logger.info(f"Снимки балансов за {current}: {written[current]}")
+
+    return written
+
+
+def balance_as_of(wallet_id: uuid.UUID, ts: datetime.datetime) -> Decimal:
+    """
+    Баланс кошелька на момент ts: ближайший снимок до дня ts плюс проводки после него.
+    Проводки, перенесённые в архив, читаются из сегментов.
+    """
+    after_ts = ts + datetime.timedelta(microseconds=1)
+    snapshot = (
+        WalletBalanceSnapshot.objects.filter(wallet_id=wallet_id, day__lt=ts.astimezone(datetime.UTC).date())
+        .order_by("-day")
+        .values_list("day", "balance")
+        .first()
+    )
+
+    with connection.cursor() as cursor:
+        if snapshot is not None:
+            day, balance = snapshot
+            cursor.execute(
+                AS_OF_FROM_SNAPSHOT_SQL,
+                {"balance": balance, "wallet_id": wallet_id, "day_end": day_bounds(day)[1], "ts": ts},
+            )
+        else:
+            cursor.execute(
+                AS_OF_FROM_BALANCE_SQL,
+                {"wallet_id": wallet_id, "admin_wallet_id": _admin_wallet_id(), "ts": ts},
+            )
+        balance = cursor.fetchone()[0]
+
+    if balance is None:
+        raise WalletNotFoundException(wallet_id)
+
+    if snapshot is not None:
+        return balance + archived_delta(wallet_id, day_bounds(day)[1], after_ts)
+    return balance - archived_delta(wallet_id, after_ts)
@@ -1,25 +1,68 @@
 import logging
-import random
-import time
+import uuid
+
 from celery import shared_task
+from django.conf import settings
 
-from apps.transactions.models import Transfer
+from apps.transactions.archive import archive_ledger as archive_ledger_service
+from apps.transactions.notifications import dispatch_notifications, flush_digests, recover_digests
+from apps.transactions.partitions import manage_partitions as manage_partitions_service
+from apps.transactions.reconciliation import reconcile_ledger as reconcile_ledger_service
+from apps.transactions.snapshots import snapshot_balances as snapshot_balances_service
+from apps.transactions.services import sweep_fee_shards as sweep_fee_shards_service
 
 logger = logging.getLogger("transactions")
 logger.setLevel(logging.DEBUG)
 
 
-@shared_task(bind=True, default_retry_delay=1, max_retries=3)
-def notify_recipient(self, transfer_id: int) -> None:
-    transfer = Transfer.objects.get(id=transfer_id)
-    logger.debug(
-        f"Уведомление для перевода {transfer_id}: {str(transfer.from_wallet.id)[:8]} -> {str(transfer.to_wallet.id)[:8]}"
-    )
-    time.sleep(5)
+# Повторы с backoff - внутри диспетчера, не через retry Celery: ответы и паузы всех уведомлений задачи ждутся одновременно.
+# notify_recipient остаётся для сообщений, поставленных в очередь до outbox
+@shared_task
+def notify_recipient(transfer_id: uuid.UUID) -> int:
+    return notify_recipients([transfer_id])
+
+
+@shared_task
+def notify_recipients(transfer_ids: list[uuid.UUID]) -> int:
+    result = dispatch_notifications(transfer_ids)
+    for wallet_id in result.scheduled:
+        flush_notification_digest.apply_async(args=[wallet_id], countdown=settings.NOTIFICATION_DIGEST_WINDOW)
+    return result.sent
+
+
+@shared_task
+def flush_notification_digest(wallet_id: uuid.UUID) -> int:
+    return flush_digests([wallet_id]).sent
+
+
+@shared_task
+def recover_notification_digests() -> int:
+    return recover_digests().sent
+
+
+@shared_task
+def sweep_fee_shards() -> str:
+    return str(sweep_fee_shards_service())
+
+
+@shared_task
+def reconcile_ledger() -> str | None:
+    run = reconcile_ledger_service()
+    return str(run.id) if run else None
+
+
+@shared_task
+def snapshot_balances() -> dict[str, int]:
+    return {str(day): written for day, written in snapshot_balances_service().items()}
+
+
+@shared_task
+def manage_partitions() -> dict[str, list[str]]:
+    created, detached = manage_partitions_service()
+    return {"created": created, "detached": detached}
 
-    # симуляция падения
-    if random.random() < 0.5:
-        raise self.retry(exc=RuntimeError("Не удалось отправить уведомление"))
 
-    logger.debug(f"Уведомление для перевода {transfer_id} отправлено")
-    return None
+@shared_task
+def archive_ledger() -> list[str] | None:
+    segments = archive_ledger_service()
+    return None if segments is None else [segment.name for segment in segments]
@@ -1,8 +1,24 @@
 from django.urls import path
 
-from apps.transactions.views import TransferView
+from apps.transactions.views import (
+    TransferView,
+    AsyncTransferView,
+    AdminBalanceView,
+    BatchTransferView,
+    WalletBalanceView,
+    BulkWalletBalanceView,
+    WalletTransactionListView,
+    WalletStatementView,
+)
 
 app_name = "transactions"
 urlpatterns = [
     path("transfer/", TransferView.as_view(), name="transfer"),
+    path("transfer/async/", AsyncTransferView.as_view(), name="transfer-async"),
+    path("transfers/batch/", BatchTransferView.as_view(), name="transfer-batch"),
+    path("admin-wallet/balance/", AdminBalanceView.as_view(), name="admin-balance"),
+    path("wallets/<uuid:wallet_id>/balance/", WalletBalanceView.as_view(), name="wallet-balance"),
+    path("wallets/balances/", BulkWalletBalanceView.as_view(), name="wallet-balances"),
+    path("wallets/<uuid:wallet_id>/transactions/", WalletTransactionListView.as_view(), name="wallet-transactions"),
+    path("wallets/<uuid:wallet_id>/statement/", WalletStatementView.as_view(), name="wallet-statement"),
 ]
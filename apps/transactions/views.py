@@ -1,8 +1,45 @@
-from rest_framework import generics
-from rest_framework.exceptions import ValidationError
+import hashlib
+import json
 
-from apps.transactions.models import Transfer
-from apps.transactions.serializers import TransferSerializer
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import generics, permissions, status
+from rest_framework.exceptions import APIException, ParseError, ValidationError, NotFound
+from rest_framework.response import Response
+
+from apps.transactions.balances import get_wallet_balances
+from apps.transactions.cache import get_admin_wallet
+
+from apps.transactions.exceptions import ConflictError, IdempotencyConflictException, WalletNotFoundException
+from apps.transactions.idempotency import IdempotencyRecord
+from apps.transactions.models import Transfer, Transaction, Wallet
+from apps.transactions.pagination import KeysetPagination
+from apps.transactions.snapshots import balance_as_of
+from apps.transactions.statements import STATEMENT_CONTENT_TYPES, export_statement
+from apps.transactions.serializers import (
+    TransferSerializer,
+    AdminBalanceSerializer,
+    BatchTransferSerializer,
+    WalletBalanceSerializer,
+    WalletBalanceAsOfSerializer,
+    BulkWalletBalanceSerializer,
+    WalletTransactionSerializer,
+    WalletTransactionFilterSerializer,
+    StatementQuerySerializer,
+)
+from apps.transactions.services import get_admin_balance
+
+
+def get_idempotency_key(request) -> str:
+    idempotency_key = request.headers.get("Idempotency-Key")
+    if not idempotency_key:
+        if idempotency_key is None:
+            raise ValidationError("Не передан заголовок Idempotency-Key")
+
+        raise ValidationError("Пустой заголовок Idempotency-Key")
+
+    return idempotency_key
 
 
 class TransferView(generics.CreateAPIView):
@@ -15,13 +52,262 @@ class TransferView(generics.CreateAPIView):
     )
 
     def get_serializer_context(self):
-        idempotency_key = self.request.headers.get("Idempotency-Key")
-        if not idempotency_key:
-            if idempotency_key is None:
-                raise ValidationError("Не передан заголовок Idempotency-Key")
-
-            raise ValidationError("Пустой заголовок Idempotency-Key")
-
         context = super().get_serializer_context()
-        context["idempotency_key"] = idempotency_key
+        context["idempotency_key"] = get_idempotency_key(self.request)
         return context
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # Повторы с тем же Idempotency-Key отвечаются из Redis, не доходя до Postgres
+        record = IdempotencyRecord.for_transfer(serializer.validated_data, serializer.context["idempotency_key"])
+        try:
+            stored = record.begin()
+        except IdempotencyConflictException as exception:
+            raise ConflictError(detail=exception) from exception
+
+        if stored is not None:
+            return Response(stored.body, status=stored.status, headers={"Idempotent-Replayed": "true"})
+
+        try:
+            self.perform_create(serializer)
+        except BaseException:
+            record.release()
+            raise
+
+        status_code = status.HTTP_201_CREATED if serializer.transfer_created else status.HTTP_200_OK
+        record.complete(status_code, serializer.data)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status_code, headers=headers)
+
+
+class AsyncTransferView(View):
+    """
+    TransferView для ASGI (uvicorn, gunicorn с UvicornWorker): Redis и паузы между повторами ждутся в event loop,
+    транзакция перевода выполняется в потоке запроса. DRF не поддерживает async-представления, поэтому тело
+    (только JSON) разбирается, а ответы и ошибки формируются здесь - в том же формате, что у TransferView.
+    """
+
+    serializer_class = TransferSerializer
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Аутентификации нет, как и у TransferView, поэтому и CSRF не проверяется
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            return await self.create(request)
+        except APIException as exception:
+            detail = exception.detail if isinstance(exception.detail, (list, dict)) else {"detail": exception.detail}
+            return self.json_response(detail, exception.status_code)
+
+    async def create(self, request):
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError as exception:
+            raise ParseError(f"JSON parse error - {exception}") from exception
+
+        serializer = self.serializer_class(data=data, context={"idempotency_key": get_idempotency_key(request)})
+        serializer.is_valid(raise_exception=True)
+
+        record = IdempotencyRecord.for_transfer(serializer.validated_data, serializer.context["idempotency_key"])
+        try:
+            stored = await record.abegin()
+        except IdempotencyConflictException as exception:
+            raise ConflictError(detail=exception) from exception
+
+        if stored is not None:
+            return self.json_response(stored.body, stored.status, headers={"Idempotent-Replayed": "true"})
+
+        try:
+            await serializer.asave()
+        except BaseException:
+            await record.arelease()
+            raise
+
+        status_code = status.HTTP_201_CREATED if serializer.transfer_created else status.HTTP_200_OK
+        await record.acomplete(status_code, serializer.data)
+        return self.json_response(serializer.data, status_code)
+
+    @staticmethod
+    def json_response(data, status_code, headers=None):
+        return JsonResponse(
+            data, status=status_code, headers=headers, safe=False, json_dumps_params={"ensure_ascii": False}
+        )
+
+
+class BatchTransferView(generics.GenericAPIView):
+    serializer_class = BatchTransferSerializer
+    permission_classes = (
+        # Отключено из-за отсутствия реализации аутентификации
+        # permissions.IsAuthenticated,
+    )
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
+
+class AdminBalanceView(generics.GenericAPIView):
+    serializer_class = AdminBalanceSerializer
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        serializer = self.get_serializer(get_admin_balance())
+        return Response(serializer.data)
+
+
+class ETagMixin:
+    """
+    ETag по версиям балансов: совпавший If-None-Match получает 304 без тела.
+    """
+
+    def etag_response(self, request, data, etag):
+        etag = f'"{etag}"'
+        if_none_match = request.headers.get("If-None-Match", "")
+        matches = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in matches or "*" in matches:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        return Response(data, headers={"ETag": etag})
+
+
+class WalletBalanceView(ETagMixin, generics.GenericAPIView):
+    serializer_class = WalletBalanceSerializer
+    permission_classes = (
+        # Отключено из-за отсутствия реализации аутентификации
+        # permissions.IsAuthenticated,
+    )
+
+    def get(self, request, wallet_id, *args, **kwargs):
+        if "as_of" in request.query_params:
+            return self.get_as_of(request, wallet_id)
+
+        balance = get_wallet_balances([wallet_id]).get(wallet_id)
+        if balance is None:
+            raise NotFound(f"Кошелёк {wallet_id} не найден")
+
+        return self.etag_response(request, self.get_serializer(balance).data, f"{wallet_id}:{balance.version}")
+
+    def get_as_of(self, request, wallet_id):
+        # Исторический баланс не кэшируется: снимок + проводки после него
+        serializer = WalletBalanceAsOfSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        as_of = serializer.validated_data["as_of"]
+        if wallet_id == get_admin_wallet().wallet_id:
+            raise NotFound(f"Кошелёк {wallet_id} не найден")
+
+        try:
+            balance = balance_as_of(wallet_id, as_of)
+        except WalletNotFoundException as exception:
+            raise NotFound(f"Кошелёк {wallet_id} не найден") from exception
+
+        return Response(WalletBalanceAsOfSerializer({"wallet_id": wallet_id, "balance": balance, "as_of": as_of}).data)
+
+
+class BulkWalletBalanceView(ETagMixin, generics.GenericAPIView):
+    serializer_class = BulkWalletBalanceSerializer
+    permission_classes = (
+        # Отключено из-за отсутствия реализации аутентификации
+        # permissions.IsAuthenticated,
+    )
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        wallet_ids = list(dict.fromkeys(serializer.validated_data["wallet_ids"]))
+
+        balances = get_wallet_balances(wallet_ids)
+        found = [balances[wallet_id] for wallet_id in wallet_ids if wallet_id in balances]
+        data = {
+            "balances": WalletBalanceSerializer(found, many=True).data,
+            "not_found": [wallet_id for wallet_id in wallet_ids if wallet_id not in balances],
+        }
+        versions = ",".join(
+            f"{wallet_id}:{balances[wallet_id].version if wallet_id in balances else '-'}" for wallet_id in wallet_ids
+        )
+        return self.etag_response(request, data, hashlib.blake2b(versions.encode(), digest_size=16).hexdigest())
+
+
+class WalletTransactionListView(generics.ListAPIView):
+    serializer_class = WalletTransactionSerializer
+    pagination_class = KeysetPagination
+    permission_classes = (
+        # Отключено из-за отсутствия реализации аутентификации
+        # permissions.IsAuthenticated,
+    )
+
+    def get_queryset(self):
+        wallet_id = self.kwargs["wallet_id"]
+        if wallet_id == get_admin_wallet().wallet_id:
+            raise NotFound(f"Кошелёк {wallet_id} не найден")
+
+        filters = WalletTransactionFilterSerializer(data=self.request.query_params)
+        filters.is_valid(raise_exception=True)
+
+        # Только колонки индекса transaction_wallet_history, balance_after и перевода, без N+1 на контрагента
+        queryset = (
+            Transaction.objects.filter(wallet_id=wallet_id)
+            .select_related("transfer")
+            .only(
+                "id",
+                "created_at",
+                "flow",
+                "amount",
+                "balance_after",
+                "transfer",
+                "transfer__from_wallet",
+                "transfer__to_wallet",
+            )
+        )
+        if "flow" in filters.validated_data:
+            queryset = queryset.filter(flow=filters.validated_data["flow"])
+        if "created_after" in filters.validated_data:
+            queryset = queryset.filter(created_at__gte=filters.validated_data["created_after"])
+        if "created_before" in filters.validated_data:
+            queryset = queryset.filter(created_at__lt=filters.validated_data["created_before"])
+
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if not response.data["results"] and not request.query_params.get(self.paginator.cursor_query_param):
+            # Пустая первая страница: отличаем кошелёк без операций от несуществующего
+            if not Wallet.objects.filter(id=self.kwargs["wallet_id"]).exists():
+                raise NotFound(f"Кошелёк {self.kwargs['wallet_id']} не найден")
+
+        return response
+
+
+class WalletStatementView(generics.GenericAPIView):
+    serializer_class = StatementQuerySerializer
+    permission_classes = (
+        # Отключено из-за отсутствия реализации аутентификации
+        # permissions.IsAuthenticated,
+    )
+
+    def get(self, request, wallet_id, *args, **kwargs):
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        # После начала стрима ошибку уже не вернуть, поэтому кошелёк проверяется заранее
+        if wallet_id == get_admin_wallet().wallet_id or not Wallet.objects.filter(id=wallet_id).exists():
+            raise NotFound(f"Кошелёк {wallet_id} не найден")
+
+        compress = "gzip" in request.headers.get("Accept-Encoding", "")
+        response = StreamingHttpResponse(
+            export_statement(wallet_id, params["date_from"], params["date_to"], params["output"], compress),
+            content_type=STATEMENT_CONTENT_TYPES[params["output"]],
+        )
+        filename = f"statement-{wallet_id}-{params['date_from']}-{params['date_to']}.{params['output']}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        response["Vary"] = "Accept-Encoding"
+        if compress:
+            response["Content-Encoding"] = "gzip"
+
+        return response
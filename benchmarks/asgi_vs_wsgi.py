@@ -0,0 +1,166 @@
+"""
+Пропускная способность и задержки перевода: gunicorn с sync-воркерами (WSGI, TransferView)
+против gunicorn с UvicornWorker (ASGI, AsyncTransferView) на одном и том же числе ядер.
+
+    ENV_FILE=.env python -m benchmarks.asgi_vs_wsgi --cores 4 --concurrency 64 --duration 30
+
+Оба сервера запускаются по очереди на --cores ядрах (sched_setaffinity) с --cores воркерами, нагрузка -
+замкнутый цикл: --concurrency клиентов, каждый отправляет следующий перевод после ответа на предыдущий.
+Кошельки создаёт seed_wallets, переводы идут между случайными парами из --wallets кошельков.
+Под ASGI каждый запрос в полёте держит свой поток, соединения с БД берутся из пула (до DB_POOL_MAX_SIZE на воркер).
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import aiohttp
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# (путь перевода, команда, переменные окружения - как у web и web-asgi в docker-compose)
+SERVERS = {
+    "wsgi": (
+        "/api/transfer/",
+        ["gunicorn", "project.wsgi:application", "--workers", "{workers}", "--threads", "{threads}"],
+        {},
+    ),
+    "asgi": (
+        "/api/transfer/async/",
+        ["gunicorn", "project.asgi:application", "-k", "uvicorn_worker.UvicornWorker", "--workers", "{workers}"],
+        {"DB_POOL_ENABLED": "True"},
+    ),
+}
+
+
+def seed_wallets(count: int) -> list[str]:
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
+    sys.path.insert(0, str(BASE_DIR))
+
+    import django
+
+    django.setup()
+
+    from django.core.management import call_command
+
+    from apps.transactions.models import Wallet
+
+    call_command("seed_wallets", wallets=count, transfers=0, stdout=io.StringIO())
+    wallets = Wallet.objects.filter(user__username__startswith="seed_user_", is_admin_wallet=False)
+    return [str(wallet_id) for wallet_id in wallets.values_list("id", flat=True)[:count]]
+
+
+def start_server(name: str, port: int, cores: int, threads: int) -> subprocess.Popen:
+    _, command, server_env = SERVERS[name]
+    command = [part.format(workers=cores, threads=threads) for part in command]
+    command += ["-b", f"127.0.0.1:{port}", "--timeout", "120", "--log-level", "warning"]
+
+    def pin():
+        os.sched_setaffinity(0, range(cores))
+
+    # DEBUG копит все SQL-запросы в памяти процесса и исказил бы результат
+    env = {**os.environ, **server_env, "DEBUG": "False", "ALLOWED_HOSTS": "*"}
+    server = subprocess.Popen(command, cwd=BASE_DIR, env=env, preexec_fn=pin)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError(f"{name}: сервер завершился с кодом {server.returncode}")
+            time.sleep(0.2)
+
+    server.terminate()
+    raise RuntimeError(f"{name}: сервер не запустился за 30 секунд")
+
+
+async def run_load(url: str, wallets: list[str], concurrency: int, duration: float, warmup: float) -> dict:
+    latencies = []
+    statuses = {}
+    started = time.monotonic()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    async def client(session: aiohttp.ClientSession):
+        while (now := time.monotonic()) < stop_at:
+            from_wallet, to_wallet = random.sample(wallets, 2)
+            payload = {"from_wallet": from_wallet, "to_wallet": to_wallet, "amount": "1.00"}
+            try:
+                async with session.post(url, json=payload, headers={"Idempotency-Key": str(uuid.uuid4())}) as response:
+                    await response.read()
+                    status = response.status
+            except aiohttp.ClientError as exception:
+                status = type(exception).__name__
+
+            if now >= measure_from:
+                latencies.append(time.monotonic() - now)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=120)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / duration, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+        "statuses": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Переводы под WSGI и ASGI на одинаковом числе ядер")
+    parser.add_argument("--cores", type=int, default=os.cpu_count())
+    parser.add_argument("--threads", type=int, default=4, help="Потоков на sync-воркер (WSGI)")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument("--wallets", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--servers", nargs="+", choices=list(SERVERS), default=list(SERVERS))
+    parser.add_argument("--json", action="store_true", help="Вывести результат в JSON")
+    args = parser.parse_args()
+
+    wallets = seed_wallets(args.wallets)
+    results = {}
+    for name in args.servers:
+        path, _, _ = SERVERS[name]
+        server = start_server(name, args.port, args.cores, args.threads)
+        try:
+            url = f"http://127.0.0.1:{args.port}{path}"
+            results[name] = asyncio.run(run_load(url, wallets, args.concurrency, args.duration, args.warmup))
+        finally:
+            server.terminate()
+            server.wait()
+
+    if args.json:
+        print(json.dumps({"cores": args.cores, "concurrency": args.concurrency, "results": results}, indent=2))
+        return
+
+    print(f"cores={args.cores} concurrency={args.concurrency} duration={args.duration}s")
+    print(f"{'server':<8}{'requests':>10}{'rps':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}  statuses")
+    for name, result in results.items():
+        print(
+            f"{name:<8}{result['requests']:>10}{result['rps']:>10}{result['p50_ms']:>10}"
+            f"{result['p99_ms']:>10}{result['max_ms']:>10}  {result['statuses']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Цена соединения с БД на перевод: без постоянных соединений, с постоянными (DB_CONN_MAX_AGE), с пулом psycopg
+и с пулом без подготовленных запросов (DB_PGBOUNCER).
+
+    ENV_FILE=.env python -m benchmarks.db_connections --requests 2000 --threads 4 --engine plpgsql
+
+Каждый режим выполняется в отдельном процессе со своими настройками: --threads потоков, как потоки воркера gunicorn,
+выполняют --requests переводов, каждый - между сигналами request_started/request_finished, как в запросе Django.
+Результат - переводов в секунду, p50/p99 и сколько серверных соединений (backend pid) было открыто.
+С БД по сети и с TLS разница между режимами больше, чем с локальной.
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+MODES = {
+    "no-persistence": {"DB_CONN_MAX_AGE": "0", "DB_POOL_ENABLED": "False"},
+    "persistent": {"DB_CONN_MAX_AGE": "60", "DB_POOL_ENABLED": "False"},
+    "pool": {"DB_POOL_ENABLED": "True"},
+    "pool-pgbouncer": {"DB_POOL_ENABLED": "True", "DB_PGBOUNCER": "True"},
+}
+
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
+    sys.path.insert(0, str(BASE_DIR))
+
+    import django
+
+    django.setup()
+
+
+def seed_wallets(count: int) -> list[str]:
+    setup_django()
+
+    from django.core.management import call_command
+
+    from apps.transactions.models import Wallet
+
+    call_command("seed_wallets", wallets=count, transfers=0, stdout=io.StringIO())
+    wallets = Wallet.objects.filter(user__username__startswith="seed_user_", is_admin_wallet=False)
+    return [str(wallet_id) for wallet_id in wallets.values_list("id", flat=True)[:count]]
+
+
+def run_mode(wallets: list[str], requests: int, threads: int) -> dict:
+    setup_django()
+
+    from django.core import signals
+    from django.db import connection
+
+    from apps.transactions.dto import TransferCreateCommand
+    from apps.transactions.services import transfer_funds
+
+    backends = set()
+    backends_lock = threading.Lock()
+
+    def request(_):
+        from_wallet, to_wallet = random.sample(wallets, 2)
+        started = time.perf_counter()
+        signals.request_started.send(sender=None)
+        try:
+            transfer_funds(
+                TransferCreateCommand(
+                    from_wallet_id=uuid.UUID(from_wallet),
+                    to_wallet_id=uuid.UUID(to_wallet),
+                    amount=Decimal("1.00"),
+                    idempotency_key=str(uuid.uuid4()),
+                )
+            )
+            with backends_lock:
+                backends.add(connection.connection.info.backend_pid)
+        finally:
+            signals.request_finished.send(sender=None)
+
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = sorted(executor.map(request, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "rps": round(requests / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+        "connections": len(backends),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Переводы с разными режимами соединений с БД")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--wallets", type=int, default=200)
+    parser.add_argument("--engine", choices=["orm", "plpgsql"], default="plpgsql")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--json", action="store_true", help="Вывести результат в JSON")
+    parser.add_argument("--run-mode", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_mode:
+        wallets = json.loads(sys.stdin.read())
+        print(json.dumps(run_mode(wallets, args.requests, args.threads)))
+        return
+
+    wallets = seed_wallets(args.wallets)
+    results = {}
+    for mode in args.modes:
+        # Настройки БД читаются при импорте settings, поэтому каждый режим - свой процесс
+        env = {**os.environ, **MODES[mode], "TRANSFER_ENGINE": args.engine, "DEBUG": "False"}
+        command = [sys.executable, "-m", "benchmarks.db_connections", "--run-mode", mode]
+        command += ["--requests", str(args.requests), "--threads", str(args.threads)]
+        output = subprocess.run(
+            command, cwd=BASE_DIR, env=env, input=json.dumps(wallets), capture_output=True, text=True, check=True
+        ).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    if args.json:
+        print(json.dumps({"engine": args.engine, "threads": args.threads, "results": results}, indent=2))
+        return
+
+    print(f"engine={args.engine} threads={args.threads} requests={args.requests}")
+    print(f"{'mode':<16}{'rps':>10}{'p50 ms':>10}{'p99 ms':>10}{'connections':>13}")
+    for mode, result in results.items():
+        print(f"{mode:<16}{result['rps']:>10}{result['p50_ms']:>10}{result['p99_ms']:>10}{result['connections']:>13}")
+
+
+if __name__ == "__main__":
+    main()
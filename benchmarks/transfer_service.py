@@ -0,0 +1,377 @@
+"""
+Сервисный слой переводов без HTTP: transfer_funds вызывается напрямую из --processes процессов по --threads потоков.
+
+    ENV_FILE=.env python -m benchmarks.transfer_service --scenarios uniform zipf hot --processes 2 --threads 4
+
+Для каждого вызова измеряются задержка, число SQL-запросов и время в БД (connection.execute_wrapper), попытки
+повтора и исход. Отдельный поток раз в lock_sample_interval секунд считает в pg_stat_activity соединения,
+ждущие блокировку строки, - отсюда оценка суммарного ожидания блокировок.
+Популярность кошельков задаёт сценарий: равномерно, по Ципфу или горячие кошельки.
+Тот же прогон с порогами регрессии - tests/transfer_benchmark_tests.py (pytest -m benchmark).
+"""
+
+import argparse
+import dataclasses
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+THRESHOLDS_FILE = BASE_DIR / "benchmarks" / "transfer_service_thresholds.json"
+
+# Баланс кошелька бенчмарка: переводы не должны упираться в нехватку средств
+WALLET_BALANCE = Decimal("1000000.00")
+
+
+@dataclasses.dataclass(frozen=True)
+class BenchmarkConfig:
+    # uniform - все кошельки одинаково, zipf - по закону Ципфа (zipf_s), hot - hot_share переводов идёт с hot_wallets
+    distribution: str = "uniform"
+    wallets: int = 50
+    processes: int = 1
+    threads: int = 4
+    transfers: int = 50  # на поток
+    fee_ratio: float = 0.2
+    zipf_s: float = 1.1
+    hot_wallets: int = 2
+    hot_share: float = 0.8
+    seed: int = 0
+    lock_sample_interval: float = 0.005
+
+
+SCENARIOS = {
+    "uniform": BenchmarkConfig(distribution="uniform"),
+    "zipf": BenchmarkConfig(distribution="zipf"),
+    "hot": BenchmarkConfig(distribution="hot"),
+    "uniform-processes": BenchmarkConfig(distribution="uniform", processes=2, threads=2),
+}
+
+
+@dataclasses.dataclass
+class CallSample:
+    started: float  # time.monotonic(): общие часы для всех процессов
+    latency: float
+    queries: int
+    db_time: float
+    attempts: int
+    outcome: str
+
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
+    sys.path.insert(0, str(BASE_DIR))
+
+    import django
+
+    django.setup()
+
+
+def create_wallets(count: int) -> list[str]:
+    """
+    Кошельки бенчмарка с балансом WALLET_BALANCE и админский кошелёк, если его ещё нет.
+    """
+    from django.contrib.auth import get_user_model
+
+    from apps.transactions.models import Wallet, WalletBalance
+
+    User = get_user_model()
+    admin_user, _ = User.objects.get_or_create(username="admin_wallet_user")
+    admin_wallet, _ = Wallet.objects.get_or_create(is_admin_wallet=True, defaults={"user": admin_user})
+    WalletBalance.objects.get_or_create(wallet=admin_wallet)
+
+    prefix = f"bench_{uuid.uuid4().hex[:8]}"
+    users = User.objects.bulk_create([User(username=f"{prefix}_{index}") for index in range(count)])
+    wallets = Wallet.objects.bulk_create([Wallet(user=user) for user in users])
+    WalletBalance.objects.bulk_create([WalletBalance(wallet=wallet, balance=WALLET_BALANCE) for wallet in wallets])
+    return [str(wallet.id) for wallet in wallets]
+
+
+def wallet_weights(config: BenchmarkConfig) -> list[float]:
+    if config.distribution == "zipf":
+        return [1 / rank**config.zipf_s for rank in range(1, config.wallets + 1)]
+
+    if config.distribution == "hot":
+        hot, cold = config.hot_wallets, config.wallets - config.hot_wallets
+        return [config.hot_share / hot] * hot + [(1 - config.hot_share) / cold] * cold
+
+    return [1.0] * config.wallets
+
+
+def plan_transfers(config: BenchmarkConfig, wallets: list[str], worker: int) -> list[tuple[str, str, Decimal]]:
+    """
+    (отправитель, получатель, сумма) для одного потока; последовательность зависит только от seed и номера потока.
+    """
+    rng = random.Random(f"{config.seed}:{worker}")
+    cum_weights = list(itertools.accumulate(wallet_weights(config)))
+    planned = []
+    for _ in range(config.transfers):
+        from_wallet, to_wallet = rng.choices(wallets, cum_weights=cum_weights, k=2)
+        while to_wallet == from_wallet:
+            to_wallet = rng.choices(wallets, cum_weights=cum_weights)[0]
+        amount = Decimal("1001.00") if rng.random() < config.fee_ratio else Decimal("1.00")
+        planned.append((from_wallet, to_wallet, amount))
+    return planned
+
+
+def run_worker(planned: list[tuple[str, str, Decimal]]) -> list[CallSample]:
+    from django.db import connection
+
+    from apps.transactions.dto import TransferCreateCommand
+    from apps.transactions.exceptions import RaceConditionException
+    from apps.transactions.services import transfer_funds
+
+    samples = []
+    counter = {"queries": 0, "db_time": 0.0}
+
+    def count_queries(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            counter["queries"] += 1
+            counter["db_time"] += time.perf_counter() - started
+
+    try:
+        with connection.execute_wrapper(count_queries):
+            for from_wallet, to_wallet, amount in planned:
+                counter.update(queries=0, db_time=0.0)
+                attempts, outcome = 0, "ok"
+                started_at, started = time.monotonic(), time.perf_counter()
+                try:
+                    response = transfer_funds(
+                        TransferCreateCommand(
+                            from_wallet_id=uuid.UUID(from_wallet),
+                            to_wallet_id=uuid.UUID(to_wallet),
+                            amount=amount,
+                            idempotency_key=str(uuid.uuid4()),
+                        )
+                    )
+                    attempts = response.attempts
+                except RaceConditionException:
+                    outcome = "conflict"
+                except Exception as exception:
+                    outcome = type(exception).__name__
+                latency = time.perf_counter() - started
+                samples.append(
+                    CallSample(started_at, latency, counter["queries"], counter["db_time"], attempts, outcome)
+                )
+    finally:
+        connection.close()
+
+    return samples
+
+
+def run_threads(plans: list[list[tuple[str, str, Decimal]]]) -> list[CallSample]:
+    with ThreadPoolExecutor(max_workers=len(plans)) as executor:
+        return [sample for samples in executor.map(run_worker, plans) for sample in samples]
+
+
+def init_process(database_name: str, engine: str):
+    setup_django()
+
+    from django.conf import settings
+    from django.db import connections
+
+    # Дочерний процесс работает с той же (в pytest - тестовой) базой и тем же движком, что и родитель
+    connections["default"].settings_dict["NAME"] = database_name
+    settings.TRANSFER_ENGINE = engine
+
+
+class LockWaitSampler(threading.Thread):
+    """
+    Раз в interval секунд считает соединения этой базы, ждущие блокировку (wait_event_type = 'Lock').
+    Сумма (число ждущих x прошедшее время) - оценка общего времени ожидания блокировок.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.lock_wait = 0.0
+        self.max_waiting = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        from django.db import connection
+
+        try:
+            with connection.cursor() as cursor:
+                sampled_at = time.perf_counter()
+                while not self._stopped.wait(self.interval):
+                    cursor.execute(
+                        "SELECT count(*) FROM pg_stat_activity"
+                        " WHERE datname = current_database() AND wait_event_type = 'Lock'"
+                    )
+                    waiting = cursor.fetchone()[0]
+                    now = time.perf_counter()
+                    self.lock_wait += waiting * (now - sampled_at)
+                    self.max_waiting = max(self.max_waiting, waiting)
+                    sampled_at = now
+        finally:
+            connection.close()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def percentile(sorted_values: list[float], percent: float) -> float:
+    return sorted_values[max(0, math.ceil(len(sorted_values) * percent / 100) - 1)]
+
+
+def run_benchmark(config: BenchmarkConfig, wallets: list[str]) -> dict:
+    """
+    Один прогон config по кошелькам wallets. Кошельки должны быть закоммичены: их читают другие соединения.
+    """
+    from django.conf import settings
+    from django.db import connection
+
+    workers = config.processes * config.threads
+    plans = [plan_transfers(config, wallets[: config.wallets], worker) for worker in range(workers)]
+
+    sampler = LockWaitSampler(config.lock_sample_interval)
+    sampler.start()
+    try:
+        if config.processes == 1:
+            samples = run_threads(plans)
+        else:
+            # spawn: дочерний процесс не наследует открытые соединения с БД
+            context = multiprocessing.get_context("spawn")
+            initargs = (connection.settings_dict["NAME"], settings.TRANSFER_ENGINE)
+            chunks = [plans[index :: config.processes] for index in range(config.processes)]
+            with context.Pool(config.processes, initializer=init_process, initargs=initargs) as pool:
+                samples = [sample for samples in pool.map(run_threads, chunks) for sample in samples]
+    finally:
+        sampler.stop()
+
+    # От первого вызова до конца последнего: запуск процессов в пропускную способность не входит
+    elapsed = max(sample.started + sample.latency for sample in samples) - min(sample.started for sample in samples)
+    return build_report(config, samples, elapsed, sampler)
+
+
+def build_report(config: BenchmarkConfig, samples: list[CallSample], elapsed: float, sampler: LockWaitSampler) -> dict:
+    from django.conf import settings
+
+    latencies = sorted(sample.latency for sample in samples)
+    queries = [sample.queries for sample in samples if sample.outcome == "ok"]
+    succeeded = [sample for sample in samples if sample.outcome == "ok"]
+    outcomes = {}
+    for sample in samples:
+        outcomes[sample.outcome] = outcomes.get(sample.outcome, 0) + 1
+
+    return {
+        "config": dataclasses.asdict(config),
+        "engine": settings.TRANSFER_ENGINE,
+        "transfers": len(samples),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_tps": round(len(samples) / elapsed, 1),
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies) * 1000, 2),
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2),
+        },
+        # Запросы успешного перевода вместе с повторами
+        "queries_per_transfer": {
+            "mean": round(statistics.fmean(queries), 2) if queries else 0,
+            "max": max(queries, default=0),
+        },
+        "db_time_share": round(sum(sample.db_time for sample in samples) / sum(latencies), 3),
+        "outcomes": outcomes,
+        "conflict_rate": round(outcomes.get("conflict", 0) / len(samples), 4),
+        "error_rate": round(sum(count for outcome, count in outcomes.items() if outcome != "ok") / len(samples), 4),
+        # Доля успешных переводов, которым понадобился повтор после конфликта версий
+        "retry_rate": round(sum(sample.attempts > 1 for sample in succeeded) / max(len(succeeded), 1), 4),
+        "retries": sum(max(sample.attempts - 1, 0) for sample in succeeded),
+        "lock_wait": {
+            "total_ms": round(sampler.lock_wait * 1000, 1),
+            "per_transfer_ms": round(sampler.lock_wait * 1000 / len(samples), 3),
+            "max_waiting": sampler.max_waiting,
+        },
+    }
+
+
+def metric(report: dict, dotted: str):
+    value = report
+    for part in dotted.split("."):
+        value = value[part]
+    return value
+
+
+def check_thresholds(report: dict, thresholds: dict) -> list[str]:
+    """
+    Пороги - верхние границы метрик отчёта ("latency_ms.p99": 250); возвращает нарушения.
+    """
+    return [
+        f"{name} = {metric(report, name)} > {limit}"
+        for name, limit in thresholds.items()
+        if metric(report, name) > limit
+    ]
+
+
+def scenario_thresholds(scenario: str, engine: str, path: Path = THRESHOLDS_FILE) -> dict:
+    thresholds = json.loads(path.read_text())
+    return {**thresholds.get("default", {}), **thresholds.get(engine, {}).get(scenario, {})}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="transfer_funds без HTTP при разной популярности кошельков")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=["uniform", "zipf", "hot"])
+    parser.add_argument("--processes", type=int, help="Переопределить число процессов сценария")
+    parser.add_argument("--threads", type=int, help="Переопределить число потоков на процесс")
+    parser.add_argument("--transfers", type=int, help="Переводов на поток")
+    parser.add_argument("--wallets", type=int, help="Число кошельков")
+    parser.add_argument("--output", help="Сохранить результаты в JSON")
+    parser.add_argument("--check", action="store_true", help="Проверить пороги из transfer_service_thresholds.json")
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.conf import settings
+
+    overrides = {
+        name: value
+        for name in ("processes", "threads", "transfers", "wallets")
+        if (value := getattr(args, name)) is not None
+    }
+    configs = {name: dataclasses.replace(SCENARIOS[name], **overrides) for name in args.scenarios}
+    wallets = create_wallets(max(config.wallets for config in configs.values()))
+
+    results = {name: run_benchmark(config, wallets) for name, config in configs.items()}
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+    print(f"engine={settings.TRANSFER_ENGINE}")
+    print(
+        f"{'scenario':<20}{'tps':>8}{'p50 ms':>9}{'p99 ms':>9}{'queries':>9}"
+        f"{'retry':>8}{'conflict':>10}{'lock ms':>9}"
+    )
+    failed = False
+    for name, report in results.items():
+        print(
+            f"{name:<20}{report['throughput_tps']:>8}{report['latency_ms']['p50']:>9}{report['latency_ms']['p99']:>9}"
+            f"{report['queries_per_transfer']['mean']:>9}{report['retry_rate']:>8}{report['conflict_rate']:>10}"
+            f"{report['lock_wait']['total_ms']:>9}"
+        )
+        if args.check:
+            for violation in check_thresholds(report, scenario_thresholds(name, settings.TRANSFER_ENGINE)):
+                print(f"  REGRESSION {violation}")
+                failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
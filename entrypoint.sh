@@ -3,6 +3,13 @@ set -eu
 
 echo "[entrypoint] starting..."
 
+# --- prometheus multiprocess dir ---
+# Каталог должен существовать до импорта метрик, файлы прошлого запуска не должны попасть в сумму
+if [ -n "${PROMETHEUS_MULTIPROC_DIR:-}" ]; then
+  rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+  mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
 # --- migrations ---
 if [ "${RUN_MIGRATIONS:-1}" = "1" ]; then
   echo "[entrypoint] migrate..."
@@ -0,0 +1,22 @@
+# gunicorn читает ./gunicorn.conf.py по умолчанию - для web и web-asgi (UvicornWorker) из docker-compose.
+# Метрики воркеров - в файлах PROMETHEUS_MULTIPROC_DIR, /metrics любого воркера собирает их со всех (apps.core.metrics)
+import os
+from pathlib import Path
+
+MULTIPROCESS_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+
+def on_starting(server):
+    # Файлы прошлого запуска: иначе счётчики продолжились бы с прежних значений
+    if MULTIPROCESS_DIR:
+        Path(MULTIPROCESS_DIR).mkdir(parents=True, exist_ok=True)
+        for path in Path(MULTIPROCESS_DIR).glob("*.db"):
+            path.unlink()
+
+
+def child_exit(server, worker):
+    # Счётчики и гистограммы умершего воркера остаются в сумме, его live-gauge удаляются
+    if MULTIPROCESS_DIR:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
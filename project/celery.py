@@ -1,8 +1,53 @@
 import os
 from celery import Celery
+from celery.signals import (
+    before_task_publish,
+    task_prerun,
+    worker_init,
+    worker_process_init,
+    worker_process_shutdown,
+)
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
 
 app = Celery("project")
 app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
+
+
+@worker_process_init.connect
+def warm_caches(**kwargs):
+    from apps.transactions.cache import warm_admin_wallet_cache
+
+    warm_admin_wallet_cache()
+
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    # Главный процесс воркера отдаёт метрики всех процессов prefork на METRICS_CELERY_PORT
+    from django.conf import settings
+
+    from apps.core.metrics import start_metrics_server
+
+    start_metrics_server(settings.METRICS_CELERY_PORT)
+
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid, **kwargs):
+    from apps.core.metrics import mark_process_dead
+
+    mark_process_dead(pid)
+
+
+@before_task_publish.connect
+def stamp_enqueued_at(headers, **kwargs):
+    from apps.core.metrics import stamp_enqueued_at
+
+    stamp_enqueued_at(headers)
+
+
+@task_prerun.connect
+def observe_queue_lag(task, **kwargs):
+    from apps.core.metrics import observe_queue_lag
+
+    observe_queue_lag(task)
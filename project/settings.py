@@ -14,6 +14,7 @@ import os
 from pathlib import Path
 from urllib.parse import urlparse
 import environ
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -48,6 +49,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "apps.core.middleware.ServerTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -83,15 +85,45 @@ WSGI_APPLICATION = "project.wsgi.application"
 url = urlparse(env.str("DATABASE_URL"))
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql_psycopg2",
+        "ENGINE": "django.db.backends.postgresql",
         "NAME": url.path[1:],
         "USER": url.username,
         "PASSWORD": url.password,
         "HOST": url.hostname,
         "PORT": url.port,
+        # Без пула соединение живёт в потоке до DB_CONN_MAX_AGE секунд и проверяется перед повторным использованием
+        "CONN_MAX_AGE": env.int("DB_CONN_MAX_AGE", default=60),
+        "CONN_HEALTH_CHECKS": env.bool("DB_CONN_HEALTH_CHECKS", default=True),
+        "OPTIONS": {
+            # psycopg готовит запрос на сервере после DB_PREPARE_THRESHOLD выполнений на соединении - только
+            # с серверной привязкой параметров (apps.core.db.prepared_cursor). Глобально её не включить:
+            # DDL миграций с параметрами сервер не принимает
+            "prepare_threshold": env.int("DB_PREPARE_THRESHOLD", default=5),
+        },
     }
 }
 
+# Пул соединений psycopg на процесс: соединение берётся из пула на запрос или задачу и возвращается после,
+# при DB_CONN_HEALTH_CHECKS пул проверяет его перед выдачей.
+# Нужен под ASGI, где у каждого запроса свой поток и постоянные соединения не переиспользуются
+if env.bool("DB_POOL_ENABLED", default=False):
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": env.int("DB_POOL_MIN_SIZE", default=2),
+        "max_size": env.int("DB_POOL_MAX_SIZE", default=16),
+        # Соединение закрывается после max_lifetime секунд (с разбросом 5%) или max_idle секунд простоя
+        "max_lifetime": env.float("DB_POOL_MAX_LIFETIME", default=30 * 60.0),
+        "max_idle": env.float("DB_POOL_MAX_IDLE", default=10 * 60.0),
+        # Сколько запрос ждёт свободное соединение, секунды
+        "timeout": env.float("DB_POOL_TIMEOUT", default=10.0),
+    }
+
+# PgBouncer в режиме pool_mode=transaction: серверное соединение меняется между транзакциями,
+# поэтому серверные курсоры (.iterator()) и подготовленные запросы отключены
+if env.bool("DB_PGBOUNCER", default=False):
+    DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = True
+    DATABASES["default"]["OPTIONS"]["prepare_threshold"] = None
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -167,10 +199,165 @@ LOGGING = {
             "level": "DEBUG",
             "propagate": False,
         },
+        # Время запросов: SQL-запросы, БД, сериализатор, сервис (apps.core.middleware.ServerTimingMiddleware)
+        "timing": {
+            "handlers": ["console"],
+            "level": env.str("TIMING_LOG_LEVEL", default="INFO"),
+            "propagate": False,
+        },
     },
 }
 
 
+# Порт /metrics главного процесса воркера Celery (0 - не запускать). Метрики web - /metrics самого Django,
+# с несколькими процессами нужен каталог PROMETHEUS_MULTIPROC_DIR (apps.core.metrics, gunicorn.conf.py)
+METRICS_CELERY_PORT = env.int("METRICS_CELERY_PORT", default=0)
+
+# Server-Timing и лог времени запросов. Заголовок раскрывает клиенту время БД и сервиса - можно отключить
+SERVER_TIMING_HEADER = env.bool("SERVER_TIMING_HEADER", default=True)
+# Запрос дольше порога (секунды) логируется с WARNING и списком SQL-запросов (не больше SLOW_REQUEST_MAX_QUERIES)
+SLOW_REQUEST_THRESHOLD = env.float("SLOW_REQUEST_THRESHOLD", default=0.5)
+SLOW_REQUEST_MAX_QUERIES = env.int("SLOW_REQUEST_MAX_QUERIES", default=50)
+
+REDIS_URL = env.str("REDIS_URL", "redis://localhost:6379/0")
+REDIS_SOCKET_TIMEOUT = env.float("REDIS_SOCKET_TIMEOUT", default=0.1)
+
+CACHES = {
+    "default": env.cache_url("CACHE_URL", default="locmemcache://"),
+    # По умолчанию общий Redis: инвалидация после перевода должна доходить до всех воркеров, locmem - только для
+    # одного процесса
+    "balances": env.cache_url("BALANCE_CACHE_URL", default=REDIS_URL),
+}
+
 CELERY_BROKER_URL = env.str("CELERY_BROKER_URL", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = env.str("CELERY_RESULT_BACKEND", default=None)
 CELERY_TASK_ALWAYS_EAGER = env.bool("CELERY_TASK_ALWAYS_EAGER", default=False)
+CELERY_BEAT_SCHEDULE = {
+    "sweep-fee-shards": {
+        "task": "apps.transactions.tasks.sweep_fee_shards",
+        "schedule": env.float("FEE_SWEEP_INTERVAL", default=60.0),
+    },
+    "reconcile-ledger": {
+        "task": "apps.transactions.tasks.reconcile_ledger",
+        "schedule": env.float("RECONCILIATION_INTERVAL", default=3600.0),
+    },
+    "manage-partitions": {
+        "task": "apps.transactions.tasks.manage_partitions",
+        "schedule": env.float("PARTITION_MAINTENANCE_INTERVAL", default=24 * 60 * 60.0),
+    },
+    "snapshot-balances": {
+        "task": "apps.transactions.tasks.snapshot_balances",
+        # Раз в сутки после полуночи UTC: дополнительно ждёт RECONCILIATION_SAFETY_LAG закрытия дня
+        "schedule": crontab(
+            hour=env.int("BALANCE_SNAPSHOT_HOUR", default=0),
+            minute=env.int("BALANCE_SNAPSHOT_MINUTE", default=15),
+        ),
+    },
+    "archive-ledger": {
+        "task": "apps.transactions.tasks.archive_ledger",
+        "schedule": env.float("ARCHIVE_INTERVAL", default=24 * 60 * 60.0),
+    },
+    "recover-notification-digests": {
+        "task": "apps.transactions.tasks.recover_notification_digests",
+        "schedule": env.float("NOTIFICATION_DIGEST_RECOVER_INTERVAL", default=60.0),
+    },
+}
+
+# Количество шардов для накопления комиссий (0 - комиссия сразу зачисляется на админский кошелёк)
+FEE_SHARDS = env.int("FEE_SHARDS", default=0)
+
+# Повторы перевода внутри сервиса при конфликте версий баланса
+TRANSFER_RETRY_MAX_ATTEMPTS = env.int("TRANSFER_RETRY_MAX_ATTEMPTS", default=3)
+TRANSFER_RETRY_BASE_DELAY = env.float("TRANSFER_RETRY_BASE_DELAY", default=0.005)
+TRANSFER_RETRY_MAX_DELAY = env.float("TRANSFER_RETRY_MAX_DELAY", default=0.1)
+TRANSFER_RETRY_DEADLINE = env.float("TRANSFER_RETRY_DEADLINE", default=0.5)
+
+# Сколько конкурентный запрос с тем же Idempotency-Key ждёт первый, секунды (0 - без ожидания, дубли получают 409)
+TRANSFER_COALESCE_WAIT = env.float("TRANSFER_COALESCE_WAIT", default=2.0)
+TRANSFER_COALESCE_POLL_INTERVAL = env.float("TRANSFER_COALESCE_POLL_INTERVAL", default=0.005)
+
+# Максимальное количество переводов в одном запросе POST /api/transfers/batch/
+TRANSFER_BATCH_MAX_SIZE = env.int("TRANSFER_BATCH_MAX_SIZE", default=500)
+
+# Движок перевода: "orm" - оптимистичная блокировка через ORM, "plpgsql" - одна функция в БД за один запрос
+TRANSFER_ENGINE = env.str("TRANSFER_ENGINE", default="orm")
+
+# Время жизни кэша админского кошелька в памяти воркера, секунды
+ADMIN_WALLET_CACHE_TTL = env.float("ADMIN_WALLET_CACHE_TTL", default=300.0)
+
+# Кэш ответов перевода в Redis по (from_wallet, Idempotency-Key)
+IDEMPOTENCY_CACHE_ENABLED = env.bool("IDEMPOTENCY_CACHE_ENABLED", default=False)
+IDEMPOTENCY_CACHE_PREFIX = env.str("IDEMPOTENCY_CACHE_PREFIX", default="idempotency:transfer")
+# Сколько хранится ответ, секунды
+IDEMPOTENCY_CACHE_TTL = env.int("IDEMPOTENCY_CACHE_TTL", default=24 * 60 * 60)
+# Сколько ключ считается занятым выполняющимся запросом, секунды
+IDEMPOTENCY_IN_PROGRESS_TTL = env.int("IDEMPOTENCY_IN_PROGRESS_TTL", default=30)
+# Максимальный размер сохраняемой записи, байты
+IDEMPOTENCY_CACHE_MAX_SIZE = env.int("IDEMPOTENCY_CACHE_MAX_SIZE", default=1024)
+
+# Кэш балансов для GET /api/wallets/<id>/balance/ и POST /api/wallets/balances/
+BALANCE_CACHE_ALIAS = "balances"
+BALANCE_CACHE_TTL = env.int("BALANCE_CACHE_TTL", default=300)
+WALLET_BALANCE_BULK_MAX_SIZE = env.int("WALLET_BALANCE_BULK_MAX_SIZE", default=1000)
+
+# История операций GET /api/wallets/<id>/transactions/
+WALLET_HISTORY_PAGE_SIZE = env.int("WALLET_HISTORY_PAGE_SIZE", default=50)
+WALLET_HISTORY_MAX_PAGE_SIZE = env.int("WALLET_HISTORY_MAX_PAGE_SIZE", default=200)
+
+# Размер порции серверного курсора при выгрузке выписки
+STATEMENT_CHUNK_SIZE = env.int("STATEMENT_CHUNK_SIZE", default=2000)
+
+# Месячные партиции проводок: сколько месяцев вперёд создавать заранее
+# и через сколько месяцев отсоединять старые (0 - не отсоединять)
+TRANSACTION_PARTITION_MONTHS_AHEAD = env.int("TRANSACTION_PARTITION_MONTHS_AHEAD", default=3)
+TRANSACTION_PARTITION_RETENTION_MONTHS = env.int("TRANSACTION_PARTITION_RETENTION_MONTHS", default=0)
+
+# Размер порции (одна транзакция БД) при заполнении balance_after старых проводок
+BALANCE_AFTER_BACKFILL_CHUNK_SIZE = env.int("BALANCE_AFTER_BACKFILL_CHUNK_SIZE", default=5000)
+
+# Уведомления получателям: транспорт (путь к классу), одновременно отправляемые уведомления,
+# попытки с экспоненциальной задержкой; не доставленные попадают в NotificationDeadLetter
+NOTIFICATION_URL = env.str("NOTIFICATION_URL", default="")
+NOTIFICATION_TRANSPORT = env.str(
+    "NOTIFICATION_TRANSPORT",
+    default=(
+        "apps.transactions.notifications.HttpTransport"
+        if NOTIFICATION_URL
+        else "apps.transactions.notifications.LogTransport"
+    ),
+)
+NOTIFICATION_TIMEOUT = env.float("NOTIFICATION_TIMEOUT", default=5.0)
+NOTIFICATION_CONCURRENCY = env.int("NOTIFICATION_CONCURRENCY", default=1000)
+NOTIFICATION_MAX_ATTEMPTS = env.int("NOTIFICATION_MAX_ATTEMPTS", default=5)
+NOTIFICATION_RETRY_BASE_DELAY = env.float("NOTIFICATION_RETRY_BASE_DELAY", default=0.5)
+NOTIFICATION_RETRY_MAX_DELAY = env.float("NOTIFICATION_RETRY_MAX_DELAY", default=30.0)
+
+# Дайджесты: получатель, которому за NOTIFICATION_DIGEST_WINDOW секунд пришло больше NOTIFICATION_DIGEST_THRESHOLD
+# переводов, дальше получает одно уведомление за окно (или за NOTIFICATION_DIGEST_MAX_SIZE переводов). 0 - выключено
+NOTIFICATION_DIGEST_WINDOW = env.float("NOTIFICATION_DIGEST_WINDOW", default=5.0)
+NOTIFICATION_DIGEST_THRESHOLD = env.int("NOTIFICATION_DIGEST_THRESHOLD", default=20)
+NOTIFICATION_DIGEST_MAX_SIZE = env.int("NOTIFICATION_DIGEST_MAX_SIZE", default=500)
+NOTIFICATION_DIGEST_PREFIX = env.str("NOTIFICATION_DIGEST_PREFIX", default="notifications:digest")
+# Забранный, но не подтверждённый за столько секунд дайджест (воркер упал до отправки) досылает
+# recover_notification_digests. Должно быть больше времени отправки со всеми повторами
+NOTIFICATION_DIGEST_RECOVER_AFTER = env.float("NOTIFICATION_DIGEST_RECOVER_AFTER", default=300.0)
+
+# Outbox: relay_outbox публикует события пачками до OUTBOX_BATCH_SIZE, пустой outbox опрашивает
+# раз в OUTBOX_POLL_INTERVAL секунд
+OUTBOX_BATCH_SIZE = env.int("OUTBOX_BATCH_SIZE", default=500)
+OUTBOX_POLL_INTERVAL = env.float("OUTBOX_POLL_INTERVAL", default=1.0)
+# Пауза relay после ошибки публикации: удваивается с каждой ошибкой подряд до OUTBOX_ERROR_MAX_DELAY
+OUTBOX_ERROR_BASE_DELAY = env.float("OUTBOX_ERROR_BASE_DELAY", default=1.0)
+OUTBOX_ERROR_MAX_DELAY = env.float("OUTBOX_ERROR_MAX_DELAY", default=30.0)
+
+# Холодный архив: проводки и переводы старше ARCHIVE_AFTER_DAYS дней (месяцами целиком) переносятся
+# в сжатые сегменты в ARCHIVE_ROOT, блок сегмента - до ARCHIVE_BLOCK_ROWS проводок одного кошелька
+ARCHIVE_ROOT = env.path("ARCHIVE_ROOT", default=BASE_DIR / "archive")
+ARCHIVE_AFTER_DAYS = env.int("ARCHIVE_AFTER_DAYS", default=365)
+ARCHIVE_BLOCK_ROWS = env.int("ARCHIVE_BLOCK_ROWS", default=1024)
+
+# Сверка балансов с проводками: процессы (в воркере Celery - потоки) и количество диапазонов кошельков
+RECONCILIATION_WORKERS = env.int("RECONCILIATION_WORKERS", default=4)
+RECONCILIATION_CHUNKS = env.int("RECONCILIATION_CHUNKS", default=16)
+# Проводки моложе этого окна (секунды) ещё могут быть не закоммичены и в итог не добавляются
+RECONCILIATION_SAFETY_LAG = env.int("RECONCILIATION_SAFETY_LAG", default=300)
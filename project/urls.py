@@ -18,6 +18,8 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from apps.core.metrics import metrics_view
+
 api_urls = [
     path("", include("apps.transactions.urls", namespace="transactions"), name="transactions"),
 ]
@@ -25,4 +27,6 @@ api_urls = [
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include(api_urls), name="api"),
+    # Для Prometheus внутри сети docker-compose, nginx наружу не отдаёт
+    path("metrics", metrics_view, name="metrics"),
 ]
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
 
 application = get_wsgi_application()
+
+# Админский кошелёк загружается при старте воркера, а не первым переводом
+from apps.transactions.cache import warm_admin_wallet_cache  # noqa: E402
+
+warm_admin_wallet_cache()
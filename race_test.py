@@ -1,77 +1,367 @@
+import argparse
+import asyncio
+import collections
+import dataclasses
+import datetime
+import itertools
+import json
+import math
 import random
+import sys
+import time
 import uuid
-import json
 from decimal import Decimal
 
-import requests
-import argparse
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import aiohttp
 
 IDEMPOTENCY_KEY = str(uuid.uuid4())
 
+# Верхние границы корзин гистограммы задержек, миллисекунды
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, math.inf)
 
-def do_request(i: int, url: str, token: str, from_wallet: str, to_wallet: str, amount: str, unique: bool):
-    if unique:
-        idempotency_key = str(uuid.uuid4())
-    else:
-        idempotency_key = IDEMPOTENCY_KEY
-        amount = str(Decimal(amount) + Decimal(random.randint(1, 100)))
+# Метрики сравнения с baseline: True - чем больше, тем лучше
+COMPARED_METRICS = {
+    "throughput_rps": True,
+    "latency_ms.p50": False,
+    "latency_ms.p95": False,
+    "latency_ms.p99": False,
+    "conflict_rate": False,
+    "error_rate": False,
+}
+# Доли сравниваются по абсолютной разнице: 0.1% -> 0.2% - не регрессия в 100%
+RATE_METRICS = ("conflict_rate", "error_rate")
 
-    headers = {
-        "Authorization": token,
-        "Content-Type": "application/json",
-        "Idempotency-Key": idempotency_key,
-    }
+FEE_THRESHOLD = Decimal("1000.00")
 
-    payload = {
-        "from_wallet": from_wallet,
-        "to_wallet": to_wallet,
-        "amount": amount,
-    }
 
+@dataclasses.dataclass(frozen=True)
+class PlannedRequest:
+    url: str
+    payload: dict
+    idempotency_key: str
+
+
+@dataclasses.dataclass
+class Sample:
+    index: int
+    status: int | str
+    latency: float
+    body: str = ""
+    replayed: bool = False
+
+
+class Scenario:
+    """
+    Генератор запросов: при одном и том же --seed - те же пары, суммы и повторы.
+    Ключи идемпотентности случайные всегда, иначе повторный прогон на той же БД состоял бы из одних повторов.
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.wallets = load_wallets(args)
+        self.sent = collections.deque(maxlen=1000)
+
+        if args.scenario == "zipf":
+            # Кошелёк ранга k выбирается с вероятностью ~ 1 / k^s: первые кошельки - горячие
+            weights = [1 / rank**args.zipf_s for rank in range(1, len(self.wallets) + 1)]
+            self.cum_weights = list(itertools.accumulate(weights))
+
+    def amount(self) -> str:
+        if self.random.random() < self.args.fee_ratio:
+            amount = FEE_THRESHOLD + Decimal(self.random.randint(1, 10000)) / 100
+        else:
+            amount = Decimal(self.random.randint(100, 10000)) / 100
+        return str(amount)
+
+    def pair(self) -> tuple[str, str]:
+        if self.args.scenario == "zipf":
+            while True:
+                from_wallet, to_wallet = self.random.choices(self.wallets, cum_weights=self.cum_weights, k=2)
+                if from_wallet != to_wallet:
+                    return from_wallet, to_wallet
+
+        return tuple(self.random.sample(self.wallets, 2))
+
+    def transfer(self) -> dict:
+        from_wallet, to_wallet = self.pair()
+        return {"from_wallet": from_wallet, "to_wallet": to_wallet, "amount": self.amount()}
+
+    def next_request(self, index: int) -> PlannedRequest:
+        args = self.args
+        if args.scenario == "race":
+            # Один и тот же перевод: с разными ключами - гонка за баланс, с одним ключом - за идемпотентность
+            payload = {"from_wallet": args.from_wallet, "to_wallet": args.to_wallet, "amount": args.amount}
+            if args.unique:
+                return PlannedRequest(args.url, payload, str(uuid.uuid4()))
+
+            payload["amount"] = str(Decimal(args.amount) + Decimal(self.random.randint(1, 100)))
+            return PlannedRequest(args.url, payload, IDEMPOTENCY_KEY)
+
+        if args.scenario == "batch":
+            transfers = [{**self.transfer(), "idempotency_key": str(uuid.uuid4())} for _ in range(args.batch_size)]
+            return PlannedRequest(args.batch_url, {"transfers": transfers}, transfers[0]["idempotency_key"])
+
+        if args.scenario == "replay" and self.sent and self.random.random() < args.replay_ratio:
+            # Повтор уже отправленного перевода с тем же ключом и телом
+            return self.random.choice(self.sent)
+
+        request = PlannedRequest(args.url, self.transfer(), str(uuid.uuid4()))
+        self.sent.append(request)
+        return request
+
+
+def load_wallets(args: argparse.Namespace) -> list[str]:
+    if args.scenario == "race":
+        return [args.from_wallet, args.to_wallet]
+
+    wallets = list(args.wallet or [])
+    if args.wallets_file:
+        with open(args.wallets_file) as file:
+            wallets += [line.strip() for line in file if line.strip()]
+
+    if len(wallets) < 2:
+        raise SystemExit("Нужно хотя бы два кошелька: --wallet или --wallets-file")
+
+    return wallets
+
+
+async def send(session: aiohttp.ClientSession, index: int, request: PlannedRequest, token: str, since: float) -> Sample:
+    headers = {"Authorization": token, "Idempotency-Key": request.idempotency_key}
     try:
-        r = requests.post(url, headers=headers, data=json.dumps(payload), timeout=10)
-        return i, r.status_code, r.text
-    except Exception as e:
-        return i, "ERR", str(e)
+        async with session.post(request.url, json=request.payload, headers=headers) as response:
+            body = await response.text()
+            status = response.status
+            replayed = response.headers.get("Idempotent-Replayed") == "true"
+    except (aiohttp.ClientError, asyncio.TimeoutError) as exception:
+        body, status, replayed = str(exception), type(exception).__name__, False
+
+    return Sample(index, status, time.monotonic() - since, body, replayed)
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Параллельные запросы")
+async def run_closed(session, scenario: Scenario, args: argparse.Namespace) -> list[Sample]:
+    """
+    Замкнутый цикл: --concurrency клиентов, следующий запрос клиента - после ответа на предыдущий.
+    """
+    samples = []
+    indexes = itertools.count()
+    deadline = time.monotonic() + args.duration if args.duration else math.inf
+
+    async def client():
+        while time.monotonic() < deadline:
+            index = next(indexes)
+            if args.requests and index >= args.requests:
+                return
+            started = time.monotonic()
+            samples.append(await send(session, index, scenario.next_request(index), args.token, started))
+
+    await asyncio.gather(*(client() for _ in range(args.concurrency)))
+    return samples
+
+
+async def run_open(session, scenario: Scenario, args: argparse.Namespace) -> list[Sample]:
+    """
+    Открытый цикл: запросы уходят с постоянной частотой --rate независимо от ответов.
+    Задержка считается от запланированного момента отправки, поэтому очередь перед
+    медленным сервером (и перед --concurrency) тоже попадает в задержку.
+    """
+    semaphore = asyncio.Semaphore(args.concurrency)
+    started = time.monotonic()
+    total = args.requests or math.inf
+    deadline = started + args.duration if args.duration else math.inf
+
+    async def fire(index, request, scheduled):
+        async with semaphore:
+            return await send(session, index, request, args.token, scheduled)
+
+    tasks = []
+    for index in itertools.count():
+        scheduled = started + index / args.rate
+        if index >= total or scheduled >= deadline:
+            break
+        await asyncio.sleep(max(0.0, scheduled - time.monotonic()))
+        tasks.append(asyncio.create_task(fire(index, scenario.next_request(index), scheduled)))
+
+    return list(await asyncio.gather(*tasks))
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    # Ближайший ранг по отсортированному списку
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def build_report(samples: list[Sample], elapsed: float, args: argparse.Namespace) -> dict:
+    latencies = sorted(sample.latency * 1000 for sample in samples)
+    statuses = collections.Counter(str(sample.status) for sample in samples)
+    histogram = collections.Counter(
+        next(bucket for bucket in HISTOGRAM_BUCKETS_MS if latency <= bucket) for latency in latencies
+    )
+    ok = sum(count for status, count in statuses.items() if status.isdigit() and 200 <= int(status) < 300)
+
+    report = {
+        "config": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("token", "baseline", "output", "print_bodies")
+        },
+        "started_at": datetime.datetime.now(datetime.UTC).isoformat(),
+        "elapsed_s": round(elapsed, 3),
+        "requests": len(samples),
+        "throughput_rps": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": (
+            {
+                "mean": round(sum(latencies) / len(latencies), 2),
+                "p50": round(percentile(latencies, 0.50), 2),
+                "p95": round(percentile(latencies, 0.95), 2),
+                "p99": round(percentile(latencies, 0.99), 2),
+                "max": round(latencies[-1], 2),
+            }
+            if latencies
+            else {}
+        ),
+        "histogram_ms": [
+            {"le": "+Inf" if math.isinf(bucket) else bucket, "count": histogram[bucket]}
+            for bucket in HISTOGRAM_BUCKETS_MS
+        ],
+        "statuses": dict(sorted(statuses.items())),
+        "conflict_rate": round(statuses["409"] / len(samples), 4) if samples else 0.0,
+        "error_rate": round(1 - ok / len(samples), 4) if samples else 0.0,
+        # Ответы с Idempotent-Replayed: true (из кэша идемпотентности)
+        "idempotent_replayed": sum(sample.replayed for sample in samples),
+    }
+
+    if args.scenario == "batch":
+        # Пакет отвечает 200, а исход каждого перевода - в теле
+        items = collections.Counter()
+        for sample in samples:
+            try:
+                results = json.loads(sample.body)["results"]
+            except (ValueError, KeyError, TypeError):
+                continue
+            items.update(result.get("code", result["status"]) for result in results)
+        report["batch_items"] = dict(sorted(items.items()))
+
+    return report
+
+
+def metric(report: dict, name: str) -> float | None:
+    value = report
+    for part in name.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def compare_reports(report: dict, baseline: dict, tolerance: float) -> list[dict]:
+    """
+    Сравнивает отчёт с baseline. Регрессия - ухудшение больше чем на tolerance процентов
+    (для долей - больше чем на tolerance процентных пунктов).
+    """
+    comparison = []
+    for name, higher_is_better in COMPARED_METRICS.items():
+        current, previous = metric(report, name), metric(baseline, name)
+        if current is None or previous is None:
+            continue
+
+        if name in RATE_METRICS:
+            change = (current - previous) * 100
+        else:
+            change = (current - previous) / previous * 100 if previous else 0.0
+
+        worse = -change if higher_is_better else change
+        comparison.append(
+            {
+                "metric": name,
+                "baseline": previous,
+                "current": current,
+                "change_pct": round(change, 2),
+                "regression": worse > tolerance,
+            }
+        )
+    return comparison
+
+
+async def run(args: argparse.Namespace) -> tuple[list[Sample], float]:
+    scenario = Scenario(args)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        started = time.monotonic()
+        samples = await (run_open if args.mode == "open" else run_closed)(session, scenario, args)
+        return samples, time.monotonic() - started
+
+
+def parse_args(argv: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочное тестирование переводов")
     parser.add_argument("--url", default="http://web/api/transfer/")
+    parser.add_argument("--batch-url", default="http://web/api/transfers/batch/")
     parser.add_argument("--token", default="Bearer no_auth_now")
+    parser.add_argument(
+        "--scenario",
+        choices=["race", "uniform", "zipf", "replay", "batch"],
+        default="race",
+        help="race - один перевод --from-wallet -> --to-wallet; uniform - случайные пары; zipf - горячие кошельки; "
+        "replay - доля --replay-ratio повторов с тем же ключом; batch - пакеты по --batch-size",
+    )
+    # race
     parser.add_argument("--from-wallet", type=str)
     parser.add_argument("--to-wallet", type=str)
     parser.add_argument("--amount", default="1001.00")
-    parser.add_argument("--requests", type=int, default=100)
-    parser.add_argument("--workers", type=int, default=None)
     parser.add_argument("--unique", type=int, default=1)
+    # Остальные сценарии
+    parser.add_argument("--wallet", action="append", help="id кошелька, можно несколько раз")
+    parser.add_argument("--wallets-file", help="Файл с id кошельков, по одному в строке")
+    parser.add_argument("--fee-ratio", type=float, default=0.0, help="Доля переводов с комиссией (больше 1000.00)")
+    parser.add_argument("--zipf-s", type=float, default=1.1)
+    parser.add_argument("--replay-ratio", type=float, default=0.2)
+    parser.add_argument("--batch-size", type=int, default=50)
+    # Нагрузка
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--requests", type=int, default=None, help="По умолчанию 100, если не задан --duration")
+    parser.add_argument("--duration", type=float, default=None, help="Секунды; вместе с --requests - что раньше")
+    parser.add_argument(
+        "--concurrency", "--workers", type=int, default=None, help="Клиентов (closed) или запросов в полёте (open)"
+    )
+    parser.add_argument("--rate", type=float, default=100.0, help="Запросов в секунду (open)")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    # Отчёт
+    parser.add_argument("--output", help="Сохранить отчёт JSON в файл (годится как --baseline)")
+    parser.add_argument("--baseline", help="Отчёт JSON прошлого прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="Допустимое ухудшение, проценты")
+    parser.add_argument("--print-bodies", action="store_true", help="Напечатать ответ каждого запроса")
+
+    args = parser.parse_args(argv)
+    if args.scenario == "race" and not (args.from_wallet and args.to_wallet):
+        parser.error("Сценарию race нужны --from-wallet и --to-wallet")
+    if args.concurrency is None:
+        # race по умолчанию, как и раньше, отправляет все запросы разом
+        args.concurrency = args.requests if args.scenario == "race" and args.requests else 64
+    if args.requests is None and args.duration is None:
+        args.requests = 100
+    return args
+
+
+def main(argv: list[str] = None) -> int:
+    args = parse_args(argv)
+    samples, elapsed = asyncio.run(run(args))
 
-    args = parser.parse_args()
-    workers = args.workers or args.requests
-    results = []
+    if args.print_bodies:
+        for sample in sorted(samples, key=lambda sample: sample.index):
+            print(f"[{sample.index:02}] status={sample.status} body={sample.body}")
 
-    with ThreadPoolExecutor(max_workers=workers) as executor:
-        futures = [
-            executor.submit(
-                do_request,
-                i,
-                args.url,
-                args.token,
-                args.from_wallet,
-                args.to_wallet,
-                args.amount,
-                bool(args.unique),
-            )
-            for i in range(args.requests)
-        ]
+    report = build_report(samples, elapsed, args)
+    if args.baseline:
+        with open(args.baseline) as file:
+            report["comparison"] = compare_reports(report, json.load(file), args.tolerance)
 
-        for future in as_completed(futures):
-            results.append(future.result())
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
 
-    for i, status, body in sorted(results):
-        print(f"[{i:02}] status={status} body={body}")
+    print(json.dumps(report, indent=2))
+    # Ненулевой код - регрессия относительно baseline, чтобы прогон можно было поставить в CI
+    return 1 if any(row["regression"] for row in report.get("comparison", [])) else 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,30 @@
+import pytest
+
+from apps.transactions.cache import get_admin_wallet
+from apps.transactions.models import Wallet, WalletBalance
+
+
+@pytest.mark.django_db
+def test_admin_wallet_is_cached(balances, admin_wallet, django_assert_num_queries):
+    from_balance, to_balance, admin_balance = balances
+
+    with django_assert_num_queries(1):
+        first = get_admin_wallet()
+        second = get_admin_wallet()
+
+    assert first is second
+    assert first.wallet_id == admin_wallet.id
+    assert first.balance_id == admin_balance.id
+
+
+@pytest.mark.django_db
+def test_admin_wallet_cache_invalidated_on_save(admin_wallet, user):
+    assert get_admin_wallet().balance_id is None
+
+    admin_balance = WalletBalance.objects.create(wallet=admin_wallet)
+    assert get_admin_wallet().balance_id == admin_balance.id
+
+    admin_wallet.is_admin_wallet = False
+    admin_wallet.save(update_fields=["is_admin_wallet"])
+    new_admin_wallet = Wallet.objects.create(user=user, is_admin_wallet=True)
+    assert get_admin_wallet().wallet_id == new_admin_wallet.id
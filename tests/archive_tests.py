@@ -0,0 +1,161 @@
+import datetime
+import io
+import uuid
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+
+from apps.transactions.archive import SegmentReader, archive_ledger, write_segment
+from apps.transactions.dto import TransferCreateCommand
+from apps.transactions.models import ArchiveSegment, LedgerTotal, Transaction, Transfer, WalletBalance
+from apps.transactions.reconciliation import reconcile_ledger
+from apps.transactions.services import transfer_funds
+from apps.transactions.snapshots import balance_as_of, snapshot_balances
+from apps.transactions.statements import statement_rows
+
+JANUARY = datetime.date(2025, 1, 10)
+FEBRUARY = datetime.date(2025, 2, 10)
+
+
+def at(day: datetime.date, hour: int) -> datetime.datetime:
+    return datetime.datetime.combine(day, datetime.time(hour), tzinfo=datetime.UTC)
+
+
+@pytest.fixture(autouse=True)
+def archive_root(tmp_path):
+    # Движок plpgsql ставит проводкам одно время на всю транзакцию теста, порядок в выписке тогда не тот
+    with override_settings(ARCHIVE_ROOT=tmp_path, TRANSFER_ENGINE="orm", RECONCILIATION_SAFETY_LAG=0):
+        yield tmp_path
+
+
+@pytest.fixture
+def history(make_transfer):
+    """
+    from_wallet: 5000.00 -> 4900.00 -> 4700.00 (январь 2025) -> 2500.00 (февраль, комиссия 200.00) -> 2200.00 (сейчас)
+    """
+    make_transfer("100.00", at(JANUARY, 10))
+    make_transfer("200.00", at(JANUARY, 12))
+    make_transfer("2000.00", at(FEBRUARY, 12))
+    return make_transfer("300.00")
+
+
+def statement(wallet):
+    return list(statement_rows(wallet.id, datetime.date(2024, 1, 1), datetime.date(2100, 1, 1)))
+
+
+@pytest.mark.django_db
+def test_archive_ledger_keeps_statement(wallets, admin_wallet, history):
+    from_wallet, to_wallet = wallets
+    before = {wallet: statement(wallet) for wallet in (from_wallet, to_wallet, admin_wallet)}
+
+    out = io.StringIO()
+    call_command("archive_ledger", "--after-days", "365", stdout=out)
+    assert "Segments=2" in out.getvalue()
+
+    january, february = ArchiveSegment.objects.order_by("period_start")
+    assert (january.transactions, january.transfers) == (4, 2)
+    assert (february.transactions, february.transfers) == (3, 1)
+    assert Transfer.objects.count() == 4
+    assert Transaction.objects.count() == 2
+
+    assert {wallet: statement(wallet) for wallet in before} == before
+
+    # Повторный запуск архивировать нечего
+    assert archive_ledger(after_days=365) == []
+
+
+@pytest.mark.django_db
+def test_archived_transfer_replay_does_not_double_spend(wallets, make_transfer):
+    from_wallet, to_wallet = wallets
+    command = TransferCreateCommand(
+        from_wallet_id=from_wallet.id,
+        to_wallet_id=to_wallet.id,
+        amount=Decimal("100.00"),
+        idempotency_key="archived",
+    )
+    transfer = transfer_funds(command).transfer
+    Transaction.objects.filter(transfer=transfer).update(created_at=at(JANUARY, 10))
+    archive_ledger(after_days=365)
+    assert not Transaction.objects.filter(transfer=transfer).exists()
+
+    # Повтор клиента после архивации получает тот же перевод, баланс не списывается второй раз
+    replay = transfer_funds(command)
+    assert (replay.created, replay.transfer.id) == (False, transfer.id)
+    assert WalletBalance.objects.get(wallet=from_wallet).balance == Decimal("4900.00")
+
+
+@pytest.mark.django_db
+def test_balance_as_of_reads_archive(wallets, history):
+    from_wallet, _ = wallets
+    moments = [at(JANUARY, 11), at(FEBRUARY, 11), at(FEBRUARY, 12), at(FEBRUARY, 13)]
+    expected = [Decimal("4900.00"), Decimal("4700.00"), Decimal("2500.00"), Decimal("2500.00")]
+    assert [balance_as_of(from_wallet.id, ts) for ts in moments] == expected
+
+    # Снимок за январь - отсчёт от него вперёд по архиву
+    snapshot_balances(day=JANUARY)
+    archive_ledger(after_days=365)
+    assert [balance_as_of(from_wallet.id, ts) for ts in moments] == expected
+    assert balance_as_of(from_wallet.id, at(JANUARY, 9)) == Decimal("5000.00")
+
+
+@pytest.mark.django_db
+def test_reconciliation_counts_archived_transactions(wallets, balances, make_transfer):
+    reconcile_ledger(workers=1, chunks=1)
+    # Прошлая сверка была до проводок, которые потом уехали в архив
+    LedgerTotal.objects.update(through=at(datetime.date(2024, 12, 1), 0))
+    make_transfer("100.00", at(JANUARY, 10))
+    make_transfer("2000.00", at(FEBRUARY, 12))
+    make_transfer("300.00")
+    archive_ledger(after_days=365)
+
+    run = reconcile_ledger(workers=1, chunks=1)
+    assert run.discrepancies_found == 0
+    assert run.transactions_processed == 2
+    assert LedgerTotal.objects.get(wallet=wallets[0]).total == Decimal("-2600.00")
+
+
+def test_segment_reader_reads_only_needed_blocks(tmp_path, monkeypatch):
+    wallets = sorted((uuid.uuid4() for _ in range(3)), key=lambda wallet: wallet.bytes)
+    start = at(JANUARY, 0)
+    rows = []
+    for wallet in wallets:
+        for hour in range(6):
+            created_at = start + datetime.timedelta(hours=hour)
+            rows.append(
+                (created_at, uuid.uuid4(), "debit", Decimal("1.50"), None, uuid.uuid4(), uuid.uuid4())
+                + (created_at, uuid.uuid4(), wallet, Decimal("1.50"), Decimal("0.00"), "key", wallet)
+            )
+
+    count, size = write_segment("test", rows, block_rows=2)
+    assert count == 18
+    assert size == sum(path.stat().st_size for path in tmp_path.iterdir())
+
+    reader = SegmentReader("test")
+    assert len(reader) == 9
+    assert [entry.rows for entry in reader.entries(wallets[1])] == [2, 2, 2]
+    assert reader.entries(uuid.UUID(int=0)) == []
+
+    read = []
+    read_block = SegmentReader.read_block
+
+    def spy(self, entry, lower, upper):
+        read.append(entry)
+        return read_block(self, entry, lower, upper)
+
+    monkeypatch.setattr(SegmentReader, "read_block", spy)
+
+    # Блоки целиком внутри периода считаются по индексу
+    assert reader.delta(wallets[1], start, start + datetime.timedelta(days=1)) == Decimal("9.00")
+    assert read == []
+
+    # Третий час - во втором блоке, распаковывается только он
+    third = start + datetime.timedelta(hours=3)
+    assert [row[0] for row in reader.rows(wallets[1], third, third + datetime.timedelta(minutes=1))] == [third]
+    assert reader.delta(wallets[1], third, start + datetime.timedelta(days=1)) == Decimal("4.50")
+    assert [(entry.wallet_id, entry.first) for entry in read] == [
+        (wallets[1], start + datetime.timedelta(hours=2)),
+        (wallets[1], start + datetime.timedelta(hours=2)),
+    ]
+    assert reader.entries(wallets[0])[0].total == Decimal("3.00")
@@ -0,0 +1,135 @@
+import threading
+import uuid
+from decimal import Decimal
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, override_settings
+from django.urls import reverse
+
+from apps.core.redis_client import get_redis
+from apps.transactions import services
+from apps.transactions.dto import TransferCreateCommand
+from apps.transactions.exceptions import VersionConflictException
+from apps.transactions.idempotency import IdempotencyRecord
+from apps.transactions.models import OutboxEvent, Transfer, WalletBalance
+from apps.transactions.services import atransfer_funds
+
+VIEWS = ["transactions:transfer", "transactions:transfer-async"]
+
+
+@pytest.fixture
+def idempotency_cache():
+    prefix = f"test:idempotency:{uuid.uuid4().hex}"
+    with override_settings(IDEMPOTENCY_CACHE_ENABLED=True, IDEMPOTENCY_CACHE_PREFIX=prefix):
+        yield
+
+    for key in get_redis().scan_iter(f"{prefix}:*"):
+        get_redis().delete(key)
+
+
+@pytest.mark.django_db
+def test_async_transfer(engine, post_transfer, wallets, balances):
+    from_wallet, to_wallet = wallets
+    response = post_transfer(from_wallet, to_wallet, "1100.00", "key-1", url_name="transactions:transfer-async")
+    assert response.status_code == 201, response.content
+
+    transfer = Transfer.objects.get()
+    assert response.json() == {"id": str(transfer.id), "amount": "1100.00"}
+    assert (transfer.amount, transfer.fee) == (Decimal("1100.00"), Decimal("110.00"))
+    assert WalletBalance.objects.get(wallet=from_wallet).balance == Decimal("3790.00")
+    assert OutboxEvent.objects.get().transfer_id == transfer.id
+
+    # Повтор без кэша идемпотентности отвечает БД
+    replay = post_transfer(from_wallet, to_wallet, "1100.00", "key-1", url_name="transactions:transfer-async")
+    assert (replay.status_code, replay.json()) == (200, response.json())
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "amount, idempotency_key, status_code",
+    [
+        ("100000.00", "key-1", 400),
+        ("-1.00", "key-1", 400),
+        ("100.00", "", 400),
+        ("100.00", None, 400),
+    ],
+)
+def test_async_errors_match_sync_view(post_transfer, wallets, balances, amount, idempotency_key, status_code):
+    from_wallet, to_wallet = wallets
+    responses = [
+        post_transfer(from_wallet, to_wallet, amount, idempotency_key, url_name=url_name) for url_name in VIEWS
+    ]
+    assert [response.status_code for response in responses] == [status_code, status_code]
+    assert responses[0].json() == responses[1].json()
+    assert not Transfer.objects.exists()
+
+
+@pytest.mark.django_db
+def test_async_replay_served_from_redis(post_transfer, wallets, balances, idempotency_cache, django_assert_num_queries):
+    from_wallet, to_wallet = wallets
+    first = post_transfer(from_wallet, to_wallet, "100.00", "key-1", url_name="transactions:transfer-async")
+    assert first.status_code == 201, first.content
+
+    # Ответ, сохранённый в Redis асинхронным представлением, отдают оба
+    with django_assert_num_queries(0):
+        replays = [post_transfer(from_wallet, to_wallet, "100.00", "key-1", url_name=url_name) for url_name in VIEWS]
+    assert [(replay.status_code, replay.json()) for replay in replays] == [(200, first.json())] * 2
+    assert all(replay.headers["Idempotent-Replayed"] == "true" for replay in replays)
+
+    conflict = post_transfer(from_wallet, to_wallet, "200.00", "key-1", url_name="transactions:transfer-async")
+    assert conflict.status_code == 409
+    assert Transfer.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_async_in_progress_duplicate_waits(post_transfer, wallets, balances, idempotency_cache):
+    from_wallet, to_wallet = wallets
+    record = IdempotencyRecord.for_transfer(
+        {"from_wallet": from_wallet.id, "to_wallet": to_wallet.id, "amount": Decimal("100.00")}, "key-1"
+    )
+    assert record.begin() is None
+    body = {"id": str(uuid.uuid4()), "amount": "100.00"}
+    threading.Timer(0.05, record.complete, args=(201, body)).start()
+
+    response = post_transfer(from_wallet, to_wallet, "100.00", "key-1", url_name="transactions:transfer-async")
+    assert (response.status_code, response.json()) == (200, body)
+    assert response.headers["Idempotent-Replayed"] == "true"
+    assert not Transfer.objects.exists()
+
+
+@pytest.mark.django_db
+def test_async_client(wallets, balances):
+    from_wallet, to_wallet = wallets
+    client = AsyncClient()
+    response = async_to_sync(client.post)(
+        reverse("transactions:transfer-async"),
+        {"from_wallet": str(from_wallet.id), "to_wallet": str(to_wallet.id), "amount": "100.00"},
+        content_type="application/json",
+        headers={"Idempotency-Key": "key-1"},
+    )
+    assert response.status_code == 201, response.content
+    assert Transfer.objects.filter(id=response.json()["id"]).exists()
+
+
+@pytest.mark.django_db
+def test_atransfer_funds_retries_version_conflict(wallets, balances, monkeypatch):
+    from_wallet, to_wallet = wallets
+    transfer_once = services._transfer_funds_once
+    calls = []
+
+    def conflict_once(transfer_command):
+        calls.append(transfer_command.idempotency_key)
+        if len(calls) == 1:
+            raise VersionConflictException("Версия баланса изменилась")
+        return transfer_once(transfer_command)
+
+    monkeypatch.setattr(services, "_transfer_funds_once", conflict_once)
+    response = async_to_sync(atransfer_funds)(
+        TransferCreateCommand(
+            from_wallet_id=from_wallet.id, to_wallet_id=to_wallet.id, amount=Decimal("100.00"), idempotency_key=""
+        )
+    )
+    assert (response.created, response.attempts) == (True, 2)
+    # Ключ сгенерирован один раз на все попытки
+    assert calls[0] == calls[1] == response.transfer.idempotency_key
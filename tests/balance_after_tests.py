@@ -0,0 +1,91 @@
+import io
+import uuid
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+
+from apps.transactions.dto import TransferCreateCommand
+from apps.transactions.models import Transaction
+from apps.transactions.services import transfer_funds, transfer_funds_batch
+
+
+def command(from_wallet, to_wallet, amount):
+    return TransferCreateCommand(
+        from_wallet_id=from_wallet.id,
+        to_wallet_id=to_wallet.id,
+        amount=Decimal(amount),
+        idempotency_key=str(uuid.uuid4()),
+    )
+
+
+def balances_after(transfer):
+    return {row.flow: row.balance_after for row in Transaction.objects.filter(transfer=transfer)}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("fee_shards", [0, 4])
+def test_transfer_records_balance_after(engine, fee_shards, wallets, balances):
+    from_wallet, to_wallet = wallets
+    with override_settings(FEE_SHARDS=fee_shards):
+        first = transfer_funds(command(from_wallet, to_wallet, "2000.00")).transfer
+        second = transfer_funds(command(to_wallet, from_wallet, "10.00")).transfer
+
+    assert balances_after(first) == {
+        "credit": Decimal("2800.00"),
+        "debit": Decimal("2010.00"),
+        # Комиссия в шарде баланс админского кошелька не меняет
+        "fee": None if fee_shards else Decimal("200.00"),
+    }
+    assert balances_after(second) == {"credit": Decimal("2000.00"), "debit": Decimal("2810.00")}
+
+
+@pytest.mark.django_db
+def test_batch_transfer_records_balance_after(wallets, balances):
+    from_wallet, to_wallet = wallets
+    results = transfer_funds_batch(
+        [
+            command(from_wallet, to_wallet, "2000.00"),
+            command(from_wallet, to_wallet, "100.00"),
+            command(to_wallet, from_wallet, "50.00"),
+        ]
+    )
+
+    first, second, third = (result.transfer for result in results)
+    assert balances_after(first) == {
+        "credit": Decimal("2800.00"),
+        "debit": Decimal("2010.00"),
+        "fee": Decimal("200.00"),
+    }
+    assert balances_after(second) == {"credit": Decimal("2700.00"), "debit": Decimal("2110.00")}
+    assert balances_after(third) == {"credit": Decimal("2060.00"), "debit": Decimal("2750.00")}
+
+
+@pytest.mark.django_db
+# Движок plpgsql ставит проводкам время начала транзакции БД (в тесте - одно на всех), порядок проводок тогда не тот
+@override_settings(TRANSFER_ENGINE="orm")
+def test_backfill_balance_after(wallets, balances):
+    from_wallet, to_wallet = wallets
+    for amount in ("100.00", "200.00", "300.00"):
+        transfer_funds(command(from_wallet, to_wallet, amount))
+    recorded = list(Transaction.objects.order_by("created_at", "id").values_list("id", "balance_after"))
+
+    # Старые проводки без balance_after, самая новая - уже с ним (записана после выката)
+    newest = Transaction.objects.filter(wallet=from_wallet).order_by("-created_at", "-id").first()
+    Transaction.objects.exclude(transfer_id=newest.transfer_id).update(balance_after=None)
+
+    out = io.StringIO()
+    call_command("backfill_balance_after", "--chunk-size", "1", stdout=out)
+    assert "Transactions=4" in out.getvalue()
+    assert list(Transaction.objects.order_by("created_at", "id").values_list("id", "balance_after")) == recorded
+
+    # Без проводок с balance_after отсчёт идёт от текущего баланса
+    Transaction.objects.update(balance_after=None)
+    call_command("backfill_balance_after", "--wallet", str(to_wallet.id), stdout=io.StringIO())
+    assert list(
+        Transaction.objects.filter(wallet=to_wallet)
+        .order_by("created_at", "id")
+        .values_list("balance_after", flat=True)
+    ) == [Decimal("110.00"), Decimal("310.00"), Decimal("610.00")]
+    assert not Transaction.objects.filter(wallet=from_wallet, balance_after__isnull=False).exists()
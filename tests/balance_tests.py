@@ -0,0 +1,77 @@
+import uuid
+from decimal import Decimal
+
+import pytest
+from django.core.cache import caches
+from django.urls import reverse
+
+
+@pytest.fixture(autouse=True)
+def balance_cache():
+    caches["balances"].clear()
+    yield
+    caches["balances"].clear()
+
+
+@pytest.mark.django_db
+def test_wallet_balance_cached(api_client, wallets, balances, django_assert_num_queries):
+    from_wallet, to_wallet = wallets
+    url = reverse("transactions:wallet-balance", kwargs={"wallet_id": from_wallet.id})
+
+    response = api_client.get(url)
+    assert response.status_code == 200, response.content
+    assert Decimal(response.json()["balance"]) == Decimal("5000.00")
+
+    with django_assert_num_queries(0):
+        cached = api_client.get(url)
+    assert cached.json() == response.json()
+
+    with django_assert_num_queries(0):
+        not_modified = api_client.get(url, HTTP_IF_NONE_MATCH=response.headers["ETag"])
+    assert not_modified.status_code == 304
+
+
+@pytest.mark.django_db(transaction=True)
+def test_wallet_balance_invalidated_by_transfer(api_client, post_transfer, wallets, balances):
+    from_wallet, to_wallet = wallets
+    url = reverse("transactions:wallet-balance", kwargs={"wallet_id": from_wallet.id})
+    etag = api_client.get(url).headers["ETag"]
+
+    assert post_transfer(from_wallet, to_wallet, "100.00").status_code == 201
+
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200, response.content
+    assert Decimal(response.json()["balance"]) == Decimal("4900.00")
+    assert response.headers["ETag"] != etag
+
+
+@pytest.mark.django_db
+def test_wallet_balance_not_found(api_client, balances):
+    response = api_client.get(reverse("transactions:wallet-balance", kwargs={"wallet_id": uuid.uuid4()}))
+    assert response.status_code == 404, response.content
+
+
+@pytest.mark.django_db
+def test_bulk_wallet_balances(api_client, wallets, balances, django_assert_max_num_queries):
+    from_wallet, to_wallet = wallets
+    unknown = uuid.uuid4()
+    url = reverse("transactions:wallet-balances")
+    data = {"wallet_ids": [str(from_wallet.id), str(to_wallet.id), str(unknown)]}
+
+    with django_assert_max_num_queries(1):
+        response = api_client.post(url, data=data, format="json")
+
+    assert response.status_code == 200, response.content
+    assert [Decimal(item["balance"]) for item in response.json()["balances"]] == [Decimal("5000.00"), Decimal("10.00")]
+    assert response.json()["not_found"] == [str(unknown)]
+
+    # Известные балансы уже в кэше, в БД идёт только ненайденный кошелёк
+    with django_assert_max_num_queries(1):
+        not_modified = api_client.post(url, data=data, format="json", HTTP_IF_NONE_MATCH=response.headers["ETag"])
+    assert not_modified.status_code == 304
+
+
+@pytest.mark.django_db
+def test_admin_wallet_balance_hidden(api_client, admin_wallet, balances):
+    response = api_client.get(reverse("transactions:wallet-balance", kwargs={"wallet_id": admin_wallet.id}))
+    assert response.status_code == 404, response.content
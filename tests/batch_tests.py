@@ -0,0 +1,122 @@
+import uuid
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+
+from apps.transactions.models import WalletBalance, Transfer, Transaction
+
+
+def batch_item(from_wallet, to_wallet, amount, idempotency_key=None):
+    return {
+        "from_wallet": str(from_wallet.id),
+        "to_wallet": str(to_wallet.id),
+        "amount": amount,
+        "idempotency_key": idempotency_key or str(uuid.uuid4()),
+    }
+
+
+@pytest.mark.django_db
+def test_batch_transfer_per_item_results(api_client, wallets, balances):
+    from_wallet, to_wallet = wallets
+    from_balance, to_balance, admin_balance = balances
+    duplicate_key = str(uuid.uuid4())
+
+    response = api_client.post(
+        reverse("transactions:transfer-batch"),
+        data={
+            "transfers": [
+                batch_item(from_wallet, to_wallet, "2000.00", duplicate_key),
+                batch_item(to_wallet, from_wallet, "5.00"),
+                batch_item(from_wallet, to_wallet, "2000.00", duplicate_key),
+                batch_item(from_wallet, to_wallet, "4000.00"),
+            ]
+        },
+        format="json",
+    )
+
+    assert response.status_code == 200, response.content
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == ["created", "created", "existing", "error"]
+    assert results[0]["id"] == results[2]["id"]
+    assert results[3]["code"] == "not_enough_minerals"
+
+    from_balance.refresh_from_db()
+    to_balance.refresh_from_db()
+    admin_balance.refresh_from_db()
+    assert from_balance.balance == Decimal("5000.00") - Decimal("2200.00") + Decimal("5.00")
+    assert to_balance.balance == Decimal("10.00") + Decimal("2000.00") - Decimal("5.00")
+    assert admin_balance.balance == Decimal("200.00")
+    assert from_balance.version == to_balance.version == admin_balance.version == 1
+    assert Transfer.objects.count() == 2
+    assert Transaction.objects.count() == 5
+
+
+@pytest.mark.django_db
+def test_batch_transfer_query_count_does_not_grow(api_client, wallets, balances, django_assert_max_num_queries):
+    from_wallet, to_wallet = wallets
+
+    # admin wallet, блокировки ключей, балансы, существующие переводы, bulk_create x2, bulk_update + savepoint'ы
+    with django_assert_max_num_queries(10):
+        response = api_client.post(
+            reverse("transactions:transfer-batch"),
+            data={"transfers": [batch_item(from_wallet, to_wallet, "10.00") for _ in range(100)]},
+            format="json",
+        )
+
+    assert response.status_code == 200, response.content
+    assert Transfer.objects.count() == 100
+    assert WalletBalance.objects.get(wallet=to_wallet).balance == Decimal("1010.00")
+
+
+@pytest.mark.django_db
+def test_batch_transfer_replays_existing_transfer(api_client, wallets, balances):
+    from_wallet, to_wallet = wallets
+    idempotency_key = str(uuid.uuid4())
+    response = api_client.post(
+        reverse("transactions:transfer"),
+        data={"from_wallet": from_wallet.id, "to_wallet": to_wallet.id, "amount": "100.00"},
+        format="json",
+        HTTP_IDEMPOTENCY_KEY=idempotency_key,
+    )
+    assert response.status_code == 201, response.content
+
+    response = api_client.post(
+        reverse("transactions:transfer-batch"),
+        data={
+            "transfers": [
+                batch_item(from_wallet, to_wallet, "100.00", idempotency_key),
+                batch_item(from_wallet, to_wallet, "200.00", idempotency_key),
+            ]
+        },
+        format="json",
+    )
+
+    assert response.status_code == 200, response.content
+    results = response.json()["results"]
+    assert results[0] == {"index": 0, "status": "existing", "id": str(Transfer.objects.get().id)}
+    assert results[1]["code"] == "conflict"
+    assert Transfer.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_batch_transfer_unknown_wallet(api_client, wallets, balances):
+    from_wallet, to_wallet = wallets
+    unknown = uuid.uuid4()
+
+    response = api_client.post(
+        reverse("transactions:transfer-batch"),
+        data={
+            "transfers": [
+                batch_item(from_wallet, to_wallet, "10.00"),
+                {**batch_item(from_wallet, to_wallet, "10.00"), "to_wallet": str(unknown)},
+            ]
+        },
+        format="json",
+    )
+
+    assert response.status_code == 200, response.content
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == ["created", "error"]
+    assert results[1]["code"] == "wallet_not_found"
+    assert Transfer.objects.count() == 1
@@ -0,0 +1,196 @@
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+import pytest
+from django.db import connection, transaction
+from django.test import override_settings
+from django.urls import reverse
+
+from apps.transactions.dto import TransferCreateCommand
+from apps.transactions.exceptions import TransferInProgressException
+from apps.transactions.models import Transfer, WalletBalance
+from apps.transactions.services import transfer_funds
+
+
+@pytest.fixture
+def hold_coalesce_lock():
+    """
+    Держит advisory-блокировку ключа в отдельном соединении, как незавершённый первый запрос.
+    """
+    threads = []
+
+    def _hold(from_wallet_id, idempotency_key):
+        locked = threading.Event()
+        release = threading.Event()
+
+        def run():
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT pg_advisory_xact_lock(hashtextextended(%s, 0))", [f"{from_wallet_id}:{idempotency_key}"]
+                )
+                locked.set()
+                release.wait(5)
+            connection.close()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        threads.append((thread, release))
+        locked.wait(5)
+        return release
+
+    yield _hold
+
+    for thread, release in threads:
+        release.set()
+        thread.join()
+
+
+@pytest.mark.django_db(transaction=True)
+@override_settings(TRANSFER_COALESCE_WAIT=0.1)
+def test_duplicate_in_progress_times_out(engine, wallets, balances, hold_coalesce_lock):
+    from_wallet, to_wallet = wallets
+    command = TransferCreateCommand(
+        from_wallet_id=from_wallet.id,
+        to_wallet_id=to_wallet.id,
+        amount=Decimal("100.00"),
+        idempotency_key=str(uuid.uuid4()),
+    )
+    release = hold_coalesce_lock(from_wallet.id, command.idempotency_key)
+
+    with pytest.raises(TransferInProgressException):
+        transfer_funds(command)
+
+    release.set()
+    response = transfer_funds(command)
+    assert response.created
+    assert Transfer.objects.count() == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_duplicate_waits_for_first_request(engine, wallets, balances, hold_coalesce_lock):
+    from_wallet, to_wallet = wallets
+    command = TransferCreateCommand(
+        from_wallet_id=from_wallet.id,
+        to_wallet_id=to_wallet.id,
+        amount=Decimal("4000.00"),
+        idempotency_key=str(uuid.uuid4()),
+    )
+    first = transfer_funds(command)
+
+    # Баланса на второй перевод не хватает, но дубль получает уже выполненный перевод, а не 400
+    release = hold_coalesce_lock(from_wallet.id, command.idempotency_key)
+    threading.Timer(0.05, release.set).start()
+    replay = transfer_funds(command)
+
+    assert not replay.created
+    assert replay.transfer.id == first.transfer.id
+
+
+def batch_item(command):
+    return {
+        "from_wallet": str(command.from_wallet_id),
+        "to_wallet": str(command.to_wallet_id),
+        "amount": str(command.amount),
+        "idempotency_key": command.idempotency_key,
+    }
+
+
+@pytest.mark.django_db(transaction=True)
+def test_batch_waits_for_concurrent_transfer(engine, api_client, wallets, balances):
+    from_wallet, to_wallet = wallets
+    command = TransferCreateCommand(
+        from_wallet_id=from_wallet.id,
+        to_wallet_id=to_wallet.id,
+        amount=Decimal("100.00"),
+        idempotency_key=str(uuid.uuid4()),
+    )
+    locked = threading.Event()
+    single = {}
+
+    def run():
+        # Одиночный перевод с тем же ключом уже взял блокировку, но ещё не записал перевод
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_advisory_xact_lock(hashtextextended(%s, 0))", [f"{from_wallet.id}:{command.idempotency_key}"]
+            )
+            locked.set()
+            time.sleep(0.1)
+            single["response"] = transfer_funds(command)
+        connection.close()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    locked.wait(5)
+    other = TransferCreateCommand(
+        from_wallet_id=to_wallet.id, to_wallet_id=from_wallet.id, amount=Decimal("5.00"), idempotency_key="other"
+    )
+    response = api_client.post(
+        reverse("transactions:transfer-batch"),
+        data={"transfers": [batch_item(command), batch_item(other)]},
+        format="json",
+    )
+    thread.join()
+
+    assert response.status_code == 200, response.content
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == ["existing", "created"]
+    assert results[0]["id"] == str(single["response"].transfer.id)
+    assert Transfer.objects.count() == 2
+    assert WalletBalance.objects.get(wallet=from_wallet).balance == Decimal("5000.00") - Decimal("100.00") + Decimal(
+        "5.00"
+    )
+
+
+@pytest.mark.django_db(transaction=True)
+@override_settings(TRANSFER_COALESCE_WAIT=0.1)
+def test_batch_item_in_progress(api_client, wallets, balances, hold_coalesce_lock):
+    from_wallet, to_wallet = wallets
+    busy = TransferCreateCommand(
+        from_wallet_id=from_wallet.id, to_wallet_id=to_wallet.id, amount=Decimal("100.00"), idempotency_key="busy"
+    )
+    free = TransferCreateCommand(
+        from_wallet_id=from_wallet.id, to_wallet_id=to_wallet.id, amount=Decimal("10.00"), idempotency_key="free"
+    )
+    hold_coalesce_lock(from_wallet.id, busy.idempotency_key)
+
+    response = api_client.post(
+        reverse("transactions:transfer-batch"),
+        data={"transfers": [batch_item(busy), batch_item(free)]},
+        format="json",
+    )
+
+    assert response.status_code == 200, response.content
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == ["error", "created"]
+    assert results[0]["code"] == "in_progress"
+    assert list(Transfer.objects.values_list("idempotency_key", flat=True)) == ["free"]
+
+
+@pytest.mark.django_db
+@override_settings(TRANSFER_COALESCE_WAIT=0)
+def test_batch_idempotency_race_is_conflict(api_client, wallets, balances, monkeypatch):
+    from_wallet, to_wallet = wallets
+    command = TransferCreateCommand(
+        from_wallet_id=from_wallet.id, to_wallet_id=to_wallet.id, amount=Decimal("100.00"), idempotency_key="race"
+    )
+    original = Transfer.objects.bulk_create
+
+    def bulk_create(transfers):
+        # Без блокировок ключей одиночный перевод успевает закоммититься между чтением переводов и вставкой
+        Transfer.objects.create(
+            from_wallet_id=from_wallet.id,
+            to_wallet_id=to_wallet.id,
+            amount=Decimal("100.00"),
+            fee=Decimal("0.00"),
+            idempotency_key="race",
+        )
+        return original(transfers)
+
+    monkeypatch.setattr(Transfer.objects, "bulk_create", bulk_create)
+    response = api_client.post(
+        reverse("transactions:transfer-batch"), data={"transfers": [batch_item(command)]}, format="json"
+    )
+
+    assert response.status_code == 409, response.content
@@ -1,17 +1,23 @@
 import os
+import uuid
 
 import pytest
 from decimal import Decimal
 
 from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.urls import reverse
 from rest_framework.test import APIClient
 
+from apps.transactions.cache import invalidate_admin_wallet
+from apps.transactions.dto import TransferCreateCommand
 from apps.transactions.models import (
     Wallet,
     WalletBalance,
     Transfer,
     Transaction,
 )
+from apps.transactions.services import transfer_funds
 
 
 @pytest.fixture
@@ -99,3 +105,69 @@ def set_balance():
         return balance
 
     return _set
+
+
+@pytest.fixture
+def make_transfer(wallets, balances):
+    """
+    Перевод from_wallet -> to_wallet через transfer_funds; created_at - задним числом проставляется проводкам
+    """
+    from_wallet, to_wallet = wallets
+
+    def _make(amount="1.00", created_at=None):
+        transfer = transfer_funds(
+            TransferCreateCommand(
+                from_wallet_id=from_wallet.id,
+                to_wallet_id=to_wallet.id,
+                amount=Decimal(amount),
+                idempotency_key=str(uuid.uuid4()),
+            )
+        ).transfer
+        if created_at is not None:
+            Transaction.objects.filter(transfer=transfer).update(created_at=created_at)
+        return transfer
+
+    return _make
+
+
+@pytest.fixture(params=["orm", "plpgsql"])
+def engine(request):
+    """
+    Тест выполняется на обоих движках перевода (TRANSFER_ENGINE)
+    """
+    with override_settings(TRANSFER_ENGINE=request.param):
+        yield request.param
+
+
+# Ключ идемпотентности по умолчанию - новый на каждый запрос
+NEW_IDEMPOTENCY_KEY = object()
+
+
+@pytest.fixture
+def post_transfer(api_client):
+    """
+    POST перевода через api_client; idempotency_key=None - запрос без заголовка Idempotency-Key
+    """
+
+    def _post(from_wallet, to_wallet, amount, idempotency_key=NEW_IDEMPOTENCY_KEY, url_name="transactions:transfer"):
+        if idempotency_key is NEW_IDEMPOTENCY_KEY:
+            idempotency_key = str(uuid.uuid4())
+        headers = {} if idempotency_key is None else {"HTTP_IDEMPOTENCY_KEY": idempotency_key}
+        return api_client.post(
+            reverse(url_name),
+            data={"from_wallet": str(from_wallet.id), "to_wallet": str(to_wallet.id), "amount": amount},
+            format="json",
+            **headers,
+        )
+
+    return _post
+
+
+@pytest.fixture(autouse=True)
+def admin_wallet_cache():
+    """
+    Кэш админского кошелька живёт в памяти процесса и не должен переживать откат тестовой транзакции
+    """
+    invalidate_admin_wallet()
+    yield
+    invalidate_admin_wallet()
@@ -0,0 +1,110 @@
+import uuid
+from decimal import Decimal
+
+import pytest
+from django.db import connection
+from django.db.backends.postgresql.base import DatabaseWrapper
+from django.test import override_settings
+
+from apps.core.db import advisory_lock, prepared_cursor
+from apps.transactions.dto import TransferCreateCommand
+from apps.transactions.exceptions import NotEnoughMineralsException
+from apps.transactions.services import transfer_funds
+
+
+@pytest.fixture
+def prepare_immediately():
+    connection.ensure_connection()
+    threshold = connection.connection.prepare_threshold
+    connection.connection.prepare_threshold = 0
+    yield
+    connection.connection.prepare_threshold = threshold
+
+
+def prepared_statements():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT statement FROM pg_prepared_statements")
+        return [statement for (statement,) in cursor.fetchall()]
+
+
+@pytest.mark.django_db
+@override_settings(TRANSFER_ENGINE="plpgsql")
+def test_plpgsql_transfer_is_prepared(wallets, balances, prepare_immediately):
+    from_wallet, to_wallet = wallets
+
+    def transfer(amount):
+        return transfer_funds(
+            TransferCreateCommand(
+                from_wallet_id=from_wallet.id,
+                to_wallet_id=to_wallet.id,
+                amount=Decimal(amount),
+                idempotency_key=str(uuid.uuid4()),
+            )
+        )
+
+    transfers = [transfer("100.00").transfer, transfer("1100.00").transfer]
+    assert [t.fee for t in transfers] == [Decimal("0.00"), Decimal("110.00")]
+    assert [s for s in prepared_statements() if "transactions_transfer_funds" in s] == [
+        "SELECT * FROM transactions_transfer_funds($1, $2, $3, $4, $5, $6, $7)"
+    ]
+
+    # Ошибки функции по-прежнему различаются по SQLSTATE
+    with pytest.raises(NotEnoughMineralsException):
+        transfer("100000.00")
+
+
+@pytest.mark.django_db
+def test_prepared_cursor_follows_connection_settings(prepare_immediately):
+    with prepared_cursor() as cursor:
+        cursor.execute("SELECT %s::int * 2", [21])
+        assert cursor.fetchone() == (42,)
+    assert "SELECT $1::int * 2" in prepared_statements()
+
+    # Без подготовки (PgBouncer): запрос выполняется, но не готовится
+    connection.connection.prepare_threshold = None
+    with prepared_cursor() as cursor:
+        cursor.execute("SELECT %s::int * 3", [14])
+        assert cursor.fetchone() == (42,)
+    assert "SELECT $1::int * 3" not in prepared_statements()
+
+
+@pytest.mark.django_db
+def test_pool_reuses_connections():
+    settings_dict = {
+        **connection.settings_dict,
+        "CONN_MAX_AGE": 0,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            **connection.settings_dict["OPTIONS"],
+            "pool": {"min_size": 1, "max_size": 1},
+        },
+    }
+    pooled = DatabaseWrapper(settings_dict, alias=f"pool-{uuid.uuid4().hex}")
+    backends = []
+    try:
+        for _ in range(3):
+            # Как запрос: соединение из пула, в конце - close(), то есть возврат в пул
+            with pooled.cursor() as cursor:
+                cursor.execute("SELECT pg_backend_pid()")
+                backends.append(cursor.fetchone()[0])
+            pooled.close()
+    finally:
+        pooled.close_pool()
+
+    assert len(set(backends)) == 1
+
+
+@pytest.mark.django_db
+def test_advisory_lock_is_transaction_scoped():
+    with advisory_lock("tests:lock") as acquired:
+        assert acquired
+        with advisory_lock("tests:lock") as acquired_again:
+            assert not acquired_again
+
+        # Блокировка держится транзакцией отдельного соединения, сессия основного соединения её не держит
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' AND pid = pg_backend_pid()")
+            assert cursor.fetchone() == (0,)
+
+    with advisory_lock("tests:lock") as acquired:
+        assert acquired
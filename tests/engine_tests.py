@@ -0,0 +1,122 @@
+import uuid
+from decimal import Decimal
+
+import pytest
+from django.test import override_settings
+
+from apps.transactions.dto import TransferCreateCommand
+from apps.transactions.exceptions import AdminWalletException
+from apps.transactions.models import FeeShard, Wallet, WalletBalance, Transfer, Transaction
+from apps.transactions.services import transfer_funds
+
+pytestmark = pytest.mark.usefixtures("plpgsql_engine")
+
+
+@pytest.fixture
+def plpgsql_engine():
+    with override_settings(TRANSFER_ENGINE="plpgsql"):
+        yield
+
+
+@pytest.mark.django_db
+def test_plpgsql_transfer_happy_path(post_transfer, wallets, balances):
+    from_wallet, to_wallet = wallets
+    from_balance, to_balance, admin_balance = balances
+
+    response = post_transfer(from_wallet, to_wallet, "1001.00")
+
+    assert response.status_code == 201, response.content
+    from_balance.refresh_from_db()
+    to_balance.refresh_from_db()
+    admin_balance.refresh_from_db()
+    assert from_balance.balance == Decimal("5000.00") - Decimal("1101.10")
+    assert to_balance.balance == Decimal("1011.00")
+    assert admin_balance.balance == Decimal("100.10")
+    assert from_balance.version == to_balance.version == admin_balance.version == 1
+
+    transfer = Transfer.objects.get()
+    assert str(transfer.id) == response.json()["id"]
+    assert sorted(Transaction.objects.values_list("flow", "amount")) == [
+        ("credit", Decimal("1101.10")),
+        ("debit", Decimal("1001.00")),
+        ("fee", Decimal("100.10")),
+    ]
+
+
+@pytest.mark.django_db
+def test_plpgsql_transfer_idempotency(post_transfer, wallets, balances):
+    from_wallet, to_wallet = wallets
+    idempotency_key = str(uuid.uuid4())
+
+    first = post_transfer(from_wallet, to_wallet, "100.00", idempotency_key)
+    second = post_transfer(from_wallet, to_wallet, "100.00", idempotency_key)
+    conflict = post_transfer(from_wallet, to_wallet, "200.00", idempotency_key)
+
+    assert first.status_code in (200, 201), first.content
+    assert second.status_code in (200, 201), second.content
+    assert first.json()["id"] == second.json()["id"]
+    assert conflict.status_code == 409, conflict.content
+    assert Transfer.objects.count() == 1
+    assert WalletBalance.objects.get(wallet=to_wallet).balance == Decimal("110.00")
+
+
+@pytest.mark.django_db
+def test_plpgsql_transfer_errors(post_transfer, wallets, balances, admin_wallet):
+    from_wallet, to_wallet = wallets
+
+    response = post_transfer(from_wallet, to_wallet, "4999.00")
+    assert response.status_code == 400, response.content
+
+    with pytest.raises(AdminWalletException):
+        transfer_funds(
+            TransferCreateCommand(from_wallet_id=from_wallet.id, to_wallet_id=admin_wallet.id, amount=Decimal("1.00"))
+        )
+
+    assert not Transfer.objects.exists()
+    assert WalletBalance.objects.get(wallet=from_wallet).balance == Decimal("5000.00")
+
+
+@pytest.mark.django_db
+def test_plpgsql_transfer_unknown_wallet(post_transfer, wallets, balances):
+    from_wallet, to_wallet = wallets
+    unknown = Wallet(id=uuid.uuid4())
+
+    response = post_transfer(unknown, to_wallet, "10.00")
+    assert response.status_code == 400, response.content
+    assert "from_wallet" in response.json()
+
+    response = post_transfer(from_wallet, unknown, "10.00")
+    assert response.status_code == 400, response.content
+    assert "to_wallet" in response.json()
+
+
+@pytest.mark.django_db
+@override_settings(FEE_SHARDS=4)
+def test_plpgsql_transfer_fee_shard(post_transfer, wallets, balances):
+    from_wallet, to_wallet = wallets
+    from_balance, to_balance, admin_balance = balances
+
+    post_transfer(from_wallet, to_wallet, "2000.00")
+    post_transfer(from_wallet, to_wallet, "1500.00")
+
+    admin_balance.refresh_from_db()
+    assert admin_balance.balance == Decimal("0.00")
+    assert FeeShard.objects.get(shard=from_wallet.id.int % 4).balance == Decimal("350.00")
+
+
+@pytest.mark.django_db(transaction=True)
+def test_plpgsql_transfer_single_query(wallets, balances, django_assert_num_queries):
+    from_wallet, to_wallet = wallets
+
+    with django_assert_num_queries(1):
+        response = transfer_funds(
+            TransferCreateCommand(
+                from_wallet_id=from_wallet.id,
+                to_wallet_id=to_wallet.id,
+                amount=Decimal("1001.00"),
+                idempotency_key=str(uuid.uuid4()),
+            )
+        )
+
+    assert response.transfer.fee == Decimal("100.10")
+    assert Transfer.objects.get() == response.transfer
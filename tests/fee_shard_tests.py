@@ -0,0 +1,61 @@
+from decimal import Decimal
+
+import pytest
+from django.test import override_settings
+from django.urls import reverse
+
+from apps.transactions.models import FeeShard
+from apps.transactions.services import get_admin_balance, sweep_fee_shards
+
+
+@pytest.mark.django_db
+@override_settings(FEE_SHARDS=4)
+def test_fee_goes_to_shard(post_transfer, wallets, balances):
+    from_wallet, to_wallet = wallets
+    from_balance, to_balance, admin_balance = balances
+
+    response = post_transfer(from_wallet, to_wallet, "2000.00")
+
+    assert response.status_code == 201, response.content
+    admin_balance.refresh_from_db()
+    assert admin_balance.balance == Decimal("0.00")
+    assert FeeShard.objects.get(shard=from_wallet.id.int % 4).balance == Decimal("200.00")
+
+    result = get_admin_balance()
+    assert result.balance == Decimal("0.00")
+    assert result.pending_fees == Decimal("200.00")
+    assert result.total == Decimal("200.00")
+
+
+@pytest.mark.django_db
+@override_settings(FEE_SHARDS=4)
+def test_sweep_moves_shards_to_admin_wallet(post_transfer, wallets, balances):
+    from_wallet, to_wallet = wallets
+    from_balance, to_balance, admin_balance = balances
+
+    post_transfer(from_wallet, to_wallet, "2000.00")
+    post_transfer(from_wallet, to_wallet, "1500.00")
+
+    assert sweep_fee_shards() == Decimal("350.00")
+    assert sweep_fee_shards() == Decimal("0.00")
+
+    admin_balance.refresh_from_db()
+    assert admin_balance.balance == Decimal("350.00")
+    assert admin_balance.version == 1
+    assert get_admin_balance().pending_fees == Decimal("0.00")
+
+
+@pytest.mark.django_db
+def test_admin_balance_requires_staff(api_client, admin_user, balances):
+    url = reverse("transactions:admin-balance")
+
+    response = api_client.get(url)
+    assert response.status_code in (401, 403), response.content
+
+    admin_user.is_staff = True
+    admin_user.save(update_fields=["is_staff"])
+    api_client.force_authenticate(admin_user)
+
+    response = api_client.get(url)
+    assert response.status_code == 200, response.content
+    assert response.json() == {"balance": "0.00", "pending_fees": "0.00", "total": "0.00"}
@@ -0,0 +1,66 @@
+import uuid
+
+import pytest
+from django.urls import reverse
+
+from apps.transactions.models import Transaction
+
+
+@pytest.mark.django_db
+def test_wallet_history_pages(api_client, wallets, make_transfer, django_assert_max_num_queries):
+    from_wallet, to_wallet = wallets
+    transfers = [make_transfer() for _ in range(7)]
+    url = reverse("transactions:wallet-transactions", kwargs={"wallet_id": from_wallet.id})
+
+    seen = []
+    next_url = f"{url}?limit=3"
+    while next_url:
+        with django_assert_max_num_queries(2):
+            response = api_client.get(next_url)
+        assert response.status_code == 200, response.content
+        seen.extend(response.json()["results"])
+        next_url = response.json()["next"]
+
+    assert len(seen) == 7
+    assert len({item["id"] for item in seen}) == 7
+    # Движок plpgsql ставит проводкам время начала транзакции БД (в тесте - одно на всех), порядок тогда задаёт id
+    expected = Transaction.objects.filter(wallet=from_wallet).order_by("-created_at", "-id")
+    assert [item["id"] for item in seen] == [str(pk) for pk in expected.values_list("id", flat=True)]
+    assert {item["transfer"] for item in seen} == {str(transfer.id) for transfer in transfers}
+    assert all(item["flow"] == "credit" and item["counterparty"] == str(to_wallet.id) for item in seen)
+
+
+@pytest.mark.django_db
+def test_wallet_history_filters(api_client, wallets, make_transfer):
+    from_wallet, to_wallet = wallets
+    make_transfer()
+    make_transfer()
+    make_transfer("1001.00")
+    url = reverse("transactions:wallet-transactions", kwargs={"wallet_id": to_wallet.id})
+
+    response = api_client.get(url, {"flow": "debit"})
+    assert response.status_code == 200, response.content
+    assert len(response.json()["results"]) == 3
+    assert all(item["counterparty"] == str(from_wallet.id) for item in response.json()["results"])
+
+    response = api_client.get(url, {"flow": "credit"})
+    assert response.json()["results"] == []
+
+    response = api_client.get(url, {"created_before": "2000-01-01T00:00:00Z"})
+    assert response.json()["results"] == []
+
+
+@pytest.mark.django_db
+def test_wallet_history_errors(api_client, wallets, balances, admin_wallet):
+    from_wallet, to_wallet = wallets
+    url = reverse("transactions:wallet-transactions", kwargs={"wallet_id": from_wallet.id})
+
+    assert api_client.get(url).json() == {"next": None, "results": []}
+    assert api_client.get(url, {"cursor": "broken"}).status_code == 400
+    assert api_client.get(url, {"flow": "unknown"}).status_code == 400
+
+    url = reverse("transactions:wallet-transactions", kwargs={"wallet_id": uuid.uuid4()})
+    assert api_client.get(url).status_code == 404
+
+    url = reverse("transactions:wallet-transactions", kwargs={"wallet_id": admin_wallet.id})
+    assert api_client.get(url).status_code == 404
@@ -0,0 +1,150 @@
+import threading
+import uuid
+from decimal import Decimal
+
+import pytest
+from django.test import override_settings
+
+from apps.core.redis_client import get_redis
+from apps.transactions.idempotency import IdempotencyRecord
+from apps.transactions.models import WalletBalance, Transfer
+
+
+@pytest.fixture(autouse=True)
+def idempotency_cache():
+    prefix = f"test:idempotency:{uuid.uuid4().hex}"
+    get_redis.cache_clear()
+    with override_settings(IDEMPOTENCY_CACHE_ENABLED=True, IDEMPOTENCY_CACHE_PREFIX=prefix):
+        yield
+
+    get_redis.cache_clear()
+    client = get_redis()
+    keys = list(client.scan_iter(f"{prefix}:*"))
+    if keys:
+        client.delete(*keys)
+    get_redis.cache_clear()
+
+
+@pytest.mark.django_db
+def test_replay_served_from_redis(post_transfer, wallets, balances, django_assert_num_queries):
+    from_wallet, to_wallet = wallets
+    idempotency_key = str(uuid.uuid4())
+
+    first = post_transfer(from_wallet, to_wallet, "100.00", idempotency_key)
+    assert first.status_code == 201, first.content
+
+    with django_assert_num_queries(0):
+        replay = post_transfer(from_wallet, to_wallet, "100.00", idempotency_key)
+
+    assert replay.status_code == 200, replay.content
+    assert replay.json() == first.json()
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert Transfer.objects.count() == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("cache_enabled", [True, False])
+def test_replay_status_same_for_cache_and_db(post_transfer, wallets, balances, cache_enabled):
+    from_wallet, to_wallet = wallets
+    idempotency_key = str(uuid.uuid4())
+
+    with override_settings(IDEMPOTENCY_CACHE_ENABLED=cache_enabled):
+        first = post_transfer(from_wallet, to_wallet, "100.00", idempotency_key)
+        replay = post_transfer(from_wallet, to_wallet, "100.00", idempotency_key)
+
+    # Первый запрос - 201, любой повтор - 200 с тем же телом, из Redis или из БД
+    assert (first.status_code, replay.status_code) == (201, 200), replay.content
+    assert replay.json() == first.json()
+    assert ("Idempotent-Replayed" in replay.headers) is cache_enabled
+
+
+@pytest.mark.django_db
+def test_payload_mismatch_conflict(post_transfer, wallets, balances):
+    from_wallet, to_wallet = wallets
+    idempotency_key = str(uuid.uuid4())
+
+    assert post_transfer(from_wallet, to_wallet, "100.00", idempotency_key).status_code == 201
+
+    response = post_transfer(from_wallet, to_wallet, "200.00", idempotency_key)
+    assert response.status_code == 409, response.content
+    assert WalletBalance.objects.get(wallet=from_wallet).balance == Decimal("4900.00")
+
+
+def claim(from_wallet, to_wallet, amount, idempotency_key):
+    # Ключ, занятый первым запросом, который ещё выполняется
+    record = IdempotencyRecord.for_transfer(
+        {"from_wallet": from_wallet.id, "to_wallet": to_wallet.id, "amount": Decimal(amount)}, idempotency_key
+    )
+    assert record.begin() is None
+    return record
+
+
+@pytest.mark.django_db
+def test_in_progress_duplicate_waits_for_stored_response(post_transfer, wallets, balances, django_assert_num_queries):
+    from_wallet, to_wallet = wallets
+    idempotency_key = str(uuid.uuid4())
+    record = claim(from_wallet, to_wallet, "100.00", idempotency_key)
+    body = {"id": str(uuid.uuid4()), "from_wallet": str(from_wallet.id), "to_wallet": str(to_wallet.id)}
+    threading.Timer(0.05, record.complete, args=(201, body)).start()
+
+    with django_assert_num_queries(0):
+        response = post_transfer(from_wallet, to_wallet, "100.00", idempotency_key)
+
+    assert response.status_code == 200, response.content
+    assert response.json() == body
+    assert response.headers["Idempotent-Replayed"] == "true"
+
+
+@pytest.mark.django_db
+@override_settings(TRANSFER_COALESCE_WAIT=0.05)
+def test_stale_claim_falls_back_to_db(post_transfer, wallets, balances):
+    from_wallet, to_wallet = wallets
+    idempotency_key = str(uuid.uuid4())
+    # Первый запрос упал, не освободив ключ: после ожидания перевод выполняет БД
+    claim(from_wallet, to_wallet, "100.00", idempotency_key)
+
+    response = post_transfer(from_wallet, to_wallet, "100.00", idempotency_key)
+    assert response.status_code == 201, response.content
+    assert "Idempotent-Replayed" not in response.headers
+
+    response = post_transfer(from_wallet, to_wallet, "100.00", idempotency_key)
+    assert response.status_code == 200, response.content
+    assert Transfer.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_in_progress_payload_mismatch_conflict(post_transfer, wallets, balances):
+    from_wallet, to_wallet = wallets
+    idempotency_key = str(uuid.uuid4())
+    claim(from_wallet, to_wallet, "100.00", idempotency_key)
+
+    response = post_transfer(from_wallet, to_wallet, "200.00", idempotency_key)
+    assert response.status_code == 409, response.content
+    assert not Transfer.objects.exists()
+
+
+@pytest.mark.django_db
+def test_failed_transfer_not_cached(post_transfer, wallets, balances, set_balance):
+    from_wallet, to_wallet = wallets
+    from_balance, to_balance, admin_balance = balances
+    idempotency_key = str(uuid.uuid4())
+    set_balance(from_balance, "50.00")
+
+    response = post_transfer(from_wallet, to_wallet, "100.00", idempotency_key)
+    assert response.status_code == 400, response.content
+
+    set_balance(from_balance, "500.00")
+    response = post_transfer(from_wallet, to_wallet, "100.00", idempotency_key)
+    assert response.status_code == 201, response.content
+
+
+@pytest.mark.django_db
+@override_settings(REDIS_URL="redis://localhost:1/0")
+def test_redis_unavailable_falls_back_to_db(post_transfer, wallets, balances):
+    from_wallet, to_wallet = wallets
+    idempotency_key = str(uuid.uuid4())
+    get_redis.cache_clear()
+
+    assert post_transfer(from_wallet, to_wallet, "100.00", idempotency_key).status_code == 201
+    assert post_transfer(from_wallet, to_wallet, "100.00", idempotency_key).status_code == 200
+    assert Transfer.objects.count() == 1
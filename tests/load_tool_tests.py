@@ -0,0 +1,78 @@
+import collections
+import json
+import uuid
+
+import race_test
+from tests.stub_receiver import StubReceiver
+
+WALLETS = [str(uuid.UUID(int=index)) for index in range(1, 21)]
+
+
+def wallet_args_list():
+    return [arg for wallet in WALLETS for arg in ("--wallet", wallet)]
+
+
+def wallet_args(*args):
+    return race_test.parse_args([*wallet_args_list(), *args])
+
+
+def test_scenarios_are_reproducible():
+    args = wallet_args("--scenario", "zipf", "--fee-ratio", "0.5", "--seed", "7")
+    first, second = race_test.Scenario(args), race_test.Scenario(args)
+    payloads = [first.next_request(index).payload for index in range(500)]
+    assert payloads == [second.next_request(index).payload for index in range(500)]
+
+    # Ранг 1 - самый горячий кошелёк, комиссия - примерно у половины переводов
+    senders = collections.Counter(payload["from_wallet"] for payload in payloads)
+    assert senders.most_common(1)[0][0] == WALLETS[0]
+    assert 150 < sum(float(payload["amount"]) > 1000 for payload in payloads) < 350
+
+
+def test_replay_scenario_repeats_key_and_payload():
+    scenario = race_test.Scenario(wallet_args("--scenario", "replay", "--replay-ratio", "0.5"))
+    requests = [scenario.next_request(index) for index in range(200)]
+    keys = collections.Counter(request.idempotency_key for request in requests)
+    assert 50 < len(requests) - len(keys) < 150
+    # Повтор - тот же запрос целиком
+    by_key = {}
+    for request in requests:
+        assert by_key.setdefault(request.idempotency_key, request) == request
+
+
+def test_report_and_baseline_comparison():
+    samples = [race_test.Sample(index, 201, (index + 1) / 1000) for index in range(98)]
+    samples += [race_test.Sample(98, 409, 0.5), race_test.Sample(99, "ClientConnectorError", 2.0)]
+    report = race_test.build_report(samples, 2.0, wallet_args("--scenario", "uniform"))
+
+    assert report["throughput_rps"] == 50.0
+    assert report["latency_ms"] == {"mean": 73.51, "p50": 50.0, "p95": 95.0, "p99": 500.0, "max": 2000.0}
+    assert sum(bucket["count"] for bucket in report["histogram_ms"]) == 100
+    assert report["histogram_ms"][:3] == [{"le": 1, "count": 1}, {"le": 2, "count": 1}, {"le": 5, "count": 3}]
+    assert report["statuses"] == {"201": 98, "409": 1, "ClientConnectorError": 1}
+    assert (report["conflict_rate"], report["error_rate"]) == (0.01, 0.02)
+
+    slower = {**report, "throughput_rps": 40.0, "latency_ms": {**report["latency_ms"], "p99": 520.0}}
+    comparison = {row["metric"]: row for row in race_test.compare_reports(slower, report, tolerance=10)}
+    assert comparison["throughput_rps"]["change_pct"] == -20.0
+    assert comparison["throughput_rps"]["regression"]
+    assert not comparison["latency_ms.p99"]["regression"]
+    assert not comparison["conflict_rate"]["regression"]
+
+
+def test_closed_and_open_loop_against_server(tmp_path):
+    with StubReceiver(delay=0.01) as receiver:
+        output = tmp_path / "report.json"
+        args = ["--url", receiver.url, "--scenario", "uniform", "--requests", "40", "--concurrency", "8"]
+        assert race_test.main([*wallet_args_list(), *args, "--output", str(output)]) == 0
+        report = json.loads(output.read_text())
+        assert (report["requests"], report["statuses"]) == (40, {"200": 40})
+        assert receiver.max_in_flight <= 8
+
+        # Открытый цикл: 20 запросов в секунду в течение секунды
+        args = ["--url", receiver.url, "--scenario", "uniform", "--mode", "open", "--rate", "20", "--duration", "1"]
+        baseline = {**report, "throughput_rps": report["throughput_rps"] * 100}
+        (tmp_path / "baseline.json").write_text(json.dumps(baseline))
+        # Пропускная способность упала - ненулевой код
+        assert race_test.main([*wallet_args_list(), *args, "--baseline", str(tmp_path / "baseline.json")]) == 1
+
+    assert len(receiver.received) == 60
@@ -0,0 +1,168 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import types
+import uuid
+from decimal import Decimal
+
+import pytest
+from django.conf import settings
+from django.urls import reverse
+from prometheus_client import REGISTRY, CollectorRegistry, multiprocess
+
+from apps.core.metrics import observe_queue_lag
+from apps.transactions import services
+from apps.transactions.dto import TransferCreateCommand
+from apps.transactions.exceptions import NotEnoughMineralsException, VersionConflictException
+from apps.transactions.notifications import Notification, NotificationDispatcher, Transport
+from apps.transactions.services import RetryPolicy, transfer_funds
+
+POLICY = RetryPolicy(max_attempts=2, base_delay=0.001, max_delay=0.01, deadline=1.0)
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@pytest.fixture
+def metric_delta():
+    """
+    Прирост метрики за тест: реестр общий на процесс и копится между тестами
+    """
+    before = {}
+
+    def _delta(name, **labels):
+        return sample(name, **labels) - before[(name, tuple(sorted(labels.items())))]
+
+    def _watch(name, **labels):
+        before[(name, tuple(sorted(labels.items())))] = sample(name, **labels)
+
+    _delta.watch = _watch
+    return _delta
+
+
+def command(wallets, amount, idempotency_key=None):
+    from_wallet, to_wallet = wallets
+    return TransferCreateCommand(
+        from_wallet_id=from_wallet.id,
+        to_wallet_id=to_wallet.id,
+        amount=Decimal(amount),
+        idempotency_key=idempotency_key or str(uuid.uuid4()),
+    )
+
+
+@pytest.mark.django_db
+def test_transfer_outcomes_and_fees(wallets, balances, metric_delta):
+    engine = settings.TRANSFER_ENGINE
+    for outcome in ("ok", "replay", "insufficient_funds"):
+        metric_delta.watch("transfer_duration_seconds_count", engine=engine, outcome=outcome)
+    metric_delta.watch("transfer_fee_amount_count")
+    metric_delta.watch("transfer_fee_amount_sum")
+
+    transfer_funds(command(wallets, "100.00"))
+    transfer_funds(command(wallets, "1100.00", idempotency_key="fee"))
+    transfer_funds(command(wallets, "1100.00", idempotency_key="fee"))
+    with pytest.raises(NotEnoughMineralsException):
+        transfer_funds(command(wallets, "100000.00"))
+
+    assert metric_delta("transfer_duration_seconds_count", engine=engine, outcome="ok") == 2
+    assert metric_delta("transfer_duration_seconds_count", engine=engine, outcome="replay") == 1
+    assert metric_delta("transfer_duration_seconds_count", engine=engine, outcome="insufficient_funds") == 1
+    # Комиссия - только у созданного перевода больше 1000.00
+    assert metric_delta("transfer_fee_amount_count") == 1
+    assert metric_delta("transfer_fee_amount_sum") == 110.0
+
+
+@pytest.mark.django_db
+def test_version_conflicts_by_wallet(wallets, balances, metric_delta, monkeypatch):
+    engine = settings.TRANSFER_ENGINE
+    metric_delta.watch("transfer_retries_total", engine=engine, wallet="admin")
+    metric_delta.watch("transfer_duration_seconds_count", engine=engine, outcome="conflict_to")
+
+    conflicts = iter(["admin", "to", "to"])
+    original = services._transfer_funds_once
+
+    def _once(transfer_command):
+        wallet = next(conflicts, None)
+        if wallet:
+            raise VersionConflictException("Выполняется другая операция (версия)", wallet=wallet)
+        return original(transfer_command)
+
+    monkeypatch.setattr(services, "_transfer_funds_once", _once)
+
+    # Первый перевод: конфликт по админскому кошельку и повтор, второй - конфликт по получателю до исчерпания попыток
+    with pytest.raises(VersionConflictException):
+        transfer_funds(command(wallets, "100.00"), retry_policy=POLICY)
+
+    assert metric_delta("transfer_retries_total", engine=engine, wallet="admin") == 1
+    assert metric_delta("transfer_duration_seconds_count", engine=engine, outcome="conflict_to") == 1
+
+
+def test_notification_retries_and_outcomes(metric_delta):
+    class FlakyTransport(Transport):
+        def __init__(self):
+            self.calls = {}
+
+        async def send(self, notification):
+            self.calls[notification.key] = self.calls.get(notification.key, 0) + 1
+            # Первое уведомление доходит со второй попытки, второе - никогда
+            if notification.payload["fail"] and (notification.payload["fail"] > 1 or self.calls[notification.key] == 1):
+                raise ConnectionError("получатель недоступен")
+
+    for outcome in ("sent", "dead"):
+        metric_delta.watch("transfer_notifications_total", outcome=outcome)
+    metric_delta.watch("transfer_notification_retries_total")
+
+    dispatcher = NotificationDispatcher(FlakyTransport(), concurrency=4, max_attempts=3, base_delay=0, max_delay=0)
+    notifications = [Notification(uuid.uuid4(), {"fail": fail}) for fail in (0, 1, 2)]
+    asyncio.run(dispatcher.dispatch(notifications))
+
+    assert metric_delta("transfer_notifications_total", outcome="sent") == 2
+    assert metric_delta("transfer_notifications_total", outcome="dead") == 1
+    assert metric_delta("transfer_notification_retries_total") == 1 + 2
+
+
+def test_celery_queue_lag_counts_from_eta(metric_delta):
+    metric_delta.watch("celery_task_queue_lag_seconds_count", task="tests.lag")
+    metric_delta.watch("celery_task_queue_lag_seconds_sum", task="tests.lag")
+
+    def task(enqueued_ago, eta=None):
+        request = types.SimpleNamespace(enqueued_at=time.time() - enqueued_ago, eta=eta)
+        return types.SimpleNamespace(name="tests.lag", request=request)
+
+    observe_queue_lag(task(2.0))
+    # Отложенная на 60 секунд задача в очереди ждала запланированно: задержка от eta почти нулевая
+    observe_queue_lag(task(60.0, eta=time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(time.time() - 0.5))))
+    observe_queue_lag(types.SimpleNamespace(name="tests.lag", request=types.SimpleNamespace(eta=None)))
+
+    assert metric_delta("celery_task_queue_lag_seconds_count", task="tests.lag") == 2
+    assert 2.0 <= metric_delta("celery_task_queue_lag_seconds_sum", task="tests.lag") < 4.0
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint(client):
+    response = client.get(reverse("metrics"))
+    assert response.status_code == 200
+    assert response["Content-Type"].startswith("text/plain")
+    assert b"# TYPE transfer_duration_seconds histogram" in response.content
+
+
+def test_metrics_are_collected_across_processes(tmp_path):
+    # Как воркеры gunicorn: каждый процесс пишет свой файл, коллектор суммирует их
+    code = (
+        "import django; django.setup();"
+        "from apps.transactions import metrics;"
+        "metrics.NOTIFICATION_RETRIES.inc(3);"
+        "metrics.TRANSFER_DURATION.labels('orm', 'ok').observe(0.01)"
+    )
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path), "DJANGO_SETTINGS_MODULE": "project.settings"}
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", code], cwd=settings.BASE_DIR, env=env, check=True)
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=str(tmp_path))
+    assert registry.get_sample_value("transfer_notification_retries_total") == 6
+    labels = {"engine": "orm", "outcome": "ok"}
+    assert registry.get_sample_value("transfer_duration_seconds_count", labels) == 2
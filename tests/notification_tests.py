@@ -0,0 +1,236 @@
+import asyncio
+import datetime
+import io
+import time
+import uuid
+
+import pytest
+import redis
+from django.core.management import call_command
+from django.test import override_settings
+
+from apps.core.redis_client import get_redis
+from apps.transactions import notifications as notifications_module
+from apps.transactions.models import NotificationDeadLetter, Transfer
+from apps.transactions.notifications import (
+    HttpTransport,
+    Notification,
+    NotificationDispatcher,
+    Transport,
+    dispatch_notifications,
+    flush_digests,
+    recover_digests,
+)
+from apps.transactions.tasks import flush_notification_digest, notify_recipients
+from tests.stub_receiver import StubReceiver
+
+
+@pytest.fixture
+def receiver():
+    prefix = f"test:notifications:{uuid.uuid4().hex}"
+    with StubReceiver() as receiver:
+        with override_settings(
+            NOTIFICATION_TRANSPORT="apps.transactions.notifications.HttpTransport",
+            NOTIFICATION_URL=receiver.url,
+            NOTIFICATION_MAX_ATTEMPTS=3,
+            NOTIFICATION_RETRY_BASE_DELAY=0.001,
+            NOTIFICATION_RETRY_MAX_DELAY=0.01,
+            NOTIFICATION_DIGEST_PREFIX=prefix,
+            NOTIFICATION_DIGEST_THRESHOLD=2,
+            NOTIFICATION_DIGEST_MAX_SIZE=4,
+        ):
+            yield receiver
+
+    for key in get_redis().scan_iter(f"{prefix}:*"):
+        get_redis().delete(key)
+
+
+def in_order(transfers):
+    # plpgsql пишет created_at = now(), а в транзакции теста now() одно на все переводы
+    start = min(transfer.created_at for transfer in transfers)
+    for index, transfer in enumerate(transfers):
+        transfer.created_at = start + datetime.timedelta(milliseconds=index)
+    Transfer.objects.bulk_update(transfers, ["created_at"])
+    return transfers
+
+
+@pytest.mark.django_db
+def test_notifications_are_retried_until_delivered(receiver, wallets, make_transfer, django_assert_num_queries):
+    _, to_wallet = wallets
+    transfers = [make_transfer("10.00"), make_transfer("20.00")]
+    receiver.failures = 2
+
+    # Переводы с кошельками - одним запросом
+    with django_assert_num_queries(1):
+        result = dispatch_notifications([transfer.id for transfer in transfers])
+
+    assert (result.sent, result.dead) == (2, [])
+    assert receiver.attempts == {str(transfer.id): 3 for transfer in transfers}
+    assert sorted(payload["amount"] for payload in receiver.received) == ["10.00", "20.00"]
+    assert {payload["recipient"] for payload in receiver.received} == {to_wallet.user_id}
+
+
+@pytest.mark.django_db
+def test_undelivered_notifications_go_to_dead_letters(receiver, make_transfer):
+    transfer = make_transfer("10.00")
+    receiver.failures = 3
+
+    result = dispatch_notifications([transfer.id])
+    assert result.sent == 0
+    letter = NotificationDeadLetter.objects.get()
+    assert (letter.key, letter.attempts, letter.payload["amount"]) == (transfer.id, 3, "10.00")
+    assert "503" in letter.error
+    assert receiver.received == []
+
+    # Приёмник поднялся: повторная отправка очищает таблицу
+    out = io.StringIO()
+    call_command("redeliver_notifications", stdout=out)
+    assert "Sent=1 failed=0" in out.getvalue()
+    assert not NotificationDeadLetter.objects.exists()
+    assert [payload["transfer"] for payload in receiver.received] == [str(transfer.id)]
+
+
+def test_dispatcher_keeps_many_notifications_in_flight():
+    notifications = [Notification(uuid.uuid4(), {"n": index}) for index in range(1000)]
+
+    async def dispatch(url):
+        transport = HttpTransport(url=url, timeout=10, concurrency=1000)
+        dispatcher = NotificationDispatcher(transport, concurrency=1000, max_attempts=1, base_delay=0, max_delay=0)
+        try:
+            return await dispatcher.dispatch(notifications)
+        finally:
+            await transport.aclose()
+
+    with StubReceiver(delay=0.5) as receiver:
+        started = time.monotonic()
+        result = asyncio.run(dispatch(receiver.url))
+        elapsed = time.monotonic() - started
+
+    assert (result.sent, result.dead) == (1000, [])
+    # По одному - это 500 секунд
+    assert elapsed < 5
+    assert receiver.max_in_flight > 100
+
+
+@pytest.mark.django_db
+def test_busy_recipient_gets_digest(receiver, wallets, make_transfer, monkeypatch, django_assert_num_queries):
+    _, to_wallet = wallets
+    scheduled = []
+    monkeypatch.setattr(flush_notification_digest, "apply_async", lambda args, countdown: scheduled.append(args))
+
+    # Первые NOTIFICATION_DIGEST_THRESHOLD переводов окна - сразу, как у всех получателей
+    transfers = [make_transfer("10.00") for _ in range(5)]
+    assert [notify_recipients([transfer.id]) for transfer in transfers] == [1, 1, 0, 0, 0]
+    assert len(receiver.received) == 2
+    # Отправка дайджеста запланирована один раз - первым переводом в буфере
+    assert scheduled == [[to_wallet.id]]
+
+    with django_assert_num_queries(1):
+        result = flush_digests([to_wallet.id])
+    assert result.sent == 1
+    digest = receiver.received[-1]
+    assert (digest["recipient"], digest["to_wallet"], digest["count"]) == (to_wallet.user_id, str(to_wallet.id), 3)
+    assert {payload["transfer"] for payload in digest["transfers"]} == {str(transfer.id) for transfer in transfers[2:]}
+
+    # Буфер пуст: запоздавшая отправка ничего не шлёт
+    assert flush_digests([to_wallet.id]).sent == 0
+
+
+@pytest.mark.django_db
+def test_digest_survives_worker_crash(receiver, wallets, make_transfer, monkeypatch):
+    _, to_wallet = wallets
+    monkeypatch.setattr(flush_notification_digest, "apply_async", lambda args, countdown: None)
+    transfers = [make_transfer("10.00") for _ in range(5)]
+    for transfer in transfers:
+        notify_recipients([transfer.id])
+
+    def crash(notifications):
+        raise SystemExit("воркер упал")
+
+    monkeypatch.setattr(notifications_module, "send_notifications", crash)
+    with pytest.raises(SystemExit):
+        flush_digests([to_wallet.id])
+    monkeypatch.undo()
+
+    # Забранный буфер не потерян, но пока не истёк NOTIFICATION_DIGEST_RECOVER_AFTER, его считают отправляемым
+    assert recover_digests().sent == 0
+    with override_settings(NOTIFICATION_DIGEST_RECOVER_AFTER=0):
+        assert recover_digests().sent == 1
+    digest = receiver.received[-1]
+    assert {payload["transfer"] for payload in digest["transfers"]} == {str(transfer.id) for transfer in transfers[2:]}
+
+    # Отправленный дайджест подтверждён и больше не досылается
+    with override_settings(NOTIFICATION_DIGEST_RECOVER_AFTER=0):
+        assert recover_digests().sent == 0
+    assert flush_digests([to_wallet.id]).sent == 0
+
+
+@pytest.mark.django_db
+def test_digest_with_lost_flush_task_is_recovered(receiver, wallets, make_transfer, monkeypatch):
+    _, to_wallet = wallets
+    # Задача отправки буфера потерялась, а новых переводов получателю нет
+    monkeypatch.setattr(flush_notification_digest, "apply_async", lambda args, countdown: None)
+    transfers = [make_transfer("10.00") for _ in range(3)]
+    for transfer in transfers:
+        notify_recipients([transfer.id])
+    assert len(receiver.received) == 2
+
+    assert recover_digests().sent == 0
+    with override_settings(NOTIFICATION_DIGEST_WINDOW=0.001, NOTIFICATION_DIGEST_RECOVER_AFTER=0):
+        time.sleep(0.01)
+        assert recover_digests().sent == 1
+        assert recover_digests().sent == 0
+    assert receiver.received[-1]["transfer"] == str(transfers[2].id)
+
+
+@pytest.mark.django_db
+def test_full_digest_is_sent_without_waiting(receiver, wallets, make_transfer):
+    _, to_wallet = wallets
+    transfers = in_order([make_transfer("10.00") for _ in range(6)])
+
+    result = dispatch_notifications([transfer.id for transfer in transfers])
+    # Первые NOTIFICATION_DIGEST_THRESHOLD переводов пачки - сразу, остальные заполняют буфер
+    assert (result.sent, result.scheduled) == (3, [])
+    # Уведомления пачки отправляются конкурентно, порядок прихода не определён
+    (digest,) = [payload for payload in receiver.received if "count" in payload]
+    single = {payload["transfer"] for payload in receiver.received if "count" not in payload}
+    assert single == {str(transfer.id) for transfer in transfers[:2]}
+    assert digest["count"] == 4
+    assert {payload["transfer"] for payload in digest["transfers"]} == {str(transfer.id) for transfer in transfers[2:]}
+
+
+@pytest.mark.django_db
+def test_batch_crossing_threshold_sends_first_transfers_now(receiver, wallets, make_transfer, monkeypatch):
+    _, to_wallet = wallets
+    scheduled = []
+    monkeypatch.setattr(flush_notification_digest, "apply_async", lambda args, countdown: scheduled.append(args))
+    transfers = in_order([make_transfer("10.00") for _ in range(3)])
+
+    assert notify_recipients([transfers[0].id]) == 1
+    # Во второй пачке до порога остаётся один перевод: он уходит сразу, следующий ждёт дайджест
+    assert notify_recipients([transfer.id for transfer in transfers[1:]]) == 1
+    assert [payload["transfer"] for payload in receiver.received] == [str(t.id) for t in transfers[:2]]
+    assert scheduled == [[to_wallet.id]]
+
+    assert flush_digests([to_wallet.id]).sent == 1
+    assert receiver.received[-1]["transfer"] == str(transfers[2].id)
+
+
+@pytest.mark.django_db
+def test_notifications_are_sent_directly_without_redis(receiver, make_transfer, monkeypatch):
+    class BrokenRedis:
+        def eval(self, *args):
+            raise redis.ConnectionError("Redis is down")
+
+    monkeypatch.setattr(notifications_module, "get_redis", BrokenRedis)
+    transfers = [make_transfer("10.00") for _ in range(5)]
+    result = dispatch_notifications([transfer.id for transfer in transfers])
+    assert (result.sent, result.scheduled) == (5, [])
+
+
+def test_transport_without_send_cannot_be_created():
+    class IncompleteTransport(Transport):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteTransport()
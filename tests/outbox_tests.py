@@ -0,0 +1,139 @@
+import io
+import uuid
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+
+from apps.transactions.dto import TransferCreateCommand
+from apps.transactions.exceptions import NotEnoughMineralsException
+from apps.transactions.models import OutboxEvent
+from apps.transactions import outbox as outbox_module
+from apps.transactions.outbox import relay_outbox, run_relay
+from apps.transactions.services import transfer_funds, transfer_funds_batch
+from apps.transactions.tasks import notify_recipients
+
+
+@pytest.fixture
+def published(monkeypatch):
+    calls = []
+    monkeypatch.setattr(notify_recipients, "apply_async", lambda kwargs: calls.append(kwargs["transfer_ids"]))
+    return calls
+
+
+def command(from_wallet, to_wallet, amount, idempotency_key=None):
+    return TransferCreateCommand(
+        from_wallet_id=from_wallet.id,
+        to_wallet_id=to_wallet.id,
+        amount=Decimal(amount),
+        idempotency_key=idempotency_key or str(uuid.uuid4()),
+    )
+
+
+def outbox():
+    return list(OutboxEvent.objects.order_by("created_at", "id").values_list("kind", "transfer_id"))
+
+
+@pytest.mark.django_db
+def test_transfer_writes_outbox_event(engine, wallets, balances):
+    from_wallet, to_wallet = wallets
+    transfer = transfer_funds(command(from_wallet, to_wallet, "100.00", "key-1")).transfer
+    assert outbox() == [("transfer_created", transfer.id)]
+
+    # Повтор и отказ событий не пишут
+    assert not transfer_funds(command(from_wallet, to_wallet, "100.00", "key-1")).created
+    with pytest.raises(NotEnoughMineralsException):
+        transfer_funds(command(from_wallet, to_wallet, "100000.00"))
+    assert outbox() == [("transfer_created", transfer.id)]
+
+
+@pytest.mark.django_db
+def test_batch_transfer_writes_outbox_events(wallets, balances):
+    from_wallet, to_wallet = wallets
+    results = transfer_funds_batch(
+        [
+            command(from_wallet, to_wallet, "100.00"),
+            command(from_wallet, to_wallet, "100000.00"),
+            command(to_wallet, from_wallet, "5.00"),
+        ]
+    )
+    created = {result.transfer.id for result in results if result.transfer}
+    assert len(created) == 2
+    assert {transfer_id for _, transfer_id in outbox()} == created
+
+
+@pytest.mark.django_db
+def test_api_transfer_does_not_touch_broker(api_client, wallets, balances, published):
+    from_wallet, to_wallet = wallets
+    response = api_client.post(
+        reverse("transactions:transfer"),
+        {"from_wallet": str(from_wallet.id), "to_wallet": str(to_wallet.id), "amount": "100.00"},
+        format="json",
+        HTTP_IDEMPOTENCY_KEY=str(uuid.uuid4()),
+    )
+    assert response.status_code == 201
+    assert published == []
+    assert outbox() == [("transfer_created", uuid.UUID(response.data["id"]))]
+
+
+@pytest.mark.django_db
+def test_relay_publishes_events_in_batches(wallets, balances, published):
+    from_wallet, to_wallet = wallets
+    transfers = [transfer_funds(command(from_wallet, to_wallet, "10.00")).transfer for _ in range(3)]
+
+    assert relay_outbox(batch_size=2) == 2
+    out = io.StringIO()
+    call_command("relay_outbox", "--once", stdout=out)
+    assert "Events=1" in out.getvalue()
+    assert relay_outbox(batch_size=2) == 0
+
+    assert [len(batch) for batch in published] == [2, 1]
+    assert sorted(transfer_id for batch in published for transfer_id in batch) == sorted(t.id for t in transfers)
+    assert outbox() == []
+
+
+@pytest.mark.django_db
+def test_failed_publish_keeps_events(wallets, balances, monkeypatch):
+    from_wallet, to_wallet = wallets
+    transfer = transfer_funds(command(from_wallet, to_wallet, "10.00")).transfer
+
+    def broker_down(kwargs):
+        raise ConnectionError("broker is down")
+
+    monkeypatch.setattr(notify_recipients, "apply_async", broker_down)
+    with pytest.raises(ConnectionError):
+        relay_outbox()
+    assert outbox() == [("transfer_created", transfer.id)]
+
+
+@override_settings(OUTBOX_ERROR_BASE_DELAY=1.0, OUTBOX_ERROR_MAX_DELAY=3.0)
+def test_relay_survives_publish_errors(monkeypatch):
+    results = iter([ConnectionError("broker is down")] * 3 + [500, 0, ConnectionError("broker is down")])
+    sleeps = []
+    reconnects = []
+
+    def relay(batch_size):
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    class Stop(Exception):
+        pass
+
+    def sleep(delay):
+        sleeps.append(delay)
+        if len(sleeps) == 5:
+            raise Stop
+
+    monkeypatch.setattr(outbox_module, "relay_outbox", relay)
+    monkeypatch.setattr(outbox_module.time, "sleep", sleep)
+    monkeypatch.setattr(outbox_module, "close_old_connections", lambda: reconnects.append(True))
+    with pytest.raises(Stop):
+        run_relay(batch_size=500, poll_interval=0.5)
+
+    # Пауза после ошибок растёт до максимума, успешная пачка сбрасывает её
+    assert sleeps == [1.0, 2.0, 3.0, 0.5, 1.0]
+    assert len(reconnects) == 4
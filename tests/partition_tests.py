@@ -0,0 +1,110 @@
+import datetime
+import io
+import uuid
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+
+from apps.transactions.archive import archive_period
+from apps.transactions.dto import TransferCreateCommand
+from apps.transactions.models import Transaction
+from apps.transactions.partitions import (
+    PARTITIONED_TABLE,
+    add_months,
+    list_partitions,
+    manage_partitions,
+    month_bound,
+    partition_name,
+)
+from apps.transactions.services import transfer_funds
+
+# Далеко за партициями, созданными миграцией
+FUTURE_MONTH = add_months(timezone.now().date().replace(day=1), 24)
+
+
+@pytest.fixture
+def transfer(wallets, balances):
+    from_wallet, to_wallet = wallets
+    return transfer_funds(
+        TransferCreateCommand(
+            from_wallet_id=from_wallet.id,
+            to_wallet_id=to_wallet.id,
+            amount=Decimal("100.00"),
+            idempotency_key=str(uuid.uuid4()),
+        )
+    ).transfer
+
+
+def partitions_of(transfer) -> set[str]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT tableoid::regclass::text FROM {PARTITIONED_TABLE} WHERE transfer_id = %s", [transfer.id]
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+@pytest.mark.django_db
+def test_transaction_table_is_partitioned(transfer):
+    partitions = {partition.name: partition for partition in list_partitions()}
+    assert partitions[f"{PARTITIONED_TABLE}_legacy"].lower is None
+    assert partitions[f"{PARTITIONED_TABLE}_default"].is_default
+    assert partitions_of(transfer) == {f"{PARTITIONED_TABLE}_legacy"}
+
+    # Партиции на ближайшие месяцы созданы миграцией
+    assert manage_partitions(months_ahead=1) == ([], [])
+
+
+@pytest.mark.django_db
+def test_new_partition_takes_rows_from_default(transfer):
+    Transaction.objects.filter(transfer=transfer).update(created_at=month_bound(FUTURE_MONTH))
+    assert partitions_of(transfer) == {f"{PARTITIONED_TABLE}_default"}
+
+    created, _ = manage_partitions(months_ahead=0, today=FUTURE_MONTH)
+    assert created == [partition_name(FUTURE_MONTH)]
+    assert partitions_of(transfer) == {partition_name(FUTURE_MONTH)}
+    assert Transaction.objects.filter(transfer=transfer).count() == 2
+
+
+@pytest.mark.django_db
+def test_date_filter_prunes_to_one_partition(wallets, transfer):
+    from_wallet, _ = wallets
+    manage_partitions(months_ahead=0, today=FUTURE_MONTH)
+
+    plan = Transaction.objects.filter(
+        wallet=from_wallet,
+        created_at__gte=month_bound(FUTURE_MONTH),
+        created_at__lt=month_bound(FUTURE_MONTH) + datetime.timedelta(days=1),
+    ).explain()
+    scanned = {partition.name for partition in list_partitions() if partition.name in plan}
+    assert scanned == {partition_name(FUTURE_MONTH)}
+
+
+@pytest.mark.django_db
+def test_detach_only_archived_partitions(transfer, tmp_path):
+    manage_partitions(months_ahead=0, today=FUTURE_MONTH)
+
+    # Проводки legacy ещё в БД: партиция не отсоединяется
+    _, detached = manage_partitions(months_ahead=0, retention_months=1, today=add_months(FUTURE_MONTH, 1))
+    assert f"{PARTITIONED_TABLE}_legacy" not in detached
+    assert Transaction.objects.filter(transfer=transfer).count() == 2
+
+    month = timezone.now().astimezone(datetime.UTC).date().replace(day=1)
+    with override_settings(ARCHIVE_ROOT=tmp_path):
+        assert archive_period(month_bound(month), month_bound(add_months(month, 1))).transactions == 2
+
+    _, detached = manage_partitions(months_ahead=0, retention_months=1, today=add_months(FUTURE_MONTH, 1))
+    assert f"{PARTITIONED_TABLE}_legacy" in detached
+    assert partition_name(FUTURE_MONTH) not in detached
+    assert f"{PARTITIONED_TABLE}_legacy" not in {partition.name for partition in list_partitions()}
+
+
+@pytest.mark.django_db
+def test_manage_partitions_command(db):
+    out = io.StringIO()
+    call_command("manage_partitions", "--months-ahead", "0", stdout=out)
+    assert f"{PARTITIONED_TABLE}_default: DEFAULT" in out.getvalue()
+    assert "Created=0 detached=0" in out.getvalue()
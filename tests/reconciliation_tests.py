@@ -0,0 +1,121 @@
+import io
+import uuid
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from django.db.models import F
+from django.test import override_settings
+
+from apps.transactions.models import LedgerTotal, ReconciliationDiscrepancy, ReconciliationRun, WalletBalance
+from apps.core.db import advisory_lock
+from apps.transactions.reconciliation import RECONCILIATION_LOCK, reconcile_ledger, wallet_chunks
+
+pytestmark = pytest.mark.usefixtures("no_safety_lag")
+
+
+@pytest.fixture
+def no_safety_lag():
+    # Движок plpgsql ставит проводкам время начала транзакции БД, в тесте оно раньше отметки прошлой сверки
+    with override_settings(RECONCILIATION_SAFETY_LAG=0, TRANSFER_ENGINE="orm"):
+        yield
+
+
+def test_wallet_chunks_cover_uuid_space():
+    chunks = wallet_chunks(4)
+    assert chunks[0][0] == uuid.UUID(int=0)
+    assert chunks[-1][1] is None
+    assert all(upper == lower for (_, upper), (lower, _) in zip(chunks, chunks[1:]))
+
+
+@pytest.mark.django_db
+def test_reconciliation_is_incremental(wallets, balances, make_transfer):
+    from_wallet, to_wallet = wallets
+    make_transfer("100.00")
+
+    # Первая сверка фиксирует начальные балансы, созданные мимо проводок
+    first = reconcile_ledger(workers=1, chunks=4)
+    assert first.status == ReconciliationRun.Status.succeeded
+    assert first.wallets_checked == 3
+    assert first.transactions_processed == 2
+    assert first.discrepancies_found == 0
+
+    make_transfer("1001.00")
+    second = reconcile_ledger(workers=1, chunks=4)
+    assert second.transactions_processed == 3
+    assert second.discrepancies_found == 0
+
+    third = reconcile_ledger(workers=1, chunks=4)
+    assert third.transactions_processed == 0
+    assert LedgerTotal.objects.get(wallet=to_wallet).total == Decimal("1101.00")
+
+
+@pytest.mark.django_db
+def test_reconciliation_finds_discrepancy(wallets, balances, make_transfer):
+    from_wallet, to_wallet = wallets
+    reconcile_ledger(workers=1)
+
+    make_transfer("100.00")
+    WalletBalance.objects.filter(wallet=to_wallet).update(balance=F("balance") + Decimal("5.00"))
+    run = reconcile_ledger(workers=1)
+
+    assert run.discrepancies_found == 1
+    discrepancy = ReconciliationDiscrepancy.objects.get(run=run)
+    assert discrepancy.wallet_id == to_wallet.id
+    assert discrepancy.balance - discrepancy.expected == Decimal("5.00")
+
+
+@pytest.mark.django_db
+def test_reconciliation_recent_rows_not_settled(wallets, balances, make_transfer):
+    from_wallet, to_wallet = wallets
+    reconcile_ledger(workers=1)
+
+    # Проводки внутри окна сравниваются, но в итог не попадают до следующей сверки
+    make_transfer("100.00")
+    with override_settings(RECONCILIATION_SAFETY_LAG=3600):
+        run = reconcile_ledger(workers=1)
+
+    assert run.discrepancies_found == 0
+    assert LedgerTotal.objects.get(wallet=to_wallet).total == Decimal("0.00")
+
+    assert reconcile_ledger(workers=1).transactions_processed == 2
+    assert LedgerTotal.objects.get(wallet=to_wallet).total == Decimal("100.00")
+
+
+@pytest.mark.django_db
+@override_settings(FEE_SHARDS=4)
+def test_reconciliation_pending_fee_shards(wallets, balances, make_transfer):
+    reconcile_ledger(workers=1)
+    make_transfer("2000.00")
+
+    run = reconcile_ledger(workers=1)
+    assert run.transactions_processed == 3
+    assert run.discrepancies_found == 0
+
+
+@pytest.mark.django_db
+def test_reconcile_ledger_command(balances):
+    stdout = io.StringIO()
+    call_command("reconcile_ledger", "--workers", "1", stdout=stdout)
+    assert "discrepancies=0" in stdout.getvalue()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_reconciliation_thread_pool_in_daemon(wallets, balances, make_transfer, monkeypatch):
+    # Как в воркере Celery: процессы запрещены, диапазоны обрабатываются потоками
+    monkeypatch.setattr("multiprocessing.current_process", lambda: type("Process", (), {"daemon": True})())
+    make_transfer("100.00")
+
+    run = reconcile_ledger(workers=3, chunks=6)
+    assert run.status == ReconciliationRun.Status.succeeded
+    assert run.wallets_checked == 3
+    assert run.transactions_processed == 2
+
+
+@pytest.mark.django_db
+def test_reconciliation_skipped_while_another_runs(balances):
+    with advisory_lock(RECONCILIATION_LOCK):
+        assert reconcile_ledger(workers=1, chunks=1) is None
+    assert not ReconciliationRun.objects.exists()
+
+    assert reconcile_ledger(workers=1, chunks=1).status == ReconciliationRun.Status.succeeded
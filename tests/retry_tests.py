@@ -0,0 +1,71 @@
+import uuid
+from decimal import Decimal
+
+import pytest
+
+from apps.transactions import services
+from apps.transactions.dto import TransferCreateCommand
+from apps.transactions.exceptions import VersionConflictException
+from apps.transactions.models import Transfer
+from apps.transactions.services import RetryPolicy, transfer_funds
+
+POLICY = RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.01, deadline=1.0)
+
+
+@pytest.fixture
+def flaky_transfer(monkeypatch):
+    """
+    Первые `conflicts` попыток падают с конфликтом версий, как при параллельном обновлении баланса
+    """
+
+    def _patch(conflicts: int):
+        calls = []
+        original = services._transfer_funds_once
+
+        def _once(transfer_command):
+            calls.append(transfer_command.idempotency_key)
+            if len(calls) <= conflicts:
+                raise VersionConflictException("Выполняется другая операция (версия)")
+            return original(transfer_command)
+
+        monkeypatch.setattr(services, "_transfer_funds_once", _once)
+        return calls
+
+    return _patch
+
+
+@pytest.mark.django_db
+def test_retry_resolves_version_conflict(wallets, balances, flaky_transfer):
+    from_wallet, to_wallet = wallets
+    calls = flaky_transfer(conflicts=2)
+
+    response = transfer_funds(
+        TransferCreateCommand(from_wallet_id=from_wallet.id, to_wallet_id=to_wallet.id, amount=Decimal("100.00")),
+        retry_policy=POLICY,
+    )
+
+    assert response.attempts == 3
+    assert Transfer.objects.count() == 1
+    # Сгенерированный ключ идемпотентности одинаковый во всех попытках
+    assert len(set(calls)) == 1
+    assert response.transfer.idempotency_key == calls[0]
+
+
+@pytest.mark.django_db
+def test_retry_gives_up_after_max_attempts(wallets, balances, flaky_transfer):
+    from_wallet, to_wallet = wallets
+    calls = flaky_transfer(conflicts=3)
+
+    with pytest.raises(VersionConflictException):
+        transfer_funds(
+            TransferCreateCommand(
+                from_wallet_id=from_wallet.id,
+                to_wallet_id=to_wallet.id,
+                amount=Decimal("100.00"),
+                idempotency_key=str(uuid.uuid4()),
+            ),
+            retry_policy=POLICY,
+        )
+
+    assert len(calls) == 3
+    assert not Transfer.objects.exists()
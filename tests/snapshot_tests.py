@@ -0,0 +1,128 @@
+import datetime
+import io
+import uuid
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.transactions.exceptions import WalletNotFoundException
+from apps.transactions.models import WalletBalanceSnapshot
+from apps.transactions.services import sweep_fee_shards
+from apps.transactions.snapshots import balance_as_of, snapshot_balances
+
+DAY_1 = datetime.date(2026, 1, 10)
+DAY_2 = datetime.date(2026, 1, 12)
+
+
+def at(day: datetime.date, hour: int) -> datetime.datetime:
+    return datetime.datetime.combine(day, datetime.time(hour), tzinfo=datetime.UTC)
+
+
+@pytest.fixture
+def history(make_transfer):
+    """
+    from_wallet: 5000.00 -> 4900.00 (DAY_1) -> 4700.00 (DAY_2) -> 4400.00 (сейчас)
+    """
+    make_transfer("100.00", at(DAY_1, 12))
+    make_transfer("200.00", at(DAY_2, 12))
+    make_transfer("300.00")
+
+
+def snapshot(wallet, day):
+    return WalletBalanceSnapshot.objects.get(wallet=wallet, day=day).balance
+
+
+@pytest.mark.django_db
+def test_snapshots_are_incremental(wallets, history):
+    from_wallet, to_wallet = wallets
+
+    # Первый снимок считается от текущего баланса назад
+    assert snapshot_balances(day=DAY_1) == {DAY_1: 2}
+    assert snapshot(from_wallet, DAY_1) == Decimal("4900.00")
+    assert snapshot(to_wallet, DAY_1) == Decimal("110.00")
+
+    # Дальше - от прошлого снимка, дни без проводок не пишутся
+    assert snapshot_balances(day=DAY_2 - datetime.timedelta(days=1)) == {DAY_2 - datetime.timedelta(days=1): 0}
+    snapshot_balances(day=DAY_2)
+    assert snapshot(from_wallet, DAY_2) == Decimal("4700.00")
+    assert snapshot(to_wallet, DAY_2) == Decimal("310.00")
+
+    # Повторный запуск перезаписывает день
+    snapshot_balances(day=DAY_2)
+    assert WalletBalanceSnapshot.objects.filter(day=DAY_2).count() == 2
+
+
+@pytest.mark.django_db
+def test_snapshot_balances_catches_up_to_closed_day(wallets, make_transfer):
+    from_wallet, _ = wallets
+    yesterday = timezone.now().astimezone(datetime.UTC).date() - datetime.timedelta(days=1)
+    make_transfer("100.00", at(yesterday, 0))
+
+    with override_settings(RECONCILIATION_SAFETY_LAG=0):
+        assert snapshot_balances() == {yesterday: 2}
+        assert snapshot_balances() == {}
+
+    assert snapshot(from_wallet, yesterday) == Decimal("4900.00")
+
+
+@pytest.mark.django_db
+def test_balance_as_of(wallets, history):
+    from_wallet, _ = wallets
+
+    def check():
+        assert balance_as_of(from_wallet.id, at(DAY_1, 11)) == Decimal("5000.00")
+        assert balance_as_of(from_wallet.id, at(DAY_1, 13)) == Decimal("4900.00")
+        assert balance_as_of(from_wallet.id, at(DAY_2, 11)) == Decimal("4900.00")
+        assert balance_as_of(from_wallet.id, at(DAY_2, 13)) == Decimal("4700.00")
+        assert balance_as_of(from_wallet.id, timezone.now()) == Decimal("4400.00")
+
+    # Без снимков - от текущего баланса, со снимками - от ближайшего снимка
+    check()
+    snapshot_balances(day=DAY_1)
+    snapshot_balances(day=DAY_2)
+    check()
+
+
+@pytest.mark.django_db
+def test_balance_as_of_admin_wallet_counts_pending_fee_shards(wallets, admin_wallet, make_transfer):
+    with override_settings(FEE_SHARDS=4):
+        make_transfer("2000.00", at(DAY_1, 12))
+        snapshot_balances(day=DAY_1)
+        assert snapshot(admin_wallet, DAY_1) == Decimal("200.00")
+
+        sweep_fee_shards()
+        assert balance_as_of(admin_wallet.id, at(DAY_1, 13)) == Decimal("200.00")
+
+
+@pytest.mark.django_db
+def test_balance_as_of_unknown_wallet(db):
+    with pytest.raises(WalletNotFoundException):
+        balance_as_of(uuid.uuid4(), timezone.now())
+
+
+@pytest.mark.django_db
+def test_wallet_balance_as_of_api(api_client, wallets, history, admin_wallet):
+    from_wallet, _ = wallets
+    url = reverse("transactions:wallet-balance", kwargs={"wallet_id": from_wallet.id})
+
+    response = api_client.get(url, {"as_of": at(DAY_2, 13).isoformat()})
+    assert response.status_code == 200, response.content
+    assert Decimal(response.json()["balance"]) == Decimal("4700.00")
+    assert "ETag" not in response.headers
+
+    assert api_client.get(url, {"as_of": "yesterday"}).status_code == 400
+    unknown = reverse("transactions:wallet-balance", kwargs={"wallet_id": uuid.uuid4()})
+    assert api_client.get(unknown, {"as_of": at(DAY_2, 13).isoformat()}).status_code == 404
+    admin = reverse("transactions:wallet-balance", kwargs={"wallet_id": admin_wallet.id})
+    assert api_client.get(admin, {"as_of": at(DAY_2, 13).isoformat()}).status_code == 404
+
+
+@pytest.mark.django_db
+def test_snapshot_balances_command(wallets, history):
+    out = io.StringIO()
+    call_command("snapshot_balances", "--day", DAY_1.isoformat(), stdout=out)
+    assert "snapshots=2" in out.getvalue()
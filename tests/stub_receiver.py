@@ -0,0 +1,76 @@
+import asyncio
+import collections
+import json
+import threading
+
+
+class StubReceiver:
+    """
+    Локальный HTTP-приёмник уведомлений для тестов: свой event loop в отдельном потоке.
+    Первые failures запросов по каждому переводу получают status, ответ задерживается на delay секунд.
+    """
+
+    def __init__(self, failures: int = 0, status: int = 503, delay: float = 0.0):
+        self.failures = failures
+        self.status = status
+        self.delay = delay
+        self.received = []
+        self.attempts = collections.Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}/notifications/"
+
+    def __enter__(self) -> "StubReceiver":
+        self.thread.start()
+        self.server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self.handle, "127.0.0.1", 0, backlog=4096), self.loop
+        ).result()
+        return self
+
+    def __exit__(self, *exc_info):
+        async def stop():
+            self.server.close()
+            await self.server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Клиент держит соединение (keep-alive), запросы читаются до его закрытия
+        try:
+            while request_line := await reader.readline():
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status = await self.respond(headers.get("idempotency-key"), body)
+                writer.write(f"HTTP/1.1 {status} Stub\r\ncontent-length: 0\r\n\r\n".encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, key: str, body: bytes) -> int:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+
+        self.attempts[key] += 1
+        if self.attempts[key] <= self.failures:
+            return self.status
+
+        self.received.append(json.loads(body))
+        return 200
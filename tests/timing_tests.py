@@ -0,0 +1,106 @@
+import logging
+import re
+
+import pytest
+from django.db import connection
+from django.test import override_settings
+from django.urls import reverse
+
+from apps.core.timing import current_timings, record_query
+
+VIEWS = ["transactions:transfer", "transactions:transfer-async"]
+
+
+@pytest.fixture
+def timing_records():
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger = logging.getLogger("timing")
+    logger.addHandler(handler)
+    yield records
+    logger.removeHandler(handler)
+
+
+def parse_server_timing(header: str) -> dict:
+    metrics = {}
+    for metric in header.split(", "):
+        name, *params = metric.split(";")
+        metrics[name] = dict(param.split("=", 1) for param in params)
+    return metrics
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("url_name", VIEWS)
+def test_server_timing_header_and_log_fields(url_name, post_transfer, wallets, balances, timing_records):
+    response = post_transfer(*wallets, "100.00", url_name=url_name)
+    assert response.status_code == 201, response.content
+
+    metrics = parse_server_timing(response["Server-Timing"])
+    assert list(metrics) == ["db", "db-slowest", "serializer", "service", "total"]
+    queries = int(re.fullmatch(r'"(\d+) queries"', metrics["db"]["desc"])[1])
+    assert queries > 0
+    assert 0 < float(metrics["service"]["dur"]) <= float(metrics["total"]["dur"])
+    assert float(metrics["serializer"]["dur"]) > 0
+    assert float(metrics["db-slowest"]["dur"]) <= float(metrics["db"]["dur"])
+
+    (record,) = timing_records
+    assert record.levelno == logging.INFO
+    assert (record.method, record.path, record.status, record.db_queries) == ("POST", reverse(url_name), 201, queries)
+    assert f"db_queries={queries}" in record.getMessage()
+
+
+@pytest.mark.django_db
+@override_settings(SLOW_REQUEST_THRESHOLD=0, SLOW_REQUEST_MAX_QUERIES=1, SERVER_TIMING_HEADER=False)
+def test_slow_request_logs_queries(post_transfer, wallets, balances, timing_records):
+    response = post_transfer(*wallets, "100.00")
+    assert response.status_code == 201
+    assert "Server-Timing" not in response
+
+    slow = [record for record in timing_records if record.levelno == logging.WARNING]
+    assert len(slow) == 1
+    message = slow[0].getMessage()
+    assert message.startswith("Медленный запрос POST /api/transfer/")
+    # Первый запрос списком, остальные - числом
+    assert len(re.findall(r"^\s+[\d.]+ ms  ", message, flags=re.M)) == 1
+    assert f"ещё {slow[0].db_queries - 1} запросов" in message
+    assert slow[0].slowest_sql
+
+
+@pytest.mark.django_db
+def test_streaming_statement_logged_on_close(client, wallets, balances, timing_records):
+    from_wallet, _ = wallets
+    response = client.get(
+        reverse("transactions:wallet-statement", args=[from_wallet.id]),
+        {"date_from": "2024-01-01", "date_to": "2100-01-01"},
+    )
+    assert response.status_code == 200
+    # Заголовки уже отданы, тело ещё не читалось
+    assert "Server-Timing" not in response
+    assert timing_records == []
+
+    content = b"".join(response.streaming_content)
+    response.close()
+    assert content
+    assert current_timings() is None
+
+    (record,) = timing_records
+    assert (record.method, record.status) == ("GET", 200)
+    # Запросы выписки выполняются во время стрима, после выхода из middleware
+    assert record.db_queries > 2
+    assert record.total_ms >= record.db_ms
+
+
+@pytest.mark.django_db
+def test_query_timer_outlives_execute_wrapper():
+    connection.ensure_connection()
+    assert connection.execute_wrappers[0] is record_query
+
+    executed = []
+    with connection.execute_wrapper(lambda execute, *args: executed.append(args[0]) or execute(*args)):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+
+    # Вне запроса обёртка ничего не записывает и не снимается чужим execute_wrapper()
+    assert executed == ["SELECT 1"]
+    assert connection.execute_wrappers == [record_query]
@@ -0,0 +1,42 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+from django.conf import settings
+from django.db.models import Sum
+
+from apps.transactions.models import Transfer, WalletBalance
+from benchmarks.transfer_service import SCENARIOS, check_thresholds, create_wallets, run_benchmark, scenario_thresholds
+
+RESULTS_FILE = Path(os.environ.get("BENCHMARK_RESULTS", settings.BASE_DIR / "benchmark-results.json"))
+
+
+@pytest.fixture(scope="session")
+def benchmark_results():
+    """
+    Отчёты всех сценариев; в конце сессии дописываются в RESULTS_FILE под ключом движка переводов
+    """
+    results = {}
+    yield results
+    if results:
+        stored = json.loads(RESULTS_FILE.read_text()) if RESULTS_FILE.exists() else {}
+        stored[settings.TRANSFER_ENGINE] = {**stored.get(settings.TRANSFER_ENGINE, {}), **results}
+        RESULTS_FILE.write_text(json.dumps(stored, indent=2))
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize("scenario", list(SCENARIOS))
+def test_transfer_service_benchmark(scenario, benchmark_results):
+    config = SCENARIOS[scenario]
+    wallets = create_wallets(config.wallets)
+    total_before = WalletBalance.objects.aggregate(total=Sum("balance"))["total"]
+
+    report = run_benchmark(config, wallets)
+    benchmark_results[scenario] = report
+
+    # Деньги не теряются и не появляются при любой конкуренции
+    assert WalletBalance.objects.aggregate(total=Sum("balance"))["total"] == total_before
+    assert Transfer.objects.count() == report["outcomes"].get("ok", 0)
+    assert check_thresholds(report, scenario_thresholds(scenario, settings.TRANSFER_ENGINE)) == []
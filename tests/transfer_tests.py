@@ -118,3 +118,26 @@ def test_transfer_not_enough_minerals(api_client, wallets, balances, set_balance
     assert to_balance.balance == before_balance
     assert Transfer.objects.count() == 0
     assert not Transaction.objects.exists()
+
+
+@pytest.mark.django_db
+def test_transfer_unknown_wallet(api_client, wallets, balances, django_assert_max_num_queries):
+    from_wallet, to_wallet = wallets
+    unknown = uuid.uuid4()
+
+    # Админский кошелёк, advisory-блокировка, балансы и savepoint-ы атомарного блока
+    with django_assert_max_num_queries(6):
+        response = api_client.post(
+            reverse("transactions:transfer"),
+            data={
+                "from_wallet": from_wallet.id,
+                "to_wallet": unknown,
+                "amount": "10.00",
+            },
+            format="json",
+            HTTP_IDEMPOTENCY_KEY=str(uuid.uuid4()),
+        )
+
+    assert response.status_code == 400, response.content
+    assert "to_wallet" in response.json()
+    assert not Transfer.objects.exists()